@@ -5,12 +5,17 @@
 Flask application factory.
 """
 from flask import Flask
+import os
 from mlProject.components.model_service import ModelService
+from services.batching import PredictionBatcher
 import logging
 
 # Initialize model service (singleton)
 model_service = ModelService()
 
+# Coalesces concurrent /api/predict requests when PREDICT_BATCHING is set
+prediction_batcher = PredictionBatcher(model_service)
+
 def create_app():
     """Create and configure Flask app."""
     app = Flask(__name__, 
@@ -18,7 +23,9 @@ def create_app():
                 static_folder='../static')
     
     app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # Uploads are streamed in chunks (see /api/bulk-predict?stream=1), so the
+    # limit only guards disk usage of the spooled upload
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 512)) * 1024 * 1024
     
     # Configure logging
     logging.basicConfig(level=logging.INFO)
@@ -31,10 +38,19 @@ def create_app():
         logging.warning(f"Could not load models on startup: {e}")
         logging.warning("Models will be loaded on first prediction request.")
     
-    # Initialize database
+    # Initialize database (engine selected by config.py via FLASK_ENV)
     from database.database.models import init_database
+    from database.database.storage import get_storage
+    app.config['STORAGE_ENGINE'] = get_storage().name
     init_database()
-    logging.info("Database initialized successfully!")
+    logging.info(f"Database initialized successfully! ({app.config['STORAGE_ENGINE']})")
+    
+    # Resume bulk jobs left queued or interrupted by a restart
+    try:
+        from services.jobs import get_job_manager
+        get_job_manager().recover()
+    except Exception as e:
+        logging.warning(f"Could not recover bulk jobs: {e}")
     
     # Register blueprints
     from backend.routes_pages import pages_bp
@@ -4,66 +4,48 @@
 """
 API routes - JSON endpoints for frontend.
 """
-from flask import Blueprint, request, jsonify, send_file
-from backend import model_service
-import pandas as pd
+from flask import Blueprint, request, jsonify, send_file, Response
+from backend import model_service, prediction_batcher
 import numpy as np
+import pandas as pd
 from mlProject.constants import DATA_INGESTION_DIR
 import os
 import logging
+import itertools
+import tempfile
 import io
 
 api_bp = Blueprint('api', __name__)
 
+# Largest upload answered as one JSON document; bigger files must use ?stream=1
+BULK_JSON_MAX_BYTES = 16 * 1024 * 1024
+
+# Largest number of bookings scored by one /api/predict/batch call
+PREDICT_BATCH_MAX_BOOKINGS = int(os.environ.get('PREDICT_BATCH_MAX_BOOKINGS', 10000))
+
+# Largest ?top_n of the network and risk matrix widgets (top_n x top_n cells)
+MATRIX_MAX_TOP_N = 100
+
+# /api/predict/batch response encodings (?format= or the Accept header)
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+BATCH_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'arrow': ARROW_MIMETYPE
+}
+
 
 @api_bp.route('/stats/overview', methods=['GET'])
 def get_overview_stats():
     """Get overview KPIs - now reads from bookings_scored."""
     try:
-        from database.database.models import query_scored_bookings
-        
-        # Get filters from query params
-        filters = {}
-        if request.args.get('start_date'):
-            filters['start_date'] = request.args.get('start_date')
-        if request.args.get('end_date'):
-            filters['end_date'] = request.args.get('end_date')
-        if request.args.get('lane'):
-            filters['lane'] = request.args.get('lane')
-        if request.args.get('pol'):
-            filters['pol'] = request.args.get('pol')
-        if request.args.get('month'):
-            filters['month'] = request.args.get('month')
-        if request.args.get('year'):
-            filters['year'] = request.args.get('year')
-        
-        # Query from database
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0:
-            return jsonify({
-                'total_bookings': 0,
-                'cancel_rate': 0,
-                'broken_rate': 0,
-                'unique_lanes': 0,
-                'unique_ports': 0
-            })
-        
-        # Count distinct booking_ids to avoid duplicates
-        if 'booking_id' in df.columns:
-            total_bookings = int(df['booking_id'].nunique())
-        else:
-            total_bookings = int(len(df))
-        
-        stats = {
-            'total_bookings': total_bookings,
-            'cancel_rate': float(df['cancel_probability'].mean() * 100) if 'cancel_probability' in df.columns else 0,
-            'broken_rate': float(df['broken_route_probability'].mean() * 100) if 'broken_route_probability' in df.columns else 0,
-            'unique_lanes': int(df['lane'].nunique()) if 'lane' in df.columns else 0,
-            'unique_ports': int(df['pol'].nunique()) if 'pol' in df.columns else 0
-        }
-        
+        from services.analytics import AnalyticsService
+        analytics = AnalyticsService()
+        filters = _get_filters_from_request()
+        stats = analytics.get_overview_stats(filters)
         return jsonify(stats)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting overview stats: {e}")
         return jsonify({'error': str(e)}), 500
@@ -73,59 +55,13 @@ def get_overview_stats():
 def get_chart_data():
     """Get aggregated data for charts - now reads from bookings_scored."""
     try:
-        from database.database.models import query_scored_bookings
-        
-        # Get filters from query params
-        filters = {}
-        if request.args.get('start_date'):
-            filters['start_date'] = request.args.get('start_date')
-        if request.args.get('end_date'):
-            filters['end_date'] = request.args.get('end_date')
-        if request.args.get('lane'):
-            filters['lane'] = request.args.get('lane')
-        if request.args.get('pol'):
-            filters['pol'] = request.args.get('pol')
-        if request.args.get('month'):
-            filters['month'] = request.args.get('month')
-        if request.args.get('year'):
-            filters['year'] = request.args.get('year')
-        
-        # Query from database
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0:
-            return jsonify({
-                'cancel_by_lane': {'labels': [], 'values': []},
-                'cancel_by_port': {'labels': [], 'values': []},
-                'bookings_over_time': {}
-            })
-        
-        # Cancellations by lane
-        cancel_by_lane = df.groupby('lane')['cancel_probability'].mean().sort_values(ascending=False).head(10)
-        
-        # Cancellations by port
-        cancel_by_port = df.groupby('pol')['cancel_probability'].mean().sort_values(ascending=False).head(10)
-        
-        # Bookings over time (if booking_date exists)
-        bookings_over_time = {}
-        if 'booking_date' in df.columns:
-            df['booking_date'] = pd.to_datetime(df['booking_date'], errors='coerce')
-            df['month'] = df['booking_date'].dt.to_period('M').astype(str)
-            bookings_over_time = df.groupby('month').size().to_dict()
-        
-        data = {
-            'cancel_by_lane': {
-                'labels': cancel_by_lane.index.tolist(),
-                'values': [float(v) * 100 for v in cancel_by_lane.values]
-            },
-            'cancel_by_port': {
-                'labels': cancel_by_port.index.tolist(),
-                'values': [float(v) * 100 for v in cancel_by_port.values]
-            },
-            'bookings_over_time': bookings_over_time
-        }
-        
+        from services.analytics import AnalyticsService
+        analytics = AnalyticsService()
+        filters = _get_filters_from_request()
+        data = analytics.get_chart_data(filters)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting chart data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -137,21 +73,132 @@ def predict_single():
     try:
         data = request.json
         
-        # Convert to DataFrame
-        df = pd.DataFrame([data])
+        # Single bookings skip pandas via the compiled scorer; with
+        # PREDICT_BATCHING concurrent requests are scored together
+        return jsonify(prediction_batcher.predict(data))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except TimeoutError:
+        logging.error("Prediction batch timed out")
+        return jsonify({'error': 'Prediction timed out'}), 503
+    except Exception as e:
+        logging.error(f"Error in prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Score up to PREDICT_BATCH_MAX_BOOKINGS bookings in one vectorized call.
+    Accepts a JSON list of bookings, a JSON {column: [values]} object or an
+    Arrow IPC stream; answers with columnar arrays as JSON, NDJSON rows
+    (?format=ndjson) or an Arrow IPC stream (?format=arrow).
+    """
+    try:
+        fmt = request.args.get('format') or next(
+            name for name, mimetype in BATCH_FORMATS.items()
+            if mimetype == request.accept_mimetypes.best_match(list(BATCH_FORMATS.values()), 'application/json')
+        )
+        if fmt not in BATCH_FORMATS:
+            raise ValueError(f"Unknown format: {fmt} (choose from {', '.join(BATCH_FORMATS)})")
         
-        # Get predictions
-        predictions = model_service.predict_all(df)
+        # Arrow is optional: refuse before scoring rather than fail after it
+        if fmt == 'arrow' and _import_pyarrow() is None:
+            return jsonify({'error': "format=arrow is not available (pyarrow is not installed), use json or ndjson"}), 406
+        if request.mimetype == ARROW_MIMETYPE and _import_pyarrow() is None:
+            return jsonify({'error': "Arrow request bodies are not accepted (pyarrow is not installed), send JSON"}), 415
         
-        return jsonify(predictions[0])
+        df = _batch_request_frame()
+        scores = pd.DataFrame(model_service.predict_frame(df))
+        return _batch_response(scores, fmt)
+    except _BatchTooLarge:
+        return jsonify({'error': f'At most {PREDICT_BATCH_MAX_BOOKINGS} bookings per call, use /api/bulk-predict'}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logging.error(f"Error in prediction: {e}")
+        logging.error(f"Error in batch prediction: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+class _BatchTooLarge(Exception):
+    """A /predict/batch body with more than PREDICT_BATCH_MAX_BOOKINGS bookings."""
+
+
+def _import_pyarrow():
+    """The pyarrow module, or None when it is not installed."""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _check_batch_size(n_bookings):
+    # Checked on the decoded body, before any DataFrame is built
+    if n_bookings > PREDICT_BATCH_MAX_BOOKINGS:
+        raise _BatchTooLarge()
+
+
+def _batch_request_frame():
+    """Bookings of a /predict/batch body as a DataFrame."""
+    if request.mimetype == ARROW_MIMETYPE:
+        pa = _import_pyarrow()
+        if pa is None:
+            raise ImportError("Arrow request bodies require the 'pyarrow' package")
+        table = pa.ipc.open_stream(request.get_data()).read_all()
+        _check_batch_size(table.num_rows)
+        # Dictionary columns would become Categoricals, which fillna('unknown') rejects
+        for i, field in enumerate(table.schema):
+            if pa.types.is_dictionary(field.type):
+                table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+        df = table.to_pandas()
+    else:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict) and isinstance(payload.get('records'), list):
+            payload = payload['records']
+        if isinstance(payload, list) and all(isinstance(record, dict) for record in payload):
+            _check_batch_size(len(payload))
+            df = pd.DataFrame(payload)
+        elif isinstance(payload, dict) and payload and all(isinstance(values, list) for values in payload.values()):
+            lengths = {column: len(values) for column, values in payload.items()}
+            _check_batch_size(max(lengths.values()))
+            if len(set(lengths.values())) > 1:
+                raise ValueError(f"Columns must all have the same length, got {lengths}")
+            df = pd.DataFrame(payload)
+        else:
+            raise ValueError("Expected a list of bookings or a {column: [values]} object")
+    
+    if df.empty:
+        raise ValueError("No bookings to score")
+    return df
+
+
+def _batch_response(scores, fmt):
+    """Encode the score columns in the requested format, in input row order."""
+    if fmt == 'ndjson':
+        return Response(
+            scores.to_json(orient='records', lines=True, double_precision=15),
+            mimetype=BATCH_FORMATS[fmt]
+        )
+    if fmt == 'arrow':
+        pa = _import_pyarrow()
+        if pa is None:
+            raise ImportError("Arrow responses require the 'pyarrow' package")
+        # Risk labels travel as dictionary-encoded columns
+        table = pa.Table.from_pandas(scores, preserve_index=False).replace_schema_metadata(None)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), mimetype=BATCH_FORMATS[fmt])
+    return jsonify({column: scores[column].tolist() for column in scores.columns})
+
+
 @api_bp.route('/bulk-predict', methods=['POST'])
 def predict_bulk():
-    """Predict for bulk CSV upload."""
+    """
+    Predict for bulk CSV upload.
+    ?stream=1 streams the enriched CSV back; ?async=1 queues a background job.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -160,6 +207,22 @@ def predict_bulk():
         if file.filename == '':
             return jsonify({'error': 'Empty filename'}), 400
         
+        if request.args.get('async') in ('1', 'true'):
+            from services.jobs import get_job_manager
+            job_id = get_job_manager().submit(file)
+            return jsonify({
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/jobs/{job_id}',
+                'download_url': f'/api/jobs/{job_id}/download'
+            }), 202
+        
+        if request.args.get('stream') in ('1', 'true'):
+            return _stream_bulk_predictions(file)
+        
+        if request.content_length and request.content_length > BULK_JSON_MAX_BYTES:
+            return jsonify({'error': 'File too large for a JSON response, use /api/bulk-predict?stream=1'}), 413
+        
         # Use unified ingestion service
         from services.ingestion import DataIngestionService
         from core.predictor import UnifiedPredictor
@@ -174,9 +237,9 @@ def predict_bulk():
         # Generate predictions
         df_enriched = predictor.predict_bookings(df)
         
-        # Save to database
-        insert_scored_bookings(df_enriched)
-        logging.info(f"Saved {len(df_enriched)} scored bookings to database")
+        # Save to database (bookings already stored are skipped)
+        saved = insert_scored_bookings(df_enriched)
+        logging.info(f"Saved {saved} scored bookings to database")
         
         # Convert to CSV
         output = io.StringIO()
@@ -189,6 +252,8 @@ def predict_bulk():
         return jsonify({
             'preview': preview,
             'total_records': len(df_enriched),
+            'saved_records': saved,
+            'skipped_duplicates': len(df_enriched) - saved,
             'csv_data': output.getvalue()
         })
     except Exception as e:
@@ -196,6 +261,102 @@ def predict_bulk():
         return jsonify({'error': str(e)}), 500
 
 
+def _stream_bulk_predictions(file):
+    """Ingest, score and store the upload chunk by chunk, streaming CSV back."""
+    from services.ingestion import DataIngestionService
+    from core.predictor import UnifiedPredictor
+    from database.database.models import insert_scored_bookings
+    
+    # Spool the upload to disk: the request's file object is closed before a
+    # streamed response finishes, and the temp file is read in bounded chunks
+    ext = os.path.splitext(file.filename)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+        file.save(tmp)
+    
+    ingestion_service = DataIngestionService()
+    predictor = UnifiedPredictor()
+    chunks = ingestion_service.iter_chunks(tmp.name)
+    
+    try:
+        # Read the first chunk eagerly so bad files still get a JSON error
+        first_chunk = next(chunks)
+    except Exception:
+        os.remove(tmp.name)
+        raise
+    
+    def generate():
+        total = 0
+        saved = 0
+        try:
+            for i, chunk in enumerate(itertools.chain([first_chunk], chunks)):
+                df_enriched = predictor.predict_bookings(chunk)
+                saved += insert_scored_bookings(df_enriched)
+                total += len(df_enriched)
+                yield df_enriched.to_csv(index=False, header=(i == 0))
+            logging.info(f"Saved {saved} of {total} scored bookings to database (streamed)")
+        finally:
+            os.remove(tmp.name)
+    
+    filename = os.path.splitext(file.filename)[0] + '_predictions.csv'
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get progress of an asynchronous bulk job."""
+    try:
+        from services.jobs import get_job_manager
+        status = get_job_manager().status(job_id)
+        if status is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        return jsonify(status)
+    except Exception as e:
+        logging.error(f"Error getting job status: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/jobs/<job_id>/download', methods=['GET'])
+def download_job_output(job_id):
+    """Download the enriched CSV of a completed bulk job."""
+    try:
+        from services.jobs import get_job_manager
+        from database.database.models import get_bulk_job
+        job = get_bulk_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        
+        path = get_job_manager().output_path(job_id)
+        if path is None:
+            return jsonify({'error': f"Job is {job['status']}"}), 409
+        
+        filename = os.path.splitext(job['filename'])[0] + '_predictions.csv'
+        return send_file(os.path.abspath(path), mimetype='text/csv',
+                         as_attachment=True, download_name=filename)
+    except Exception as e:
+        logging.error(f"Error downloading job output: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+def _int_arg(name, default=None, minimum=None, maximum=None):
+    """Integer query parameter; ValueError naming the parameter if it is malformed or out of range."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+    if maximum is None and minimum is not None and number < minimum:
+        raise ValueError(f"Invalid {name}: {value} (must be at least {minimum})")
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise ValueError(f"Invalid {name}: {value} (must be between {minimum} and {maximum})")
+    return number
+
+
 def _get_filters_from_request():
     """Helper to extract filters from request."""
     filters = {}
@@ -209,10 +370,12 @@ def _get_filters_from_request():
         filters['pol'] = request.args.get('pol')
     if request.args.get('pod'):
         filters['pod'] = request.args.get('pod')
-    if request.args.get('month'):
-        filters['month'] = request.args.get('month')
-    if request.args.get('year'):
-        filters['year'] = request.args.get('year')
+    month = _int_arg('month', minimum=1, maximum=12)
+    if month is not None:
+        filters['month'] = month
+    year = _int_arg('year', minimum=1, maximum=9999)
+    if year is not None:
+        filters['year'] = year
     return filters
 
 
@@ -225,11 +388,30 @@ def get_dashboard_summary():
         filters = _get_filters_from_request()
         summary = analytics.get_dashboard_summary(filters)
         return jsonify(summary)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting dashboard summary: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/dashboard-bundle', methods=['GET'])
+def get_dashboard_bundle():
+    """Get several dashboard widgets from a single query (?widgets=summary,flow,...)."""
+    try:
+        from services.analytics import AnalyticsService
+        analytics = AnalyticsService()
+        filters = _get_filters_from_request()
+        widgets = [w for w in request.args.get('widgets', '').split(',') if w]
+        data = analytics.compute_all(filters, widgets)
+        return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error getting dashboard bundle: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @api_bp.route('/bookings-over-time', methods=['GET'])
 def get_bookings_over_time():
     """Get bookings over time data."""
@@ -238,8 +420,11 @@ def get_bookings_over_time():
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
         freq = request.args.get('freq', 'D')
-        data = analytics.get_bookings_over_time(filters, freq)
+        max_points = _int_arg('max_points', analytics.MAX_SERIES_POINTS, minimum=3)
+        data = analytics.get_bookings_over_time(filters, freq, max_points)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting bookings over time: {e}")
         return jsonify({'error': str(e)}), 500
@@ -252,9 +437,11 @@ def get_cancellations_by_port():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        top_n = int(request.args.get('top_n', 10))
+        top_n = _int_arg('top_n', 10, minimum=1)
         data = analytics.get_cancellations_by_port(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting cancellations by port: {e}")
         return jsonify({'error': str(e)}), 500
@@ -267,9 +454,11 @@ def get_cancellations_by_lane():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        top_n = int(request.args.get('top_n', 10))
+        top_n = _int_arg('top_n', 10, minimum=1)
         data = analytics.get_cancellations_by_lane(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting cancellations by lane: {e}")
         return jsonify({'error': str(e)}), 500
@@ -284,6 +473,8 @@ def get_risk_distribution():
         filters = _get_filters_from_request()
         data = analytics.get_risk_distribution(filters)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting risk distribution: {e}")
         return jsonify({'error': str(e)}), 500
@@ -298,6 +489,8 @@ def get_flow_data():
         filters = _get_filters_from_request()
         data = analytics.get_flow_data(filters)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting flow data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -312,6 +505,8 @@ def get_seasonality_data():
         filters = _get_filters_from_request()
         data = analytics.get_seasonality_data(filters)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting seasonality data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -324,8 +519,11 @@ def get_network_data():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        data = analytics.get_network_data(filters)
+        top_n = _int_arg('top_n', 10, minimum=1, maximum=MATRIX_MAX_TOP_N)
+        data = analytics.get_network_data(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting network data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -335,14 +533,58 @@ def get_network_data():
 def get_filter_options():
     """Get available filter options."""
     try:
-        from database.database.models import get_filter_options
-        options = get_filter_options()
+        from services.analytics import AnalyticsService
+        analytics = AnalyticsService()
+        options = analytics.get_filter_options()
         return jsonify(options)
     except Exception as e:
         logging.error(f"Error getting filter options: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Get analytics cache hit/miss/eviction counters."""
+    try:
+        from services.cache import analytics_cache
+        return jsonify(analytics_cache.stats())
+    except Exception as e:
+        logging.error(f"Error getting cache stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/predict-batching-stats', methods=['GET'])
+def get_predict_batching_stats():
+    """Get /api/predict batch size distribution and queue wait counters."""
+    try:
+        return jsonify(prediction_batcher.stats())
+    except Exception as e:
+        logging.error(f"Error getting batching stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/prediction-cache-stats', methods=['GET'])
+def get_prediction_cache_stats():
+    """Get prediction cache hit/miss/eviction counters."""
+    try:
+        from mlProject.components.prediction_cache import prediction_cache
+        return jsonify(prediction_cache.stats())
+    except Exception as e:
+        logging.error(f"Error getting prediction cache stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/db-pool-stats', methods=['GET'])
+def get_db_pool_stats():
+    """Get database connection pool checkout/wait counters."""
+    try:
+        from database.database.connection import pool_stats
+        return jsonify(pool_stats())
+    except Exception as e:
+        logging.error(f"Error getting pool stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @api_bp.route('/top-outliers', methods=['GET'])
 def get_top_outliers():
     """Get top risky bookings."""
@@ -350,9 +592,11 @@ def get_top_outliers():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        top_n = int(request.args.get('top_n', 10))
+        top_n = _int_arg('top_n', 10, minimum=1)
         data = analytics.get_top_risky_bookings(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting top outliers: {e}")
         return jsonify({'error': str(e)}), 500
@@ -365,8 +609,11 @@ def get_risk_matrix():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        data = analytics.get_risk_matrix_heatmap(filters)
+        top_n = _int_arg('top_n', 10, minimum=1, maximum=MATRIX_MAX_TOP_N)
+        data = analytics.get_risk_matrix_heatmap(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting risk matrix: {e}")
         return jsonify({'error': str(e)}), 500
@@ -381,6 +628,8 @@ def get_ridgeline_data():
         filters = _get_filters_from_request()
         data = analytics.get_ridgeline_data(filters)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting ridgeline data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -393,8 +642,11 @@ def get_stacked_area_data():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        data = analytics.get_stacked_area_data(filters)
+        bucket = request.args.get('bucket', 'auto')
+        data = analytics.get_stacked_area_data(filters, bucket)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting stacked area data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -409,6 +661,8 @@ def get_waffle_data():
         filters = _get_filters_from_request()
         data = analytics.get_waffle_data(filters)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting waffle data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -421,9 +675,11 @@ def get_top_risky_lanes():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        top_n = int(request.args.get('top_n', 5))
+        top_n = _int_arg('top_n', 5, minimum=1)
         data = analytics.get_top_risky_lanes(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting top risky lanes: {e}")
         return jsonify({'error': str(e)}), 500
@@ -436,9 +692,11 @@ def get_top_risky_ports():
         from services.analytics import AnalyticsService
         analytics = AnalyticsService()
         filters = _get_filters_from_request()
-        top_n = int(request.args.get('top_n', 5))
+        top_n = _int_arg('top_n', 5, minimum=1)
         data = analytics.get_top_risky_ports(filters, top_n)
         return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting top risky ports: {e}")
         return jsonify({'error': str(e)}), 500
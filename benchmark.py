@@ -0,0 +1,381 @@
+# ============================================================================
+# FILE: benchmark.py
+# ============================================================================
+"""
+Performance benchmarks for the ML and data paths.
+
+Usage:
+    python benchmark.py encoding    # dense vs sparse one-hot encoding
+    python benchmark.py insert      # to_sql vs executemany upsert writer
+    python benchmark.py matrix      # per-cell masks vs grouped pivot for network/risk matrix
+    python benchmark.py widgets     # per-cell loops vs pivots for stacked area and flow
+    python benchmark.py dimensions  # TEXT vs dictionary-encoded dimension columns
+    python benchmark.py predict     # sklearn vs compiled NumPy scorer for small batches
+    python benchmark.py batching    # concurrent /api/predict calls with and without coalescing
+    python benchmark.py batch_api   # /api/predict/batch payload formats vs one /api/predict per booking
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from fixtures import (
+    legacy_flow, legacy_insert, legacy_network_data, legacy_risk_matrix, legacy_scored_table,
+    legacy_stacked_area, link_totals, scored_bookings, synthetic_bookings
+)
+
+
+def _timed(func, repeat=3):
+    """Best wall time of func() over repeat runs, plus its last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _matrix_bytes(X):
+    if sparse.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+
+def benchmark_encoding(n_rows=50000, cardinalities=(10, 100, 1000, 5000), dense_limit_mb=1024):
+    """Memory and latency of dense vs sparse one-hot encoding at several cardinalities."""
+    from sklearn.linear_model import LogisticRegression
+    from mlProject.components.data_transformation import build_preprocessor
+    from mlProject.components.model_service import ModelService
+    from mlProject.constants import CATEGORICAL_FEATURES, NUMERICAL_FEATURES
+    
+    print(f"\nOne-hot encoding, {n_rows} rows")
+    print(f"{'cardinality':>11} {'mode':>6} {'columns':>8} {'matrix MB':>10} {'transform ms':>13} {'predict ms':>11}")
+    
+    service = ModelService()
+    for cardinality in cardinalities:
+        df = service.engineer_features(synthetic_bookings(n_rows, cardinality))
+        X_raw = df[CATEGORICAL_FEATURES + NUMERICAL_FEATURES]
+        y = np.random.default_rng(0).integers(0, 2, n_rows)
+        
+        columns = None
+        for mode, sparse_output in (('sparse', True), ('dense', False)):
+            # Fitting densely already materializes the matrix, so check the
+            # column count from the sparse run first
+            if not sparse_output and n_rows * columns * 8 / 1e6 > dense_limit_mb:
+                print(f"{cardinality:>11} {mode:>6} {columns:>8} {n_rows * columns * 8 / 1e6:>10.1f} "
+                      f"{'skipped (over dense_limit_mb)':>25}")
+                continue
+            
+            preprocessor = build_preprocessor(CATEGORICAL_FEATURES, NUMERICAL_FEATURES, sparse_output=sparse_output)
+            preprocessor.fit(X_raw)
+            columns = len(preprocessor.get_feature_names_out())
+            
+            transform_time, X = _timed(lambda: preprocessor.transform(X_raw))
+            model = LogisticRegression(max_iter=100).fit(X, y)
+            predict_time, _ = _timed(lambda: model.predict_proba(X))
+            
+            print(f"{cardinality:>11} {mode:>6} {columns:>8} {_matrix_bytes(X) / 1e6:>10.1f} "
+                  f"{transform_time * 1000:>13.1f} {predict_time * 1000:>11.1f}")
+
+
+def benchmark_insert(row_counts=(10000, 100000, 500000)):
+    """Rows/sec of the to_sql writer vs the executemany upsert writer on a fresh database."""
+    from database.database import models
+    from database.database.storage import configure_storage
+    
+    print("\nScored booking inserts (SQLite)")
+    print(f"{'rows':>8} {'writer':>22} {'seconds':>8} {'rows/sec':>10}")
+    
+    try:
+        for n_rows in row_counts:
+            df = scored_bookings(n_rows)
+            with tempfile.TemporaryDirectory() as tmp:
+                paths = {name: os.path.join(tmp, f'{name}.db') for name in ('legacy', 'fast')}
+                # Each writer gets its own database; the re-insert cases run
+                # against the rows that writer has just stored
+                cases = (
+                    ('to_sql', 'legacy', lambda: legacy_insert(df, sqlite3.connect(paths['legacy']))),
+                    ('executemany', 'fast', lambda: models.insertscored_bookings(df)),
+                    ('to_sql skip existing', 'legacy', lambda: legacy_insert(df, sqlite3.connect(paths['legacy']), True)),
+                    ('executemany skip', 'fast', lambda: models.insertscored_bookings(df)),
+                    ('executemany upsert', 'fast', lambda: models.insertscored_bookings(df, replace_duplicates=True)),
+                )
+                for writer, db_name, insert in cases:
+                    storage = configure_storage('sqlite', path=paths[db_name])
+                    if db_name == 'legacy':
+                        legacy_scored_table(paths[db_name])
+                    else:
+                        models.init_database()
+                    elapsed, _ = _timed(insert, repeat=1)
+                    print(f"{n_rows:>8} {writer:>22} {elapsed:>8.2f} {n_rows / elapsed:>10.0f}")
+                    storage.pool.close()
+    finally:
+        configure_storage()
+
+
+def benchmark_matrix(row_counts=(10000, 100000, 1000000), top_ns=(10, 20)):
+    """Latency of the network and risk matrix widgets as rows and top_n grow."""
+    from services.analytics import AnalyticsService
+    
+    service = AnalyticsService()
+    widgets = (
+        ('network', legacy_network_data, service._network_data),
+        ('risk_matrix', legacy_risk_matrix, service._risk_matrix_heatmap),
+    )
+    
+    print("\nNetwork / risk matrix widgets (pandas frame path)")
+    print(f"{'rows':>8} {'top_n':>6} {'widget':>12} {'per-cell ms':>12} {'pivot ms':>9} {'speedup':>8}")
+    for n_rows in row_counts:
+        df = scored_bookings(n_rows)
+        for top_n in top_ns:
+            for name, legacy, pivot in widgets:
+                legacy_time, expected = _timed(lambda: legacy(df, top_n), repeat=1)
+                pivot_time, result = _timed(lambda: pivot(df, top_n))
+                # Grouped means may differ from per-subset means in the last bits
+                assert {k: v for k, v in result.items() if k != 'matrix'} == \
+                    {k: v for k, v in expected.items() if k != 'matrix'}, f"{name} axes differ"
+                assert np.allclose(result['matrix'], expected['matrix'], equal_nan=True), f"{name} matrix differs"
+                print(f"{n_rows:>8} {top_n:>6} {name:>12} {legacy_time * 1000:>12.1f} "
+                      f"{pivot_time * 1000:>9.1f} {legacy_time / pivot_time:>7.1f}x")
+
+
+def benchmark_widgets(row_counts=(10000, 100000, 1000000), days=(365, 365 * 5)):
+    """Latency and payload of the stacked area and flow widgets over growing date ranges."""
+    from services.analytics import AnalyticsService
+    
+    service = AnalyticsService()
+    print("\nStacked area / flow widgets (pandas frame path)")
+    print(f"{'rows':>8} {'days':>5} {'widget':>20} {'loop ms':>9} {'pivot ms':>9} {'speedup':>8} {'points':>7}")
+    for n_rows in row_counts:
+        for n_days in days:
+            df = scored_bookings(n_rows)
+            df['booking_date'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(
+                np.random.default_rng(1).integers(0, n_days, n_rows), unit='D'
+            )
+            
+            # The loop is quadratic in the date range; skip where it would take minutes
+            if n_rows * n_days <= 100000 * 365:
+                loop_time, expected = _timed(lambda: legacy_stacked_area(df), repeat=1)
+                pivot_time, result = _timed(lambda: service._stacked_area_data(df, 'day'))
+                assert result == expected, "stacked area results differ"
+                print(f"{n_rows:>8} {n_days:>5} {'stacked_area day':>20} {loop_time * 1000:>9.1f} "
+                      f"{pivot_time * 1000:>9.1f} {loop_time / pivot_time:>7.1f}x {len(result['dates']):>7}")
+            auto_time, result = _timed(lambda: service._stacked_area_data(df, 'auto'))
+            print(f"{n_rows:>8} {n_days:>5} {'stacked_area auto':>20} {'':>9} "
+                  f"{auto_time * 1000:>9.1f} {'':>8} {len(result['dates']):>7}")
+            
+            loop_time, expected = _timed(lambda: legacy_flow(df), repeat=1)
+            pivot_time, result = _timed(lambda: service._flow_data(df))
+            assert link_totals(result) == link_totals(expected), "flow results differ"
+            print(f"{n_rows:>8} {n_days:>5} {'flow':>20} {loop_time * 1000:>9.1f} "
+                  f"{pivot_time * 1000:>9.1f} {loop_time / pivot_time:>7.1f}x {len(result['links']):>7}")
+
+
+def _table_bytes(conn, table):
+    """Bytes used by a table and its indexes (SQLite dbstat)."""
+    return conn.execute(
+        "SELECT SUM(pgsize) FROM dbstat WHERE name = ? OR name IN "
+        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?)",
+        (table, table)
+    ).fetchone()[0]
+
+
+def benchmark_dimensions(row_counts=(100000, 1000000)):
+    """
+    Size and read latency of bookings_scored with TEXT dimension columns vs
+    the dictionary-encoded layout init_database migrates it to.
+    """
+    from database.database import models
+    from database.database.storage import configure_storage
+    
+    columns = ['lane', 'pol', 'pod', 'container_state', 'cancel_risk', 'cancel_probability']
+    legacy_select = f"SELECT {', '.join(columns)} FROM bookings_scored"
+    
+    print("\nDimension columns: TEXT vs dictionary-encoded (SQLite)")
+    print(f"{'rows':>8} {'measure':>26} {'text':>10} {'encoded':>10} {'ratio':>7}")
+    try:
+        for n_rows in row_counts:
+            df = scored_bookings(n_rows)
+            with tempfile.TemporaryDirectory() as tmp:
+                legacy_path, encoded_path = os.path.join(tmp, 'text.db'), os.path.join(tmp, 'encoded.db')
+                legacy_scored_table(legacy_path)
+                legacy = sqlite3.connect(legacy_path)
+                legacy_insert(df, legacy)
+                legacy.execute('VACUUM')
+                legacy.close()
+                
+                # The encoded database is the text one after init_database's migration
+                with open(legacy_path, 'rb') as src, open(encoded_path, 'wb') as dst:
+                    dst.write(src.read())
+                storage = configure_storage('sqlite', path=encoded_path)
+                migrate_time, _ = _timed(models.init_database, repeat=1)
+                with storage.connection() as conn:
+                    conn.execute('VACUUM')
+                print(f"{n_rows:>8} {'migration s':>26} {'':>10} {migrate_time:>10.2f}")
+                
+                legacy = sqlite3.connect(legacy_path)
+                with storage.connection() as conn:
+                    sizes = (_table_bytes(legacy, 'bookings_scored'), _table_bytes(conn, 'bookings_scored'))
+                
+                full = (
+                    _timed(lambda: pd.read_sql_query(legacy_select, legacy)),
+                    _timed(lambda: models.queryscored_bookings(None, columns)),
+                )
+                lane = (
+                    _timed(lambda: pd.read_sql_query(legacy_select + " WHERE lane = ?", legacy, params=['LANE_1'])),
+                    _timed(lambda: models.queryscored_bookings({'lane': 'LANE_1'}, columns)),
+                )
+                grouped_sql = (
+                    _timed(lambda: pd.read_sql_query(
+                        "SELECT lane, AVG(cancel_probability) AS cancel_probability, COUNT(*) AS n "
+                        "FROM bookings_scored GROUP BY lane", legacy
+                    )),
+                    _timed(lambda: models.aggregatescored_bookings(
+                        group_by=['lane'], metrics={'cancel_probability': ('avg', 'cancel_probability'), 'n': ('count', '*')}
+                    )),
+                )
+                frames = (full[0][1], full[1][1])
+                keys = ['lane', 'container_state', 'cancel_risk']
+                grouped_frame = (
+                    _timed(lambda: frames[0].groupby(keys).size()),
+                    _timed(lambda: frames[1].groupby(keys, observed=True).size()),
+                )
+                legacy.close()
+                storage.pool.close()
+                
+                assert grouped_frame[0][1].sort_index().tolist() == grouped_frame[1][1].sort_index().tolist()
+                rows = (
+                    ('bookings_scored + idx MB', sizes[0] / 1e6, sizes[1] / 1e6),
+                    ('frame memory MB', *(frame.memory_usage(deep=True).sum() / 1e6 for frame in frames)),
+                    ('full read ms', full[0][0] * 1000, full[1][0] * 1000),
+                    ('lane filter read ms', lane[0][0] * 1000, lane[1][0] * 1000),
+                    ('SQL group by lane ms', grouped_sql[0][0] * 1000, grouped_sql[1][0] * 1000),
+                    ('pandas 3-key groupby ms', grouped_frame[0][0] * 1000, grouped_frame[1][0] * 1000),
+                )
+                for measure, text, encoded in rows:
+                    print(f"{n_rows:>8} {measure:>26} {text:>10.1f} {encoded:>10.1f} {text / encoded:>6.1f}x")
+    finally:
+        configure_storage()
+
+
+def benchmark_predict(batch_sizes=(1, 8, 64), repeat=200):
+    """Latency of small prediction batches through sklearn vs the compiled scorer."""
+    from mlProject.components.model_service import ModelService
+    
+    service = ModelService(use_compiled=False)
+    service.load_models()
+    scorer = service.compile_scorer()
+    
+    print(f"\nSmall-batch scoring ({type(service.cancel_model).__name__} / {type(service.broken_route_model).__name__})")
+    print(f"{'rows':>6} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8} {'max error':>10}")
+    for batch_size in batch_sizes:
+        records = scorer.sample_records(batch_size, seed=batch_size)
+        
+        def sklearn_path():
+            return service.predict_all(pd.DataFrame(records))
+        
+        def compiled_path():
+            return service.predict_records(records)
+        
+        service.compiled = None
+        sklearn_time, expected = _timed(lambda: [sklearn_path() for _ in range(repeat // 10)])
+        service.compiled = scorer
+        compiled_time, result = _timed(lambda: [compiled_path() for _ in range(repeat)])
+        sklearn_time, compiled_time = sklearn_time / (repeat // 10), compiled_time / repeat
+        error = max(
+            abs(row[target]['probability'] - reference[target]['probability'])
+            for row, reference in zip(result[0], expected[0]) for target in ('cancel', 'broken_route')
+        )
+        print(f"{batch_size:>6} {sklearn_time * 1000:>11.3f} {compiled_time * 1000:>12.3f} "
+              f"{sklearn_time / compiled_time:>7.1f}x {error:>10.1e}")
+
+
+def benchmark_batching(clients=(1, 8, 32), requests_per_client=50):
+    """Throughput of concurrent single predictions scored directly vs coalesced by PredictionBatcher."""
+    from concurrent.futures import ThreadPoolExecutor
+    from mlProject.components.model_service import ModelService
+    from services.batching import PredictionBatcher
+    
+    service = ModelService()
+    service.load_models()
+    compiled = service.compiled
+    records = compiled.sample_records(requests_per_client)
+    
+    print("\nConcurrent single predictions (requests/s)")
+    print(f"{'scorer':>9} {'clients':>8} {'direct':>9} {'batched':>9} {'speedup':>8} {'mean batch':>11}")
+    for scorer in ('sklearn', 'compiled'):
+        service.compiled = compiled if scorer == 'compiled' else None
+        for n_clients in clients:
+            throughput = {}
+            for mode in ('direct', 'batched'):
+                batcher = PredictionBatcher(service, enabled=(mode == 'batched'))
+                
+                def client():
+                    for record in records:
+                        batcher.predict(record)
+                
+                with ThreadPoolExecutor(max_workers=n_clients) as pool:
+                    elapsed, _ = _timed(lambda: list(pool.map(lambda _: client(), range(n_clients))), repeat=1)
+                throughput[mode] = n_clients * len(records) / elapsed
+            print(f"{scorer:>9} {n_clients:>8} {throughput['direct']:>9.0f} {throughput['batched']:>9.0f} "
+                  f"{throughput['batched'] / throughput['direct']:>7.1f}x {batcher.stats()['mean_batch_size']:>11.1f}")
+
+
+def benchmark_batch_api(row_counts=(1000, 10000)):
+    """Latency and payload size of /api/predict/batch per request and response encoding."""
+    from flask import Flask
+    from backend.routes_api import api_bp
+    
+    app = Flask(__name__)
+    app.register_blueprint(api_bp, url_prefix='/api')
+    client = app.test_client()
+    
+    print("\n/api/predict/batch (Flask test client)")
+    print(f"{'rows':>6} {'request':>8} {'response':>9} {'ms':>9} {'response KB':>12}")
+    for n_rows in row_counts:
+        df = synthetic_bookings(n_rows, 10)
+        df['booking_date'] = df['booking_date'].dt.strftime('%Y-%m-%d')
+        payloads = {'records': df.to_dict('records'), 'columns': df.to_dict('list')}
+        for request_format, payload in payloads.items():
+            for response_format in ('json', 'ndjson', 'arrow'):
+                elapsed, response = _timed(
+                    lambda: client.post(f'/api/predict/batch?format={response_format}', json=payload)
+                )
+                assert response.status_code == 200, response.data[:200]
+                print(f"{n_rows:>6} {request_format:>8} {response_format:>9} {elapsed * 1000:>9.1f} "
+                      f"{len(response.data) / 1024:>12.1f}")
+        
+        single = payloads['records'][:100]
+        elapsed, _ = _timed(lambda: [client.post('/api/predict', json=record) for record in single], repeat=1)
+        print(f"{n_rows:>6} {'single':>8} {'json':>9} {elapsed / len(single) * n_rows * 1000:>9.1f} {'':>12}"
+              f"  (one /api/predict per booking, extrapolated)")
+
+
+BENCHMARKS = {
+    'encoding': benchmark_encoding,
+    'insert': benchmark_insert,
+    'matrix': benchmark_matrix,
+    'widgets': benchmark_widgets,
+    'dimensions': benchmark_dimensions,
+    'predict': benchmark_predict,
+    'batching': benchmark_batching,
+    'batch_api': benchmark_batch_api,
+}
+
+
+def main():
+    """Run the benchmarks named on the command line (all if none)."""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (choose from {', '.join(BENCHMARKS)})")
+            return
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
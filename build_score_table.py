@@ -0,0 +1,25 @@
+# ============================================================================
+# FILE: build_score_table.py
+# ============================================================================
+"""
+Rebuild the precomputed score table for the current models.
+Training builds it once; run this daily (e.g. from cron) to roll the date
+window forward. ModelService answers from it with SCORE_LOOKUP=1.
+"""
+import time
+from mlProject.components.model_service import ModelService
+from mlProject.components.score_table import build_score_table
+
+
+def main():
+    """Score every category combination over the rolling date window."""
+    service = ModelService(use_compiled=False, use_score_table=False)
+    service.load_models()
+    
+    start = time.perf_counter()
+    table = build_score_table(service)
+    print(f"✓ Built score table from {table.start} ({table.days} days, {table.scores.size // 2} scores per target) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
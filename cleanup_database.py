@@ -3,68 +3,70 @@
 # ============================================================================
 """
 Clean up duplicate records from the database.
-Keeps only the most recent record for each booking_id.
+Keeps only the most recent record for each booking_id, then creates the
+unique booking_id index uploads need (databases from before it was added
+are not deduplicated automatically). Works on the configured storage
+engine (SQLite or PostgreSQL).
 """
-import sqlite3
-import os
-from mlProject.constants import ARTIFACTS_DIR
-
-DATABASE_PATH = os.path.join(ARTIFACTS_DIR, 'logistics.db')
+from database.database.models import bump_table_version, create_booking_id_index, rebuild_rollups
+from database.database.storage import get_storage
+from database.database.columnar import get_columnar_store
 
 
 def cleanup_duplicates():
     """Remove duplicate records, keeping the most recent one for each booking_id."""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Count before
-    cursor.execute('SELECT COUNT(*) FROM bookings_scored')
-    count_before = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(DISTINCT booking_id) FROM bookings_scored WHERE booking_id IS NOT NULL')
-    unique_before = cursor.fetchone()[0]
-    
-    print(f"Records before cleanup: {count_before}")
-    print(f"Unique booking_ids: {unique_before}")
-    
-    # Delete duplicates, keeping the one with the highest id (most recent)
-    # Handle NULL booking_ids separately
-    cursor.execute('''
-        DELETE FROM bookings_scored
-        WHERE id NOT IN (
-            SELECT MAX(id)
-            FROM bookings_scored
-            WHERE booking_id IS NOT NULL
-            GROUP BY booking_id
-        )
-        AND booking_id IS NOT NULL
-    ''')
+    storage = get_storage()
     
-    deleted = cursor.rowcount
-    conn.commit()
+    with storage.connection() as conn:
+        def count(query):
+            return storage.execute(conn, query).fetchone()[0]
+        
+        # Count before
+        count_before = count('SELECT COUNT(*) FROM bookings_scored')
+        unique_before = count('SELECT COUNT(DISTINCT booking_id) FROM bookings_scored WHERE booking_id IS NOT NULL')
+        
+        print(f"Records before cleanup: {count_before}")
+        print(f"Unique booking_ids: {unique_before}")
+        
+        # Delete duplicates, keeping the one with the highest id (most recent)
+        # Handle NULL booking_ids separately
+        deleted = storage.execute(conn, '''
+            DELETE FROM bookings_scored
+            WHERE id NOT IN (
+                SELECT MAX(id)
+                FROM bookings_scored
+                WHERE booking_id IS NOT NULL
+                GROUP BY booking_id
+            )
+            AND booking_id IS NOT NULL
+        ''').rowcount
+        
+        # Also remove duplicate NULL booking_ids (keep only one)
+        deleted_null = storage.execute(conn, '''
+            DELETE FROM bookings_scored
+            WHERE id NOT IN (
+                SELECT MIN(id)
+                FROM bookings_scored
+                WHERE booking_id IS NULL
+            )
+            AND booking_id IS NULL
+        ''').rowcount
+        
+        if deleted or deleted_null:
+            bump_table_version(conn)
+        create_booking_id_index(conn)
+        conn.commit()
+        
+        # Count after
+        count_after = count('SELECT COUNT(*) FROM bookings_scored')
+        unique_after = count('SELECT COUNT(DISTINCT booking_id) FROM bookings_scored WHERE booking_id IS NOT NULL')
     
-    # Also remove duplicate NULL booking_ids (keep only one)
-    cursor.execute('''
-        DELETE FROM bookings_scored
-        WHERE id NOT IN (
-            SELECT MIN(id)
-            FROM bookings_scored
-            WHERE booking_id IS NULL
-        )
-        AND booking_id IS NULL
-    ''')
-    
-    deleted_null = cursor.rowcount
-    conn.commit()
-    
-    # Count after
-    cursor.execute('SELECT COUNT(*) FROM bookings_scored')
-    count_after = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(DISTINCT booking_id) FROM bookings_scored WHERE booking_id IS NOT NULL')
-    unique_after = cursor.fetchone()[0]
-    
-    conn.close()
+    # Deleted rows must leave the derived stores too
+    if deleted or deleted_null:
+        rebuild_rollups()
+        store = get_columnar_store()
+        if store is not None:
+            store.invalidate('cleanup_database removed rows')
     
     print(f"Deleted {deleted} duplicate records (with booking_id)")
     if deleted_null > 0:
@@ -78,4 +80,3 @@ def cleanup_duplicates():
 
 if __name__ == '__main__':
     cleanup_duplicates()
-
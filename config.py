@@ -21,12 +21,16 @@ import os
 class Config:
     """Base configuration."""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-me'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', 512)) * 1024 * 1024  # bulk uploads are streamed
     
     # Paths
     DATA_DIR = 'data'
     ARTIFACTS_DIR = 'artifacts'
     
+    # Bookings storage engine: sqlite or postgresql (see database/storage.py)
+    STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'sqlite')
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+    
     # ML parameters
     TEST_SIZE = 0.2
     RANDOM_STATE = 42
@@ -43,8 +47,11 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     
-    # Add production-specific settings
-    # e.g., database URLs, Redis cache, etc.
+    # PostgreSQL whenever a DATABASE_URL is provided, so concurrent writers
+    # don't queue on SQLite's single write lock
+    STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE') or (
+        'postgresql' if os.environ.get('DATABASE_URL') else 'sqlite'
+    )
 
 
 class TestingConfig(Config):
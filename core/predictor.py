@@ -51,15 +51,17 @@ class UnifiedPredictor:
         
         df_result = df.copy()
         
-        # Get predictions
-        predictions = self.model_service.predict_all(df)
+        # Get predictions as whole columns
+        scores = self.model_service.predict_frame(df)
         
         # Add predictions to dataframe
-        df_result['cancel_probability'] = [p['cancel']['probability'] for p in predictions]
-        df_result['cancel_risk'] = [p['cancel']['risk_label'] for p in predictions]
-        df_result['broken_route_probability'] = [p['broken_route']['probability'] for p in predictions]
-        df_result['broken_route_risk'] = [p['broken_route']['risk_label'] for p in predictions]
+        for column, values in scores.items():
+            df_result[column] = values
         
-        logging.info(f"Generated predictions for {len(df_result)} bookings")
+        timings = self.model_service.last_timings
+        logging.info(
+            f"Generated predictions for {len(df_result)} bookings "
+            f"(preprocess {timings['preprocess_ms']:.1f} ms, inference {timings['inference_ms']:.1f} ms)"
+        )
         
         return df_result
@@ -0,0 +1,319 @@
+# ============================================================================
+# FILE: database/columnar.py
+# ============================================================================
+"""
+Columnar mirror of bookings_scored for dashboard scans.
+Rows are stored as Parquet files partitioned by booking month
+(booking_month=YYYY-MM/part-*.parquet), so a filtered scan reads only the
+months and columns it needs. Enabled with COLUMNAR_STORE=parquet (requires
+pyarrow); insert_scored_bookings keeps it in sync and
+
+    python -m database.database.columnar
+
+rebuilds it from the row store.
+"""
+from contextlib import contextmanager
+import threading
+import logging
+import shutil
+import uuid
+import os
+import pandas as pd
+
+from mlProject.constants import ARTIFACTS_DIR
+
+COLUMNAR_DIR = os.path.join(ARTIFACTS_DIR, 'columnar', 'bookings_scored')
+
+# Partitions with more part files than this are compacted into one
+MAX_PARTS_PER_PARTITION = 8
+
+# Partition of rows without a booking date (skipped by date filters)
+NULL_PARTITION = 'booking_month=null'
+
+# Column types of the mirror; dates keep the row store's text format
+COLUMN_TYPES = {
+    'id': 'int64',
+    'booking_id': 'string',
+    'booking_date': 'string',
+    'pol': 'string',
+    'pod': 'string',
+    'lane': 'string',
+    'bundle': 'string',
+    'container_state': 'string',
+    'cancel_probability': 'float64',
+    'cancel_risk': 'string',
+    'broken_route_probability': 'float64',
+    'broken_route_risk': 'string',
+    'created_at': 'string',
+}
+
+DATE_FORMATS = {
+    'booking_date': '%Y-%m-%d %H:%M:%S',
+    'created_at': '%Y-%m-%d %H:%M:%S.%f',
+}
+
+
+class ParquetStore:
+    """Month-partitioned Parquet files with projection and partition pruning."""
+    
+    def __init__(self, root=COLUMNAR_DIR, max_parts=MAX_PARTS_PER_PARTITION):
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet columnar store requires the 'pyarrow' package")
+        
+        self.root = root
+        self.max_parts = max_parts
+        self._lock = threading.Lock()
+        arrow_types = {'int64': pyarrow.int64(), 'float64': pyarrow.float64(), 'string': pyarrow.string()}
+        self.schema = pyarrow.schema([(name, arrow_types[dtype]) for name, dtype in COLUMN_TYPES.items()])
+        os.makedirs(root, exist_ok=True)
+    
+    @property
+    def _stale_marker(self):
+        return os.path.join(self.root, 'STALE')
+    
+    def available(self):
+        """False once a failed write left the mirror out of sync (until rebuild)."""
+        return not os.path.exists(self._stale_marker)
+    
+    def invalidate(self, reason=''):
+        """Mark the mirror stale so readers fall back to the row store."""
+        with open(self._stale_marker, 'w') as f:
+            f.write(reason)
+        logging.warning(f"Columnar store marked stale: {reason}")
+    
+    @contextmanager
+    def _locked(self):
+        # Serializes writers across threads and, where flock exists, processes
+        with self._lock:
+            with open(os.path.join(self.root, '.lock'), 'w') as lock_file:
+                try:
+                    import fcntl
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                except ImportError:
+                    pass
+                yield
+    
+    def _to_table(self, frame):
+        import pyarrow as pa
+        
+        frame = frame.reindex(columns=list(COLUMN_TYPES))
+        for column, date_format in DATE_FORMATS.items():
+            if pd.api.types.is_datetime64_any_dtype(frame[column]):
+                frame[column] = frame[column].dt.strftime(date_format)
+        for column in frame.columns:
+            if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype(object)
+        return pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+    
+    @staticmethod
+    def _partition_names(frame):
+        booking_date = frame['booking_date']
+        if pd.api.types.is_datetime64_any_dtype(booking_date):
+            months = booking_date.dt.strftime('%Y-%m')
+        else:
+            months = booking_date.astype('string').str[:7]
+        return ('booking_month=' + months).fillna(NULL_PARTITION)
+    
+    def _part_files(self, partition):
+        path = os.path.join(self.root, partition)
+        if not os.path.isdir(path):
+            return []
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.endswith('.parquet')
+        )
+    
+    def _write_partitions(self, frame, root):
+        import pyarrow.parquet as pq
+        
+        written = []
+        for partition, rows in frame.groupby(self._partition_names(frame), sort=False):
+            path = os.path.join(root, partition)
+            os.makedirs(path, exist_ok=True)
+            pq.write_table(self._to_table(rows), os.path.join(path, f'part-{uuid.uuid4().hex}.parquet'))
+            written.append(partition)
+        return written
+    
+    def _compact(self, partition):
+        import pyarrow.parquet as pq
+        import pyarrow as pa
+        
+        files = self._part_files(partition)
+        if len(files) <= self.max_parts:
+            return
+        table = pa.concat_tables([pq.read_table(path, schema=self.schema) for path in files])
+        target = os.path.join(self.root, partition, f'part-{uuid.uuid4().hex}.parquet')
+        pq.write_table(table.sort_by('id'), target + '.tmp')
+        os.replace(target + '.tmp', target)
+        for path in files:
+            os.remove(path)
+    
+    def upsert(self, frame, replaced_ids=None):
+        """
+        Add rows written to bookings_scored; replaced_ids are booking_ids
+        whose previous version must be dropped first.
+        """
+        import pyarrow.parquet as pq
+        import pyarrow.compute as pc
+        import pyarrow as pa
+        
+        if len(frame) == 0:
+            return
+        with self._locked():
+            if replaced_ids is not None and len(replaced_ids):
+                # An update may move a booking to another month, so check every partition
+                value_set = pa.array([str(value) for value in replaced_ids], type=pa.string())
+                for partition in self._partitions():
+                    for path in self._part_files(partition):
+                        table = pq.read_table(path, schema=self.schema)
+                        mask = pc.fill_null(pc.is_in(table['booking_id'], value_set=value_set), False)
+                        if pc.any(mask).as_py():
+                            kept = table.filter(pc.invert(mask))
+                            pq.write_table(kept, path + '.tmp')
+                            os.replace(path + '.tmp', path)
+            
+            for partition in self._write_partitions(frame, self.root):
+                self._compact(partition)
+    
+    def clear(self):
+        """Drop every partition."""
+        with self._locked():
+            for partition in self._partitions():
+                shutil.rmtree(os.path.join(self.root, partition))
+    
+    def rebuild(self, frames):
+        """Replace the mirror with the given DataFrame chunks and clear the stale mark."""
+        staging = f'{self.root}.rebuild-{uuid.uuid4().hex}'
+        os.makedirs(staging)
+        rows = 0
+        for frame in frames:
+            self._write_partitions(frame, staging)
+            rows += len(frame)
+        
+        with self._locked():
+            for partition in self._partitions():
+                shutil.rmtree(os.path.join(self.root, partition))
+            for partition in os.listdir(staging):
+                os.replace(os.path.join(staging, partition), os.path.join(self.root, partition))
+            for partition in self._partitions():
+                self._compact(partition)
+            if os.path.exists(self._stale_marker):
+                os.remove(self._stale_marker)
+        shutil.rmtree(staging)
+        return rows
+    
+    def _partitions(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if name.startswith('booking_month=') and os.path.isdir(os.path.join(self.root, name))
+        )
+    
+    def prune(self, filters=None):
+        """Partitions that can hold rows matching the date filters."""
+        filters = filters or {}
+        start = str(filters['start_date'])[:7] if filters.get('start_date') else None
+        end = str(filters['end_date'])[:7] if filters.get('end_date') else None
+        month = f"{int(filters['month']):02d}" if filters.get('month') else None
+        year = str(filters['year']) if filters.get('year') else None
+        has_date_filter = any(value is not None for value in (start, end, month, year))
+        
+        selected = []
+        for partition in self._partitions():
+            if partition == NULL_PARTITION:
+                if not has_date_filter:
+                    selected.append(partition)
+                continue
+            key = partition.split('=', 1)[1]
+            if start is not None and key < start:
+                continue
+            if end is not None and key > end:
+                continue
+            if month is not None and key[5:7] != month:
+                continue
+            if year is not None and key[:4] != year:
+                continue
+            selected.append(partition)
+        return selected
+    
+    def scan(self, filters=None, columns=None):
+        """
+        Filtered rows with only the requested columns, in insertion (id)
+        order like a full scan of the row store. Filters match
+        query_scored_bookings, and dimension columns are categoricals too.
+        """
+        import pyarrow.dataset as ds
+        from database.database.models import CATEGORICAL_COLUMNS
+        
+        filters = filters or {}
+        columns = list(columns) if columns else list(COLUMN_TYPES)
+        read_columns = columns if 'id' in columns else columns + ['id']
+        
+        files = [path for partition in self.prune(filters) for path in self._part_files(partition)]
+        if not files:
+            return pd.DataFrame({
+                column: pd.Series(dtype=(
+                    'category' if column in CATEGORICAL_COLUMNS
+                    else 'str' if COLUMN_TYPES[column] == 'string' else COLUMN_TYPES[column]
+                ))
+                for column in columns
+            })
+        
+        # Month/year are resolved by partition pruning; the rest filter rows
+        expression = None
+        conditions = []
+        if filters.get('start_date'):
+            conditions.append(ds.field('booking_date') >= str(filters['start_date']))
+        if filters.get('end_date'):
+            conditions.append(ds.field('booking_date') <= str(filters['end_date']))
+        for column in ('lane', 'pol', 'pod'):
+            if filters.get(column):
+                conditions.append(ds.field(column) == str(filters[column]))
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        
+        table = ds.dataset(files, schema=self.schema, format='parquet').to_table(
+            columns=read_columns, filter=expression
+        )
+        # Parquet stores these dictionary-encoded; keep them that way, with
+        # categories sorted like the row store's
+        categorical = [column for column in read_columns if column in CATEGORICAL_COLUMNS]
+        df = table.to_pandas(categories=categorical).sort_values('id', kind='stable', ignore_index=True)
+        for column in categorical:
+            df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+        return df[columns]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_columnar_store():
+    """The mirror selected by COLUMNAR_STORE (parquet), or None when disabled."""
+    global _store
+    name = os.environ.get('COLUMNAR_STORE', '').lower()
+    if name in ('', 'none', 'off'):
+        return None
+    if name != 'parquet':
+        raise ValueError(f"Unknown columnar store: {name}")
+    
+    with _store_lock:
+        if _store is None:
+            _store = ParquetStore()
+        return _store
+
+
+def rebuild_columnar_store():
+    """Repopulate the mirror from bookings_scored; returns the row count."""
+    from database.database.models import iter_scored_bookings
+    
+    store = get_columnar_store() or ParquetStore()
+    return store.rebuild(iter_scored_bookings())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    rows = rebuild_columnar_store()
+    print(f"Rebuilt columnar store at {COLUMNAR_DIR} with {rows} rows")
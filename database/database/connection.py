@@ -0,0 +1,238 @@
+# ============================================================================
+# FILE: database/connection.py
+# ============================================================================
+"""
+Database connection pooling.
+Each worker process keeps a small pool of open connections per database,
+so requests reuse the page cache and skip connection setup. SQLite
+connections run in WAL mode, letting dashboard reads proceed while a bulk
+insert is writing.
+"""
+from contextlib import contextmanager
+from functools import partial
+import threading
+import logging
+import sqlite3
+import queue
+import time
+import os
+
+# Connections kept open per database file and process
+POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+
+# Longest a caller waits for a connection when all are borrowed
+POOL_TIMEOUT_S = float(os.environ.get('SQLITE_POOL_TIMEOUT_S', 30))
+
+# How long a statement waits for another writer's lock before failing
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+# Bytes of the database file memory-mapped for reads
+MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Page cache per connection, in KiB
+CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+
+
+def connect_sqlite(path, busy_timeout_ms=BUSY_TIMEOUT_MS, mmap_size=MMAP_SIZE, cache_size_kb=CACHE_SIZE_KB):
+    """Open a SQLite connection with the pool's pragmas."""
+    # Connections move between threads, but only one thread holds each
+    conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+    conn.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+    conn.execute(f'PRAGMA cache_size={-int(cache_size_kb)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+# Put on the idle queue when a broken connection is dropped, so a waiting
+# caller opens a replacement
+_FREED = object()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of DB-API connections to one database.
+    Callers beyond pool_size wait up to timeout_s for a connection to be
+    returned; checkouts and wait time are counted for sizing.
+    """
+    
+    def __init__(self, connect, name, pool_size=POOL_SIZE, timeout_s=POOL_TIMEOUT_S):
+        self.connect = connect
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout_s = timeout_s
+        
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._waiting = 0
+        self._generation = 0
+        self._pid = os.getpid()
+        
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+    
+    def _reset_after_fork(self):
+        # Connections inherited from a parent process must not be shared
+        if os.getpid() != self._pid:
+            self._idle = queue.LifoQueue()
+            self._opened = 0
+            self._waiting = 0
+            self._pid = os.getpid()
+    
+    def _take_idle(self):
+        """An idle connection or None (skipping _FREED markers nobody waited for)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if conn is not _FREED:
+                return conn
+    
+    def _checkout(self):
+        with self._lock:
+            self._reset_after_fork()
+            self.checkouts += 1
+        
+        start = time.perf_counter()
+        deadline = start + self.timeout_s
+        waited = False
+        while True:
+            with self._lock:
+                conn = self._take_idle()
+                opening = conn is None and self._opened < self.pool_size
+                if opening:
+                    self._opened += 1
+                elif conn is None:
+                    self._waiting += 1
+            
+            if opening:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            elif conn is None:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    conn = None
+                finally:
+                    with self._lock:
+                        self._waiting -= 1
+                if conn is None:
+                    raise TimeoutError(f"No connection to {self.name} was free within {self.timeout_s:g}s")
+                if conn is _FREED:
+                    # A broken connection was dropped; open its replacement
+                    continue
+            
+            if waited:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.waits += 1
+                    self.wait_seconds += elapsed
+                    self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+            return conn
+    
+    def _checkin(self, conn, generation):
+        try:
+            # A no-op unless the borrower left a transaction open
+            conn.rollback()
+        except Exception as e:
+            logging.warning(f"Dropping broken connection to {self.name}: {e}")
+            self._discard(conn)
+            return
+        
+        with self._lock:
+            closed = generation != self._generation
+        if closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+    
+    def _discard(self, conn):
+        """Close a borrowed connection and free its slot."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._opened -= 1
+            if self._waiting:
+                self._idle.put(_FREED)
+    
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection; uncommitted work is rolled back on return.
+        Raises TimeoutError if none is free within timeout_s.
+        """
+        generation = self._generation
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn, generation)
+    
+    def close(self):
+        """Close idle connections; borrowed ones are closed when returned."""
+        with self._lock:
+            self._generation += 1
+            while True:
+                conn = self._take_idle()
+                if conn is None:
+                    break
+                conn.close()
+                self._opened -= 1
+            # Callers waiting for a returned connection open new ones
+            for _ in range(self._waiting):
+                self._idle.put(_FREED)
+    
+    def stats(self):
+        """Checkout and wait counters for pool sizing."""
+        with self._lock:
+            return {
+                'database': self.name,
+                'pool_size': self.pool_size,
+                'timeout_s': self.timeout_s,
+                'open_connections': self._opened,
+                'idle_connections': self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'avg_wait_ms': self.wait_seconds / self.waits * 1000 if self.waits else 0.0,
+                'max_wait_ms': self.max_wait_seconds * 1000
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, connect=None):
+    """
+    Process-wide pool for a database: a SQLite file path, or any name with a
+    connect() factory (e.g. a PostgreSQL URL).
+    """
+    if connect is None:
+        name = os.path.abspath(name)
+        connect = partial(connect_sqlite, name)
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ConnectionPool(connect, name)
+        return pool
+
+
+def pool_stats():
+    """Stats of every pool opened in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -3,110 +3,585 @@
 # ============================================================================
 """
 Database models for persistent storage.
-Uses SQLite for simplicity, easily upgradable to PostgreSQL.
+Uses SQLite by default; PostgreSQL is available through the storage engine
+(see database/storage.py). Queries are written with '?' placeholders and
+portable SQL, dialect-specific pieces come from the engine.
 """
 from datetime import datetime
-import sqlite3
+import logging
+import time
+import uuid
 import pandas as pd
 import os
 from mlProject.constants import ARTIFACTS_DIR
+from database.database.storage import get_storage
+from database.database.columnar import get_columnar_store
 
 DATABASE_PATH = os.path.join(ARTIFACTS_DIR, 'logistics.db')
 
 
 def init_database():
     """Initialize database and create tables."""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    storage = get_storage()
+    types = storage.types
     
-    # Create bookings_scored table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bookings_scored (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    with storage.connection() as conn:
+        def execute(query, params=()):
+            return storage.execute(conn, query, params)
+        
+        # Dictionary of the text dimensions of bookings_scored (see CATEGORICAL_COLUMNS)
+        execute(f'''
+            CREATE TABLE IF NOT EXISTS dimension_values (
+                id {types['id']},
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                UNIQUE (dimension, value)
+            )
+        ''')
+        
+        # Databases from before dictionary encoding stored the dimensions as TEXT
+        migrated = storage.column_exists(conn, 'bookings_scored', 'lane')
+        if migrated:
+            _encode_text_dimensions(conn)
+        
+        # Create bookings_scored table
+        execute(_scored_table_sql('bookings_scored', types))
+        
+        # Pre-aggregated bookings per date and dimensions (see ROLLUP_KEYS),
+        # maintained by insert_scored_bookings
+        execute(f'''
+            CREATE TABLE IF NOT EXISTS bookings_rollup (
+                booking_date {types['date']},
+                lane_id INTEGER,
+                pol_id INTEGER,
+                pod_id INTEGER,
+                container_state_id INTEGER,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                booking_ids INTEGER NOT NULL DEFAULT 0,
+                cancel_probability_sum {types['real']} NOT NULL DEFAULT 0,
+                cancel_probability_count INTEGER NOT NULL DEFAULT 0,
+                broken_route_probability_sum {types['real']} NOT NULL DEFAULT 0,
+                broken_route_probability_count INTEGER NOT NULL DEFAULT 0,
+                cancel_high INTEGER NOT NULL DEFAULT 0,
+                cancel_medium INTEGER NOT NULL DEFAULT 0,
+                cancel_low INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # idx_rollup_key did not coalesce NULL keys, so every write added rows
+        # for groups with a NULL dimension; those databases get the rollup rebuilt
+        if storage.index_exists(conn, 'idx_rollup_key'):
+            execute('DROP INDEX idx_rollup_key')
+            execute('DELETE FROM bookings_rollup')
+        execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_rollup_group ON bookings_rollup({_rollup_key_sql()})")
+        
+        # Distinct filter values with their booking counts (see FILTER_DIMENSIONS),
+        # maintained by insert_scored_bookings
+        execute('''
+            CREATE TABLE IF NOT EXISTS filter_options (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, value)
+            )
+        ''')
+        
+        # Year and month of booking_date, so month-only filters can use an index
+        for table in ('bookings_scored', 'bookings_rollup'):
+            for part in ('year', 'month'):
+                if not storage.column_exists(conn, table, f'booking_{part}'):
+                    generated = types['generated'].format(storage.date_number(part, 'booking_date'))
+                    execute(f"ALTER TABLE {table} ADD COLUMN booking_{part} {generated}")
+        
+        # Indexes matched to the dashboard filters: a date range alone or
+        # combined with a lane/port, and a month across years. The composite
+        # indexes also serve lookups on their leading column alone, and carry
+        # the columns the SQL widgets aggregate so those never read the table
+        execute('CREATE INDEX IF NOT EXISTS idx_date_cover ON bookings_scored(booking_date, cancel_probability, cancel_risk_id)')
+        execute('CREATE INDEX IF NOT EXISTS idx_lane_date ON bookings_scored(lane_id, booking_date, cancel_probability)')
+        execute('CREATE INDEX IF NOT EXISTS idx_pol_date ON bookings_scored(pol_id, booking_date, cancel_probability)')
+        execute('CREATE INDEX IF NOT EXISTS idx_pod_date ON bookings_scored(pod_id, booking_date)')
+        execute('CREATE INDEX IF NOT EXISTS idx_month_date ON bookings_scored(booking_month, booking_date)')
+        execute('CREATE INDEX IF NOT EXISTS idx_created_at ON bookings_scored(created_at)')
+        execute('CREATE INDEX IF NOT EXISTS idx_rollup_date ON bookings_rollup(booking_date)')
+        execute('CREATE INDEX IF NOT EXISTS idx_rollup_lane ON bookings_rollup(lane_id, booking_date)')
+        execute('CREATE INDEX IF NOT EXISTS idx_rollup_pol ON bookings_rollup(pol_id, booking_date)')
+        execute('CREATE INDEX IF NOT EXISTS idx_rollup_pod ON bookings_rollup(pod_id, booking_date)')
+        execute('CREATE INDEX IF NOT EXISTS idx_rollup_month ON bookings_rollup(booking_month, booking_date)')
+        for index in ('idx_booking_date', 'idx_lane', 'idx_pol', 'idx_pod'):
+            execute(f'DROP INDEX IF EXISTS {index}')
+        
+        # booking_id is the upsert key for insert_scored_bookings. Databases
+        # created before the unique index only get it once they hold no
+        # duplicate booking_ids; removing those is left to cleanup_database.py
+        if not storage.index_exists(conn, 'idx_booking_id_unique') and not create_booking_id_index(conn):
+            logging.warning(
+                "bookings_scored has duplicate booking_ids, uploads are refused until "
+                "`python cleanup_database.py` removes them"
+            )
+        
+        # Version counter bumped on every write, used to invalidate cached analytics
+        execute('''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        execute(
+            "INSERT INTO table_versions (table_name, version) VALUES ('bookings_scored', 0) "
+            "ON CONFLICT(table_name) DO NOTHING"
+        )
+        if migrated:
+            bump_table_version(conn)
+        
+        # Databases created before the rollup tables get them filled once
+        has_bookings = execute('SELECT 1 FROM bookings_scored LIMIT 1').fetchone() is not None
+        if has_bookings and execute('SELECT 1 FROM bookings_rollup LIMIT 1').fetchone() is None:
+            _rebuild_rollup(conn)
+        if has_bookings and execute('SELECT 1 FROM filter_options LIMIT 1').fetchone() is None:
+            _rebuild_filter_options(conn)
+        
+        # Asynchronous bulk scoring jobs (see services/jobs.py)
+        execute(f'''
+            CREATE TABLE IF NOT EXISTS bulk_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT,
+                input_path TEXT,
+                output_path TEXT,
+                rows_processed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                worker_pid INTEGER,
+                created_at {types['real']},
+                started_at {types['real']},
+                updated_at {types['real']},
+                finished_at {types['real']}
+            )
+        ''')
+        execute('CREATE INDEX IF NOT EXISTS idx_bulk_jobs_status ON bulk_jobs(status)')
+        
+        conn.commit()
+
+
+def create_booking_id_index(conn):
+    """
+    Create the unique booking_id index; False (and nothing changed) while
+    bookings_scored holds duplicate booking_ids.
+    """
+    storage = get_storage()
+    duplicate = storage.execute(
+        conn,
+        'SELECT 1 FROM bookings_scored WHERE booking_id IS NOT NULL '
+        'GROUP BY booking_id HAVING COUNT(*) > 1 LIMIT 1'
+    ).fetchone()
+    if duplicate is not None:
+        return False
+    storage.execute(conn, 'CREATE UNIQUE INDEX IF NOT EXISTS idx_booking_id_unique ON bookings_scored(booking_id)')
+    return True
+
+
+def _scored_table_sql(table, types):
+    """CREATE TABLE statement of bookings_scored (generated columns are added by init_database)."""
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {types['id']},
             booking_id TEXT,
-            booking_date DATE,
-            pol TEXT,
-            pod TEXT,
-            lane TEXT,
-            bundle TEXT,
-            container_state TEXT,
-            cancel_probability REAL,
-            cancel_risk TEXT,
-            broken_route_probability REAL,
-            broken_route_risk TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            booking_date {types['date']},
+            pol_id INTEGER,
+            pod_id INTEGER,
+            lane_id INTEGER,
+            bundle_id INTEGER,
+            container_state_id INTEGER,
+            cancel_probability {types['real']},
+            cancel_risk_id INTEGER,
+            broken_route_probability {types['real']},
+            broken_route_risk_id INTEGER,
+            created_at {types['timestamp']} DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
+    '''
+
+
+def _encode_text_dimensions(conn):
+    """
+    Rewrite a bookings_scored table with TEXT dimension columns into the
+    dictionary-encoded layout, keeping ids. The rollup is dropped and
+    rebuilt by init_database; its keys change too.
+    """
+    storage = get_storage()
     
-    # Create indexes for faster queries
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_booking_date ON bookings_scored(booking_date)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_lane ON bookings_scored(lane)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pol ON bookings_scored(pol)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pod ON bookings_scored(pod)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON bookings_scored(created_at)')
+    distinct = ' UNION '.join(
+        f"SELECT '{dimension}' AS dimension, {column} AS value FROM bookings_scored WHERE {column} IS NOT NULL"
+        for column, dimension in CATEGORICAL_COLUMNS.items()
+    )
+    storage.execute(
+        conn,
+        f"INSERT INTO dimension_values (dimension, value) "
+        f"SELECT dimension, value FROM ({distinct}) distinct_values WHERE 1=1 ORDER BY dimension, value "
+        f"ON CONFLICT(dimension, value) DO NOTHING"
+    )
     
-    conn.commit()
-    conn.close()
+    storage.execute(conn, _scored_table_sql('bookings_scored_encoded', storage.types))
+    plain = ['id', 'booking_id', 'booking_date', 'cancel_probability', 'broken_route_probability', 'created_at']
+    keys = [
+        f"(SELECT id FROM dimension_values WHERE dimension = '{dimension}' AND value = {column})"
+        for column, dimension in CATEGORICAL_COLUMNS.items()
+    ]
+    storage.execute(
+        conn,
+        f"INSERT INTO bookings_scored_encoded ({', '.join(plain + [f'{column}_id' for column in CATEGORICAL_COLUMNS])}) "
+        f"SELECT {', '.join(plain + keys)} FROM bookings_scored ORDER BY bookings_scored.id"
+    )
+    storage.execute(conn, 'DROP TABLE bookings_scored')
+    storage.execute(conn, 'ALTER TABLE bookings_scored_encoded RENAME TO bookings_scored')
+    storage.sync_id_sequence(conn, 'bookings_scored')
+    storage.execute(conn, 'DROP TABLE IF EXISTS bookings_rollup')
+
+
+def get_table_version(table_name='bookings_scored'):
+    """Current write version of a table (changes whenever its rows change)."""
+    storage = get_storage()
+    with storage.connection() as conn:
+        row = storage.execute(
+            conn, 'SELECT version FROM table_versions WHERE table_name = ?', (table_name,)
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def bump_table_version(conn, table_name='bookings_scored'):
+    """Increment a table's version inside the caller's transaction."""
+    get_storage().execute(
+        conn,
+        'INSERT INTO table_versions (table_name, version) VALUES (?, 1) '
+        'ON CONFLICT(table_name) DO UPDATE SET version = table_versions.version + 1',
+        (table_name,)
+    )
+
+
+# Text columns of bookings_scored stored as {column}_id keys into
+# dimension_values, and the dimension (dictionary) each one uses
+CATEGORICAL_COLUMNS = {
+    'pol': 'port',
+    'pod': 'port',
+    'lane': 'lane',
+    'bundle': 'bundle',
+    'container_state': 'container_state',
+    'cancel_risk': 'risk',
+    'broken_route_risk': 'risk',
+}
+
+# Columns written by insert_scored_bookings, in INSERT order
+INSERT_COLUMNS = [
+    'booking_id', 'booking_date', 'pol_id', 'pod_id', 'lane_id', 
+    'bundle_id', 'container_state_id', 'cancel_probability', 
+    'cancel_risk_id', 'broken_route_probability', 
+    'broken_route_risk_id', 'created_at'
+]
+
+
+def _text_values(values):
+    """Non-null values as the text a TEXT column would store."""
+    values = values.astype(object)
+    return values.where(values.isna(), values.astype(str))
+
+
+def _dimension_dictionary(conn=None):
+    """dimension_values as a DataFrame (id, dimension, value), sorted by value."""
+    return get_storage().read_frame(
+        'SELECT id, dimension, value FROM dimension_values ORDER BY dimension, value', conn=conn
+    )
+
+
+def _dimension_keys(df):
+    """
+    {dimension: {value: id}} covering every categorical value in df. New
+    values are committed to dimension_values first, so a failed insert
+    never leaves rows pointing at uncommitted keys.
+    """
+    storage = get_storage()
+    values = {}
+    for column, dimension in CATEGORICAL_COLUMNS.items():
+        if column in df.columns:
+            values.setdefault(dimension, set()).update(_text_values(df[column]).dropna().unique())
+    
+    dictionary = _dimension_dictionary()
+    known = set(zip(dictionary['dimension'], dictionary['value']))
+    missing = [(dimension, value) for dimension in values for value in values[dimension] if (dimension, value) not in known]
+    if missing:
+        with storage.connection() as conn:
+            for dimension, value in sorted(missing):
+                storage.execute(
+                    conn,
+                    'INSERT INTO dimension_values (dimension, value) VALUES (?, ?) '
+                    'ON CONFLICT(dimension, value) DO NOTHING',
+                    (dimension, value)
+                )
+            conn.commit()
+        dictionary = _dimension_dictionary()
+    
+    return {
+        dimension: dict(zip(group['value'], group['id'].astype(int)))
+        for dimension, group in dictionary.groupby('dimension')
+    }
+
+
+def _insert_frame(df, created_at, keys):
+    """df as object columns in INSERT_COLUMNS order, with NaN/NaT as None and dimensions as keys."""
+    sources = {f'{column}_id': column for column in CATEGORICAL_COLUMNS}
+    # Generated booking_ids must not collide with earlier calls' row positions
+    id_prefix = uuid.uuid4().hex[:12]
+    columns = {}
+    for col in INSERT_COLUMNS:
+        name = sources.get(col, col)
+        if col == 'created_at':
+            values = pd.Series(created_at, index=df.index)
+        elif name in df.columns:
+            values = df[name]
+        elif col == 'booking_id':
+            values = id_prefix + '-' + df.index.to_series(index=df.index).astype(str)
+        else:
+            values = pd.Series(None, index=df.index, dtype=object)
+        
+        if name in CATEGORICAL_COLUMNS:
+            values = _text_values(values).map(keys.get(CATEGORICAL_COLUMNS[name], {})).astype('Int64')
+        # Same text format to_sql used for datetimes
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+        values = values.astype(object)
+        columns[col] = values.where(values.notna(), None)
+    
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _dimension_key_sql(dimension, value):
+    """SQL for the dimension_values key of a value (NULL when unknown)."""
+    return f"(SELECT id FROM dimension_values WHERE dimension = '{dimension}' AND value = {value})"
+
+
+def _dimension_value_sql(key):
+    """SQL for the text value of a dimension key column."""
+    return f"(SELECT value FROM dimension_values WHERE id = {key})"
+
+
+def _decode_dimensions(frame, dictionary):
+    """Turn the categorical columns of frame from keys into pandas categoricals, in place."""
+    for column, dimension in CATEGORICAL_COLUMNS.items():
+        if column in frame.columns:
+            values = dictionary[dictionary['dimension'] == dimension]
+            codes = pd.Index(values['id'].astype('int64')).get_indexer(frame[column])
+            frame[column] = pd.Categorical.from_codes(
+                codes, categories=pd.Index(values['value'])
+            ).remove_unused_categories()
+    return frame
 
 
 def insert_scored_bookings(df, replace_duplicates=False):
     """
     Insert scored bookings into database.
     
+    booking_id is unique: rows whose booking_id already exists are skipped
+    (and counted in a warning), or overwrite the stored row when
+    replace_duplicates is True.
+    
     Args:
         df: DataFrame with booking data
         replace_duplicates: If True, replace existing records with same booking_id
+    
+    Returns:
+        Number of rows inserted or replaced
     """
-    conn = sqlite3.connect(DATABASE_PATH)
+    if len(df) == 0:
+        return 0
     
-    # Prepare dataframe
-    df_insert = df.copy()
-    df_insert['created_at'] = datetime.now()
+    if replace_duplicates:
+        on_conflict = 'DO UPDATE SET ' + ', '.join(
+            f"{col} = excluded.{col}" for col in INSERT_COLUMNS if col != 'booking_id'
+        )
+    else:
+        on_conflict = 'DO NOTHING'
     
-    # Select only required columns
-    columns = [
-        'booking_id', 'booking_date', 'pol', 'pod', 'lane', 
-        'bundle', 'container_state', 'cancel_probability', 
-        'cancel_risk', 'broken_route_probability', 
-        'broken_route_risk', 'created_at'
-    ]
+    storage = get_storage()
+    store = get_columnar_store()
+    created_at = datetime.now().isoformat(sep=' ')
+    frame = _insert_frame(df, created_at, _dimension_keys(df))
+    with storage.connection() as conn:
+        if not storage.index_exists(conn, 'idx_booking_id_unique'):
+            raise RuntimeError(
+                "bookings_scored has duplicate booking_ids from before they were unique; "
+                "run `python cleanup_database.py` first"
+            )
+        if store is not None:
+            max_id = storage.execute(conn, 'SELECT COALESCE(MAX(id), 0) FROM bookings_scored').fetchone()[0]
+        
+        if replace_duplicates:
+            # Take the rows about to be overwritten out of the rollup
+            booking_ids = frame['booking_id'].dropna().unique().tolist()
+            for start in range(0, len(booking_ids), ROLLUP_ID_BATCH_SIZE):
+                batch = booking_ids[start:start + ROLLUP_ID_BATCH_SIZE]
+                where = f"booking_id IN ({', '.join('?' * len(batch))})"
+                _update_rollup(conn, where, batch, sign=-1)
+                _update_filter_options(conn, where, batch, sign=-1)
+        
+        written = storage.bulk_insert(conn, 'bookings_scored', frame, 'booking_id', on_conflict)
+        if not replace_duplicates and written < len(frame):
+            logging.warning(f"Skipped {len(frame) - written} bookings whose booking_id is already stored")
+        if written:
+            # Every row written by this call carries its created_at stamp
+            _update_rollup(conn, 'created_at = ?', (created_at,))
+            _update_filter_options(conn, 'created_at = ?', (created_at,))
+            bump_table_version(conn)
+        if replace_duplicates:
+            storage.execute(conn, 'DELETE FROM bookings_rollup WHERE bookings = 0')
+            storage.execute(conn, 'DELETE FROM filter_options WHERE bookings = 0')
+        
+        try:
+            if written and store is not None and store.available():
+                touched = _decode_dimensions(storage.read_frame(
+                    f"SELECT {_scored_select(SCORED_COLUMNS)} FROM bookings_scored WHERE created_at = ? ORDER BY id",
+                    (created_at,), conn=conn
+                ), _dimension_dictionary(conn))
+                store.upsert(touched, replaced_ids=touched.loc[touched['id'] <= max_id, 'booking_id'].dropna())
+            conn.commit()
+        except Exception as e:
+            if store is not None:
+                store.invalidate(f"insert_scored_bookings failed: {e}")
+            raise
     
-    # Handle missing columns
-    for col in columns:
-        if col not in df_insert.columns:
-            if col == 'booking_id':
-                df_insert[col] = df_insert.index.astype(str)
-            elif col == 'created_at':
-                df_insert[col] = datetime.now()
-            else:
-                df_insert[col] = None
-    
-    df_insert = df_insert[columns]
-    
-    # Remove duplicates if replace_duplicates is True
-    if replace_duplicates and 'booking_id' in df_insert.columns:
-        # Get existing booking_ids
-        cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT booking_id FROM bookings_scored WHERE booking_id IS NOT NULL')
-        existing_ids = {row[0] for row in cursor.fetchall()}
-        
-        # Remove rows that already exist
-        if existing_ids:
-            df_insert = df_insert[~df_insert['booking_id'].isin(existing_ids)]
-    
-    # Insert into database
-    if len(df_insert) > 0:
-        df_insert.to_sql('bookings_scored', conn, if_exists='append', index=False)
+    return written
+
+
+# Dimensions of bookings_rollup; filters on booking_date, lane, pol and pod
+# apply to it unchanged
+ROLLUP_KEYS = ['booking_date', 'lane_id', 'pol_id', 'pod_id', 'container_state_id']
+
+# Rollup columns and their aggregate over bookings_scored rows
+ROLLUP_COLUMNS = {
+    'bookings': 'COUNT(*)',
+    'booking_ids': 'COUNT(booking_id)',
+    'cancel_probability_sum': 'COALESCE(SUM(cancel_probability), 0)',
+    'cancel_probability_count': 'COUNT(cancel_probability)',
+    'broken_route_probability_sum': 'COALESCE(SUM(broken_route_probability), 0)',
+    'broken_route_probability_count': 'COUNT(broken_route_probability)',
+    'cancel_high': "SUM(CASE WHEN cancel_risk_id = {high} THEN 1 ELSE 0 END)",
+    'cancel_medium': "SUM(CASE WHEN cancel_risk_id = {medium} THEN 1 ELSE 0 END)",
+    'cancel_low': "SUM(CASE WHEN cancel_risk_id = {low} THEN 1 ELSE 0 END)",
+}
+
+# Metrics that can be read back from the rollup
+ROLLUP_METRICS = {
+    'bookings': 'SUM(bookings)',
+    'booking_ids': 'SUM(booking_ids)',
+    'cancel_probability': 'SUM(cancel_probability_sum) / NULLIF(SUM(cancel_probability_count), 0)',
+    'cancel_probability_sum': 'SUM(cancel_probability_sum)',
+    'cancel_probability_count': 'SUM(cancel_probability_count)',
+    'broken_route_probability': 'SUM(broken_route_probability_sum) / NULLIF(SUM(broken_route_probability_count), 0)',
+    'high_risk': 'SUM(cancel_high)',
+    'medium_risk': 'SUM(cancel_medium)',
+    'low_risk': 'SUM(cancel_low)',
+}
+
+# Filters the rollup can answer (all of _build_filter_clause)
+ROLLUP_FILTERS = {'start_date', 'end_date', 'lane', 'pol', 'pod', 'month', 'year'}
+
+# booking_ids bound per statement when replaced rows leave the rollup
+ROLLUP_ID_BATCH_SIZE = 500
+
+
+def _rollup_key_sql():
+    """
+    Unique key of bookings_rollup. NULLs never conflict, so NULL keys are
+    coalesced (dimension ids start at 1, the date to storage.null_date).
+    """
+    null_date = get_storage().null_date
+    return ', '.join(f"(COALESCE({key}, {null_date if key == 'booking_date' else 0}))" for key in ROLLUP_KEYS)
+
+
+def _update_rollup(conn, where, params=(), sign=1):
+    """Add (sign=1) or subtract (sign=-1) the bookings_scored rows matching where."""
+    keys = ', '.join(ROLLUP_KEYS)
+    columns = ', '.join(ROLLUP_COLUMNS)
+    risk_keys = {level.lower(): _dimension_key_sql('risk', f"'{level}'") for level in ('High', 'Medium', 'Low')}
+    values = ', '.join(f"{sign} * {expression.format(**risk_keys)}" for expression in ROLLUP_COLUMNS.values())
+    updates = ', '.join(f"{column} = bookings_rollup.{column} + excluded.{column}" for column in ROLLUP_COLUMNS)
+    get_storage().execute(
+        conn,
+        f"INSERT INTO bookings_rollup ({keys}, {columns}) "
+        f"SELECT {keys}, {values} FROM bookings_scored WHERE {where} GROUP BY {keys} "
+        f"ON CONFLICT({_rollup_key_sql()}) DO UPDATE SET {updates}",
+        params
+    )
+
+
+def _rebuild_rollup(conn):
+    storage = get_storage()
+    storage.execute(conn, 'DELETE FROM bookings_rollup')
+    _update_rollup(conn, '1=1')
+    return storage.execute(conn, 'SELECT COUNT(*) FROM bookings_rollup').fetchone()[0]
+
+
+# Filter dimension -> (bookings_scored column, its value as text); years
+# use the generated booking_year column
+FILTER_DIMENSIONS = {
+    'lane': ('lane_id', _dimension_value_sql('lane_id')),
+    'pol': ('pol_id', _dimension_value_sql('pol_id')),
+    'pod': ('pod_id', _dimension_value_sql('pod_id')),
+    'year': ('booking_year', 'CAST(booking_year AS TEXT)'),
+}
+
+
+def _update_filter_options(conn, where, params=(), sign=1):
+    """Add (sign=1) or subtract (sign=-1) the bookings_scored rows matching where."""
+    selects = ' UNION ALL '.join(
+        f"SELECT '{dimension}' AS dimension, {value} AS value, {sign} * COUNT(*) AS bookings "
+        f"FROM bookings_scored WHERE ({where}) AND {column} IS NOT NULL GROUP BY {column}"
+        for dimension, (column, value) in FILTER_DIMENSIONS.items()
+    )
+    # WHERE 1=1 keeps SQLite from parsing ON CONFLICT as a join constraint
+    get_storage().execute(
+        conn,
+        f"INSERT INTO filter_options (dimension, value, bookings) "
+        f"SELECT dimension, value, bookings FROM ({selects}) counts WHERE 1=1 "
+        f"ON CONFLICT(dimension, value) DO UPDATE SET bookings = filter_options.bookings + excluded.bookings",
+        list(params) * len(FILTER_DIMENSIONS)
+    )
+
+
+def _rebuild_filter_options(conn):
+    storage = get_storage()
+    storage.execute(conn, 'DELETE FROM filter_options')
+    _update_filter_options(conn, '1=1')
+
+
+def rebuild_rollups():
+    """
+    Recompute bookings_rollup and filter_options from bookings_scored;
+    returns the number of rollup groups.
+    """
+    storage = get_storage()
+    with storage.connection() as conn:
+        groups = _rebuild_rollup(conn)
+        _rebuild_filter_options(conn)
+        bump_table_version(conn)
         conn.commit()
-    
-    conn.close()
+    return groups
 
 
-def query_scored_bookings(filters=None):
-    """Query scored bookings with optional filters."""
-    conn = sqlite3.connect(DATABASE_PATH)
-    
-    query = "SELECT * FROM bookings_scored WHERE 1=1"
+def rollup_supports(filters=None):
+    """Whether aggregate_rollup can apply every given filter."""
+    return all(key in ROLLUP_FILTERS for key, value in (filters or {}).items() if value)
+
+
+def _month_start(year, month):
+    """'YYYY-MM-01' for a month, rolling over past December."""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return f"{year:04d}-{month:02d}-01"
+
+
+def _build_filter_clause(filters=None):
+    """
+    Build the WHERE clause and parameters for dashboard filters.
+    Year and month become booking_date ranges (or the indexed booking_month
+    column for a month in any year), so every filter can use an index.
+    """
+    query = " WHERE 1=1"
     params = []
     
     if filters:
@@ -116,59 +591,316 @@ def query_scored_bookings(filters=None):
         if filters.get('end_date'):
             query += " AND booking_date <= ?"
             params.append(filters['end_date'])
-        if filters.get('lane'):
-            query += " AND lane = ?"
-            params.append(filters['lane'])
-        if filters.get('pol'):
-            query += " AND pol = ?"
-            params.append(filters['pol'])
-        if filters.get('pod'):
-            query += " AND pod = ?"
-            params.append(filters['pod'])
-        if filters.get('month'):
-            query += " AND strftime('%m', booking_date) = ?"
-            params.append(f"{int(filters['month']):02d}")
-        if filters.get('year'):
-            query += " AND strftime('%Y', booking_date) = ?"
-            params.append(str(filters['year']))
-    
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    
-    return df
+        for column in ('lane', 'pol', 'pod'):
+            if filters.get(column):
+                query += f" AND {column}_id = {_dimension_key_sql(CATEGORICAL_COLUMNS[column], '?')}"
+                params.append(str(filters[column]))
+        
+        month = int(filters['month']) if filters.get('month') else None
+        year = int(filters['year']) if filters.get('year') else None
+        valid_month = month is not None and 1 <= month <= 12
+        if year is not None:
+            first, last = (month, month + 1) if valid_month else (1, 13)
+            query += " AND booking_date >= ? AND booking_date < ?"
+            params.extend([_month_start(year, first), _month_start(year, last)])
+        if month is not None and (year is None or not valid_month):
+            query += " AND booking_month = ?"
+            params.append(month)
+    
+    return query, params
+
+
+# Columns of bookings_scored that can be selected
+SCORED_COLUMNS = [
+    'id', 'booking_id', 'booking_date', 'pol', 'pod', 'lane', 'bundle',
+    'container_state', 'cancel_probability', 'cancel_risk',
+    'broken_route_probability', 'broken_route_risk', 'created_at'
+]
+
+
+def scored_bookings_query(filters=None, columns=None):
+    """SQL and parameters of query_scored_bookings."""
+    columns = list(columns) if columns else SCORED_COLUMNS
+    for column in columns:
+        if column not in SCORED_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+    
+    where, params = _build_filter_clause(filters)
+    return f"SELECT {_scored_select(columns)} FROM bookings_scored" + where, params
+
+
+def _scored_select(columns):
+    # Categorical columns are read as keys and decoded in pandas
+    return ', '.join(f"{column}_id AS {column}" if column in CATEGORICAL_COLUMNS else column for column in columns)
+
+
+def query_scored_bookings(filters=None, columns=None):
+    """
+    Query scored bookings with optional filters, selecting only columns if
+    given. Dimension columns (CATEGORICAL_COLUMNS) come back as pandas
+    categoricals.
+    """
+    query, params = scored_bookings_query(filters, columns)
+    storage = get_storage()
+    with storage.connection() as conn:
+        return _decode_dimensions(storage.read_frame(query, params, conn=conn), _dimension_dictionary(conn))
+
+
+def iter_scored_bookings(filters=None, columns=None):
+    """query_scored_bookings in DataFrame chunks (for full-table reads)."""
+    query, params = scored_bookings_query(filters, columns)
+    dictionary = _dimension_dictionary()
+    for chunk in get_storage().read_frames(query, params):
+        yield _decode_dimensions(chunk, dictionary)
+
+
+# Columns and derived expressions that can be grouped on; tuples are
+# (date part, column) rendered by the storage engine
+GROUP_EXPRESSIONS = {
+    'booking_id': 'booking_id',
+    'booking_date': 'booking_date',
+    'booking_day': ('day', 'booking_date'),
+    'pol': 'pol_id',
+    'pod': 'pod_id',
+    'lane': 'lane_id',
+    'bundle': 'bundle_id',
+    'container_state': 'container_state_id',
+    'cancel_risk': 'cancel_risk_id',
+    'broken_route_risk': 'broken_route_risk_id',
+}
+
+# Aggregate functions allowed in metrics
+AGGREGATE_FUNCTIONS = {
+    'count': 'COUNT({})',
+    'count_distinct': 'COUNT(DISTINCT {})',
+    'sum': 'SUM({})',
+    'avg': 'AVG({})',
+    'min': 'MIN({})',
+    'max': 'MAX({})',
+}
+
+AGGREGATE_COLUMNS = {
+    'id', 'booking_id', 'booking_date', 'pol', 'pod', 'lane', 'bundle',
+    'container_state', 'cancel_probability', 'cancel_risk',
+    'broken_route_probability', 'broken_route_risk', '*'
+}
+
+
+def scored_bookings_aggregate_query(filters=None, group_by=None, metrics=None, order_by=None, limit=None):
+    """SQL and parameters of aggregate_scored_bookings."""
+    group_by = list(group_by or [])
+    metrics = metrics or {'count': ('count', '*')}
+    
+    aggregates = {}
+    for alias, (func, column) in metrics.items():
+        if func not in AGGREGATE_FUNCTIONS or column not in AGGREGATE_COLUMNS or not alias.isidentifier():
+            raise ValueError(f"Invalid metric: {alias}")
+        aggregates[alias] = AGGREGATE_FUNCTIONS[func].format(column)
+    
+    return _grouped_query('bookings_scored', GROUP_EXPRESSIONS, filters, group_by, aggregates, order_by, limit)
+
+
+def _grouped_query(table, group_expressions, filters, group_by, aggregates, order_by, limit):
+    """GROUP BY query over table; aggregates maps output column -> SQL aggregate."""
+    storage = get_storage()
+    
+    expressions = {}
+    for key in group_by:
+        if key not in group_expressions:
+            raise ValueError(f"Cannot group by: {key}")
+        expression = group_expressions[key]
+        expressions[key] = storage.date_part(*expression) if isinstance(expression, tuple) else expression
+    
+    select = []
+    for key in group_by:
+        expression = expressions[key]
+        if key in CATEGORICAL_COLUMNS:
+            # Dimension keys are grouped on and decoded once per group
+            expression = _dimension_value_sql(f"{table}.{expression}")
+        select.append(f"{expression} AS {key}")
+    select += [f"{aggregate} AS {alias}" for alias, aggregate in aggregates.items()]
+    
+    where, params = _build_filter_clause(filters)
+    for key in group_by:
+        where += f" AND {expressions[key]} IS NOT NULL"
+    
+    query = f"SELECT {', '.join(select)} FROM {table}" + where
+    if group_by:
+        query += " GROUP BY " + ", ".join(expressions[key] for key in group_by)
+    
+    if order_by:
+        terms = []
+        for key in order_by:
+            column = key.lstrip('-')
+            if column not in group_by and column not in aggregates:
+                raise ValueError(f"Cannot order by: {column}")
+            terms.append(f"{column} DESC" if key.startswith('-') else column)
+        query += " ORDER BY " + ", ".join(terms)
+    
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    
+    return query, params
+
+
+def aggregate_scored_bookings(filters=None, group_by=None, metrics=None, order_by=None, limit=None):
+    """
+    Aggregate scored bookings in SQL so only grouped rows are returned.
+    
+    Args:
+        filters: Same filters as query_scored_bookings
+        group_by: List of keys from GROUP_EXPRESSIONS (rows with NULL keys are skipped)
+        metrics: Dict of output column -> (function, column), e.g.
+            {'cancel_probability': ('avg', 'cancel_probability'), 'id': ('count', 'id')}
+        order_by: List of output columns, prefix with '-' for descending
+        limit: Maximum number of groups to return
+    
+    Returns:
+        DataFrame with one row per group
+    """
+    query, params = scored_bookings_aggregate_query(filters, group_by, metrics, order_by, limit)
+    return get_storage().read_frame(query, params)
+
+
+# Rollup dimensions that can be grouped on
+ROLLUP_GROUP_EXPRESSIONS = {
+    key: GROUP_EXPRESSIONS[key]
+    for key in ('booking_date', 'booking_day', 'lane', 'pol', 'pod', 'container_state')
+}
+
+
+def rollup_aggregate_query(filters=None, group_by=None, metrics=None, order_by=None, limit=None):
+    """SQL and parameters of aggregate_rollup."""
+    group_by = list(group_by or [])
+    metrics = metrics or {'count': 'bookings'}
+    
+    aggregates = {}
+    for alias, metric in metrics.items():
+        if metric not in ROLLUP_METRICS or not alias.isidentifier():
+            raise ValueError(f"Invalid metric: {alias}")
+        aggregates[alias] = ROLLUP_METRICS[metric]
+    
+    return _grouped_query('bookings_rollup', ROLLUP_GROUP_EXPRESSIONS, filters, group_by, aggregates, order_by, limit)
+
+
+def aggregate_rollup(filters=None, group_by=None, metrics=None, order_by=None, limit=None):
+    """
+    Aggregate bookings_rollup; the cost depends on the number of groups,
+    not bookings. Use when rollup_supports(filters).
+    
+    Args:
+        filters: Same filters as query_scored_bookings
+        group_by: List of keys from ROLLUP_GROUP_EXPRESSIONS
+        metrics: Dict of output column -> key of ROLLUP_METRICS, e.g.
+            {'cancel_probability': 'cancel_probability', 'id': 'bookings'}
+        order_by: List of output columns, prefix with '-' for descending
+        limit: Maximum number of groups to return
+    
+    Returns:
+        DataFrame with one row per group
+    """
+    query, params = rollup_aggregate_query(filters, group_by, metrics, order_by, limit)
+    return get_storage().read_frame(query, params)
 
 
 def get_filter_options():
-    """Get available filter options from database."""
-    conn = sqlite3.connect(DATABASE_PATH)
-    
-    options = {
-        'lanes': pd.read_sql_query(
-            "SELECT DISTINCT lane FROM bookings_scored WHERE lane IS NOT NULL ORDER BY lane", 
-            conn
-        )['lane'].tolist(),
-        'pols': pd.read_sql_query(
-            "SELECT DISTINCT pol FROM bookings_scored WHERE pol IS NOT NULL ORDER BY pol", 
-            conn
-        )['pol'].tolist(),
-        'pods': pd.read_sql_query(
-            "SELECT DISTINCT pod FROM bookings_scored WHERE pod IS NOT NULL ORDER BY pod", 
-            conn
-        )['pod'].tolist(),
-        'years': pd.read_sql_query(
-            "SELECT DISTINCT strftime('%Y', booking_date) as year FROM bookings_scored ORDER BY year DESC", 
-            conn
-        )['year'].tolist(),
-    }
+    """
+    Get available filter options from the filter_options table: sorted
+    lanes, pols and pods, years newest first, and per-value booking counts.
+    """
+    rows = get_storage().read_frame('SELECT dimension, value, bookings FROM filter_options WHERE bookings > 0')
+    
+    options = {}
+    counts = {}
+    for dimension, key in (('lane', 'lanes'), ('pol', 'pols'), ('pod', 'pods'), ('year', 'years')):
+        values = rows[rows['dimension'] == dimension].sort_values('value', ascending=(dimension != 'year'))
+        options[key] = values['value'].tolist()
+        counts[key] = dict(zip(values['value'], values['bookings'].astype(int).tolist()))
+    options['counts'] = counts
     
-    conn.close()
     return options
 
 
 def clear_database():
     """Clear all records from bookings_scored."""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM bookings_scored')
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    storage = get_storage()
+    with storage.connection() as conn:
+        storage.execute(conn, 'DELETE FROM bookings_scored')
+        storage.execute(conn, 'DELETE FROM bookings_rollup')
+        storage.execute(conn, 'DELETE FROM filter_options')
+        bump_table_version(conn)
+        conn.commit()
+    
+    store = get_columnar_store()
+    if store is not None:
+        store.clear()
+
+
+def create_bulk_job(job_id, filename, input_path, output_path):
+    """Record a new queued bulk scoring job."""
+    now = time.time()
+    storage = get_storage()
+    with storage.connection() as conn:
+        storage.execute(
+            conn,
+            'INSERT INTO bulk_jobs (id, status, filename, input_path, output_path, created_at, updated_at) '
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, filename, input_path, output_path, now, now)
+        )
+        conn.commit()
+
+
+def claim_bulk_job(job_id, worker_pid):
+    """Atomically move a queued job to running; False if another worker has it."""
+    now = time.time()
+    storage = get_storage()
+    with storage.connection() as conn:
+        cursor = storage.execute(
+            conn,
+            "UPDATE bulk_jobs SET status = 'running', worker_pid = ?, rows_processed = 0, "
+            "started_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+            (worker_pid, now, now, job_id)
+        )
+        conn.commit()
+    return cursor.rowcount == 1
+
+
+def update_bulk_job(job_id, **fields):
+    """Update job columns (status, rows_processed, error, finished_at, ...)."""
+    fields['updated_at'] = time.time()
+    columns = ', '.join(f"{column} = ?" for column in fields)
+    storage = get_storage()
+    with storage.connection() as conn:
+        storage.execute(conn, f'UPDATE bulk_jobs SET {columns} WHERE id = ?', list(fields.values()) + [job_id])
+        conn.commit()
+
+
+def get_bulk_job(job_id):
+    """Job row as a dict, or None."""
+    storage = get_storage()
+    with storage.connection() as conn:
+        cursor = storage.execute(conn, 'SELECT * FROM bulk_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        columns = [column[0] for column in cursor.description]
+    return dict(zip(columns, row)) if row else None
+
+
+def requeue_stale_bulk_jobs(stale_seconds):
+    """
+    Re-queue running jobs whose worker stopped reporting progress and return
+    the ids of every queued job.
+    """
+    storage = get_storage()
+    with storage.connection() as conn:
+        storage.execute(
+            conn,
+            "UPDATE bulk_jobs SET status = 'queued', worker_pid = NULL "
+            "WHERE status = 'running' AND updated_at < ?",
+            (time.time() - stale_seconds,)
+        )
+        conn.commit()
+        job_ids = [row[0] for row in storage.execute(
+            conn, "SELECT id FROM bulk_jobs WHERE status = 'queued' ORDER BY created_at"
+        ).fetchall()]
+    return job_ids
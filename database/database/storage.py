@@ -0,0 +1,278 @@
+# ============================================================================
+# FILE: database/storage.py
+# ============================================================================
+"""
+Storage engines for the bookings database.
+models.py writes portable SQL with '?' placeholders; an engine supplies the
+connections, dialect-specific expressions and the bulk load/read paths.
+SQLite is the default; PostgreSQL is selected through config.py
+(ProductionConfig with a DATABASE_URL) and removes SQLite's single-writer
+bottleneck.
+"""
+from urllib.parse import urlsplit, urlunsplit
+from functools import partial
+import threading
+import io
+import os
+import pandas as pd
+
+from database.database.connection import get_pool
+
+# Rows bound per executemany call / fetched per server-side cursor round trip
+WRITE_BATCH_SIZE = 50000
+READ_BATCH_SIZE = 50000
+
+
+class SQLiteStorage:
+    """Local SQLite file, pooled per worker in WAL mode."""
+    
+    name = 'sqlite'
+    
+    # Column types used by the schema in models.init_database
+    types = {
+        'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'real': 'REAL',
+        'date': 'DATE',
+        'timestamp': 'TIMESTAMP',
+        # Columns added to existing tables can only be virtual; indexes store their values
+        'generated': 'INTEGER GENERATED ALWAYS AS ({}) VIRTUAL',
+    }
+    
+    # Date literal standing in for NULL dates in unique keys
+    null_date = "'0001-01-01'"
+    
+    def __init__(self, path):
+        self.path = path
+        self.pool = get_pool(path)
+    
+    def connection(self):
+        """Borrow a pooled connection (use as a context manager)."""
+        return self.pool.connection()
+    
+    def execute(self, conn, query, params=()):
+        return conn.execute(query, params)
+    
+    def date_part(self, part, column):
+        """Zero-padded text of a date part: 'year', 'month' or 'day' (YYYY-MM-DD)."""
+        formats = {'year': '%Y', 'month': '%m'}
+        if part == 'day':
+            return f"date({column})"
+        return f"strftime('{formats[part]}', {column})"
+    
+    def date_number(self, part, column):
+        """Integer 'year' or 'month' of a date, usable in generated columns."""
+        return f"CAST({self.date_part(part, column)} AS INTEGER)"
+    
+    def index_exists(self, conn, name):
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+        ).fetchone() is not None
+    
+    def column_exists(self, conn, table, column):
+        # table_xinfo also lists generated columns
+        return any(row[1] == column for row in conn.execute(f"PRAGMA table_xinfo({table})"))
+    
+    def sync_id_sequence(self, conn, table):
+        """Continue table's id sequence after its largest id (AUTOINCREMENT already does)."""
+    
+    def bulk_insert(self, conn, table, frame, conflict_target, on_conflict):
+        """executemany over frame's rows; returns the number of rows written."""
+        columns = list(frame.columns)
+        query = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT({conflict_target}) {on_conflict}"
+        )
+        changes_before = conn.total_changes
+        for start in range(0, len(frame), WRITE_BATCH_SIZE):
+            batch = frame.iloc[start:start + WRITE_BATCH_SIZE]
+            conn.executemany(query, list(zip(*(batch[col].tolist() for col in columns))))
+        return conn.total_changes - changes_before
+    
+    def read_frames(self, query, params=(), chunksize=READ_BATCH_SIZE):
+        """Yield the result in DataFrame chunks."""
+        with self.connection() as conn:
+            yield from pd.read_sql_query(query, conn, params=list(params), chunksize=chunksize)
+    
+    def read_frame(self, query, params=(), conn=None):
+        """The result as one DataFrame, read on conn (e.g. inside a write) or a pooled connection."""
+        if conn is not None:
+            return pd.read_sql_query(query, conn, params=list(params))
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=list(params))
+
+
+class PostgresStorage:
+    """
+    PostgreSQL via psycopg2: pooled connections, COPY for bulk loads and
+    server-side cursors for large reads.
+    """
+    
+    name = 'postgresql'
+    
+    types = {
+        'id': 'BIGSERIAL PRIMARY KEY',
+        'real': 'DOUBLE PRECISION',
+        'date': 'TIMESTAMP',
+        'timestamp': 'TIMESTAMP',
+        'generated': 'INTEGER GENERATED ALWAYS AS ({}) STORED',
+    }
+    
+    null_date = "TIMESTAMP '0001-01-01'"
+    
+    def __init__(self, url):
+        try:
+            import psycopg2
+        except ImportError:
+            raise ImportError("The postgresql storage engine requires the 'psycopg2' package")
+        
+        self.url = url
+        # Pool stats are served over the API, so keep the password out of the name
+        parts = urlsplit(url)
+        if '@' in parts.netloc:
+            userinfo, host = parts.netloc.rsplit('@', 1)
+            parts = parts._replace(netloc=f"{userinfo.split(':')[0]}@{host}")
+        self.pool = get_pool(urlunsplit(parts), connect=partial(psycopg2.connect, url))
+        self._cursor_ids = iter(range(1, 1 << 62))
+        self._lock = threading.Lock()
+    
+    def connection(self):
+        """Borrow a pooled connection (use as a context manager)."""
+        return self.pool.connection()
+    
+    @staticmethod
+    def _translate(query):
+        # models.py uses qmark placeholders; psycopg2 uses pyformat
+        return query.replace('%', '%%').replace('?', '%s')
+    
+    def execute(self, conn, query, params=()):
+        cursor = conn.cursor()
+        cursor.execute(self._translate(query), tuple(params))
+        return cursor
+    
+    def date_part(self, part, column):
+        """Zero-padded text of a date part: 'year', 'month' or 'day' (YYYY-MM-DD)."""
+        formats = {'year': 'YYYY', 'month': 'MM', 'day': 'YYYY-MM-DD'}
+        return f"to_char({column}, '{formats[part]}')"
+    
+    def date_number(self, part, column):
+        """Integer 'year' or 'month' of a date, usable in generated columns."""
+        return f"CAST(EXTRACT({part.upper()} FROM {column}) AS INTEGER)"
+    
+    def index_exists(self, conn, name):
+        return self.execute(conn, 'SELECT to_regclass(?)', (name,)).fetchone()[0] is not None
+    
+    def column_exists(self, conn, table, column):
+        return self.execute(
+            conn,
+            'SELECT 1 FROM information_schema.columns '
+            'WHERE table_schema = current_schema() AND table_name = ? AND column_name = ?',
+            (table, column)
+        ).fetchone() is not None
+    
+    def sync_id_sequence(self, conn, table):
+        """Continue table's id sequence after its largest id (after copying rows with their ids)."""
+        self.execute(
+            conn, f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), MAX(id)) FROM {table}"
+        )
+    
+    def bulk_insert(self, conn, table, frame, conflict_target, on_conflict):
+        """
+        COPY frame into a staging table, then upsert it in one statement;
+        returns the number of rows written. Within the batch, the last row
+        per key wins for DO UPDATE and the first for DO NOTHING, as with
+        row-by-row inserts.
+        """
+        columns = list(frame.columns)
+        column_list = ', '.join(columns)
+        cursor = conn.cursor()
+        cursor.execute(
+            f"CREATE TEMP TABLE {table}_staging ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        cursor.execute(f"ALTER TABLE {table}_staging ADD COLUMN seq BIGSERIAL")
+        
+        buffer = io.StringIO()
+        frame.to_csv(buffer, header=False, index=False, na_rep='\\N')
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table}_staging ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+        
+        order = 'DESC' if on_conflict.startswith('DO UPDATE') else 'ASC'
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) "
+            f"SELECT {column_list} FROM ("
+            f"SELECT DISTINCT ON (COALESCE({conflict_target}::text, seq::text)) * FROM {table}_staging "
+            f"ORDER BY COALESCE({conflict_target}::text, seq::text), seq {order}"
+            f") staged ORDER BY seq ON CONFLICT({conflict_target}) {self._translate(on_conflict)}"
+        )
+        return cursor.rowcount
+    
+    def _fetch_frames(self, conn, query, params, chunksize):
+        with self._lock:
+            cursor_name = f'read_{next(self._cursor_ids)}'
+        
+        with conn.cursor(name=cursor_name) as cursor:
+            cursor.itersize = chunksize
+            cursor.execute(self._translate(query), tuple(params))
+            rows = cursor.fetchmany(chunksize)
+            columns = [column[0] for column in cursor.description]
+            if not rows:
+                yield pd.DataFrame([], columns=columns)
+            while rows:
+                yield pd.DataFrame(rows, columns=columns)
+                rows = cursor.fetchmany(chunksize)
+    
+    def read_frames(self, query, params=(), chunksize=READ_BATCH_SIZE):
+        """Yield the result in DataFrame chunks from a server-side cursor."""
+        with self.connection() as conn:
+            yield from self._fetch_frames(conn, query, params, chunksize)
+    
+    def read_frame(self, query, params=(), conn=None):
+        """The result as one DataFrame, read on conn (e.g. inside a write) or a pooled connection."""
+        if conn is not None:
+            return pd.concat(list(self._fetch_frames(conn, query, params, READ_BATCH_SIZE)), ignore_index=True)
+        return pd.concat(list(self.read_frames(query, params)), ignore_index=True)
+
+
+def create_storage(engine=None, url=None, path=None):
+    """
+    Build a storage engine: 'sqlite' (a file at path) or 'postgresql' (a
+    connection URL). Without arguments the engine and URL come from the
+    config.py class selected by FLASK_ENV (STORAGE_ENGINE, DATABASE_URL).
+    """
+    from database.database.models import DATABASE_PATH
+    
+    if engine is None:
+        from config import config
+        settings = config.get(os.environ.get('FLASK_ENV', 'default'), config['default'])
+        engine = settings.STORAGE_ENGINE
+        url = url or settings.DATABASE_URL
+    
+    engine = engine.lower()
+    if engine == 'sqlite':
+        return SQLiteStorage(path or DATABASE_PATH)
+    if engine in ('postgresql', 'postgres'):
+        if not url:
+            raise ValueError("The postgresql storage engine requires DATABASE_URL")
+        return PostgresStorage(url)
+    raise ValueError(f"Unknown storage engine: {engine}")
+
+
+_storage = None
+
+
+def get_storage():
+    """Process-wide storage engine (built from config.py on first use)."""
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def configure_storage(engine=None, url=None, path=None):
+    """Replace the storage engine for this process (scripts, benchmarks)."""
+    global _storage
+    _storage = create_storage(engine, url, path)
+    return _storage
@@ -0,0 +1,148 @@
+# ============================================================================
+# FILE: fixtures.py
+# ============================================================================
+"""
+Synthetic bookings, the pre-encoding bookings_scored schema and the
+per-cell widget loops the vectorized widgets replaced, shared by the tests
+and benchmark.py.
+"""
+from datetime import datetime
+import sqlite3
+import numpy as np
+import pandas as pd
+
+
+def synthetic_bookings(n_rows, cardinality, seed=42):
+    """Bookings with `cardinality` distinct ports and lanes."""
+    rng = np.random.default_rng(seed)
+    ports = [f'PORT_{i}' for i in range(cardinality)]
+    lanes = [f'LANE_{i}' for i in range(cardinality)]
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, n_rows), unit='D')
+    return pd.DataFrame({
+        'pol': rng.choice(ports, n_rows),
+        'pod': rng.choice(ports, n_rows),
+        'lane': rng.choice(lanes, n_rows),
+        'container_state': rng.choice(['FCL', 'LCL', 'EMPTY'], n_rows),
+        'bundle': rng.choice(['STANDARD', 'PREMIUM', 'EXPRESS', 'ECO'], n_rows),
+        'booking_date': dates,
+    })
+
+
+def scored_bookings(n_rows, seed=42):
+    """Synthetic frame shaped like UnifiedPredictor.predict_bookings output."""
+    rng = np.random.default_rng(seed)
+    df = synthetic_bookings(n_rows, cardinality=50, seed=seed)
+    df.insert(0, 'booking_id', [f'BK{i:08d}' for i in range(n_rows)])
+    for target in ('cancel', 'broken_route'):
+        df[f'{target}_probability'] = rng.random(n_rows)
+        df[f'{target}_risk'] = pd.cut(df[f'{target}_probability'], [0, 0.33, 0.66, 1], labels=['Low', 'Medium', 'High'])
+    return df
+
+
+# bookings_scored as it was before dictionary encoding, with its indexes
+LEGACY_SCORED_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS bookings_scored (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, booking_id TEXT, booking_date DATE,
+        pol TEXT, pod TEXT, lane TEXT, bundle TEXT, container_state TEXT,
+        cancel_probability REAL, cancel_risk TEXT, broken_route_probability REAL,
+        broken_route_risk TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        booking_year INTEGER GENERATED ALWAYS AS (CAST(strftime('%Y', booking_date) AS INTEGER)) VIRTUAL,
+        booking_month INTEGER GENERATED ALWAYS AS (CAST(strftime('%m', booking_date) AS INTEGER)) VIRTUAL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_date_cover ON bookings_scored(booking_date, cancel_probability, cancel_risk)',
+    'CREATE INDEX IF NOT EXISTS idx_lane_date ON bookings_scored(lane, booking_date, cancel_probability)',
+    'CREATE INDEX IF NOT EXISTS idx_pol_date ON bookings_scored(pol, booking_date, cancel_probability)',
+    'CREATE INDEX IF NOT EXISTS idx_pod_date ON bookings_scored(pod, booking_date)',
+    'CREATE INDEX IF NOT EXISTS idx_month_date ON bookings_scored(booking_month, booking_date)',
+    'CREATE INDEX IF NOT EXISTS idx_created_at ON bookings_scored(created_at)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_booking_id_unique ON bookings_scored(booking_id)',
+]
+
+LEGACY_INSERT_COLUMNS = [
+    'booking_id', 'booking_date', 'pol', 'pod', 'lane', 'bundle', 'container_state',
+    'cancel_probability', 'cancel_risk', 'broken_route_probability', 'broken_route_risk', 'created_at'
+]
+
+
+def legacy_scored_table(path):
+    """Create the pre-encoding bookings_scored table in the SQLite file at path."""
+    with sqlite3.connect(path) as conn:
+        for statement in LEGACY_SCORED_SCHEMA:
+            conn.execute(statement)
+
+
+def legacy_insert(df, conn, replace_duplicates=False):
+    """The to_sql writer insert_scored_bookings used before the executemany fast path."""
+    df_insert = df.copy()
+    df_insert['created_at'] = datetime.now()
+    df_insert = df_insert[LEGACY_INSERT_COLUMNS]
+    if replace_duplicates:
+        existing_ids = {row[0] for row in conn.execute(
+            'SELECT DISTINCT booking_id FROM bookings_scored WHERE booking_id IS NOT NULL'
+        )}
+        df_insert = df_insert[~df_insert['booking_id'].isin(existing_ids)]
+    df_insert.to_sql('bookings_scored', conn, if_exists='append', index=False)
+    conn.commit()
+
+
+def legacy_network_data(df, top_n=10):
+    """The per-cell mask loop get_network_data used before the grouped pivot."""
+    top_pols = df['pol'].value_counts().head(top_n).index.tolist()
+    top_pods = df['pod'].value_counts().head(top_n).index.tolist()
+    ports = list(dict.fromkeys(top_pols + top_pods))
+    matrix = [[len(df[(df['pol'] == pol) & (df['pod'] == pod)]) for pod in ports] for pol in ports]
+    return {'matrix': matrix, 'labels': ports}
+
+
+def legacy_risk_matrix(df, top_n=10):
+    """The per-cell mask loop get_risk_matrix_heatmap used before the grouped pivot."""
+    top_ports = df['pol'].value_counts().head(top_n).index.tolist()
+    top_lanes = df['lane'].value_counts().head(top_n).index.tolist()
+    matrix = []
+    for port in top_ports:
+        row = []
+        for lane in top_lanes:
+            subset = df[(df['pol'] == port) & (df['lane'] == lane)]
+            row.append(float(subset['cancel_probability'].mean() * 100) if len(subset) > 0 else 0.0)
+        matrix.append(row)
+    return {'ports': top_ports, 'lanes': top_lanes, 'matrix': matrix}
+
+
+def legacy_stacked_area(df):
+    """The lane x date loop get_stacked_area_data used before the pivot (daily only)."""
+    df = df[['lane']].assign(date=pd.to_datetime(df['booking_date'], errors='coerce').dt.date)
+    top_lanes = df['lane'].value_counts().head(5).index.tolist()
+    grouped = df.groupby(['date', 'lane']).size().reset_index(name='count')
+    all_dates = sorted(df['date'].unique())
+    data = []
+    for lane in top_lanes:
+        lane_data = []
+        for date in all_dates:
+            count = grouped[(grouped['date'] == date) & (grouped['lane'] == lane)]['count'].values
+            lane_data.append(int(count[0]) if len(count) > 0 else 0)
+        data.append(lane_data)
+    return {'dates': [str(d) for d in all_dates], 'lanes': top_lanes, 'data': data}
+
+
+def legacy_flow(df):
+    """The iterrows() link builder get_flow_data used before array-level links."""
+    flows = df.groupby(['lane', 'container_state', 'cancel_risk']).size().reset_index(name='value')
+    lanes = sorted([str(l) for l in df['lane'].dropna().unique()])
+    states = sorted([str(s) for s in df['container_state'].dropna().unique()])
+    nodes = lanes + states + ['Low', 'Medium', 'High']
+    node_dict = {node: idx for idx, node in enumerate(nodes)}
+    links = []
+    for _, row in flows.iterrows():
+        lane, state, risk = str(row['lane']), str(row['container_state']), str(row['cancel_risk'])
+        links.append({'source': node_dict[lane], 'target': node_dict[state], 'value': int(row['value'])})
+        if risk in node_dict:
+            links.append({'source': node_dict[state], 'target': node_dict[risk], 'value': int(row['value'])})
+    return {'nodes': [{'name': n} for n in nodes], 'links': links}
+
+
+def link_totals(flow):
+    """Flow payload as node names and summed value per (source, target)."""
+    totals = {}
+    for link in flow['links']:
+        totals[(link['source'], link['target'])] = totals.get((link['source'], link['target']), 0) + link['value']
+    return flow['nodes'], totals
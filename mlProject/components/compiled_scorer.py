@@ -0,0 +1,365 @@
+# ============================================================================
+# FILE: mlProject/components/compiled_scorer.py
+# ============================================================================
+"""
+Compiled scorer - the fitted encoder and classifiers flattened into NumPy arrays.
+
+Scoring one booking through pandas + ColumnTransformer + predict_proba costs
+milliseconds of framework overhead. compile_scorer() exports the category ->
+column maps, scaler statistics and the model parameters (logistic coefficients
+or packed tree arrays) so small batches of plain dict records can be scored
+with NumPy alone. It only depends on sklearn / xgboost at export time.
+"""
+from datetime import date, datetime
+import json
+import logging
+import math
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# Features engineer_features derives from booking_date
+DATE_FEATURES = {
+    'year': lambda d: d.year,
+    'month': lambda d: d.month,
+    'day': lambda d: d.day,
+    'day_of_week': lambda d: d.weekday(),
+    'is_weekend': lambda d: int(d.weekday() >= 5),
+}
+
+
+class UnsupportedInput(ValueError):
+    """A record the compiled scorer cannot reproduce exactly; use the pandas path."""
+
+
+def parse_date(value):
+    """booking_date as a date, None for missing values (NaT in the pandas path)."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, datetime):
+        # pandas.NaT is a datetime subclass whose fields are NaN
+        return None if value != value else value
+    if isinstance(value, date):
+        return value
+    # Only plain ISO dates: pd.to_datetime infers other formats per batch
+    if isinstance(value, str) and len(value) == 10 and value[4] == '-' and value[7] == '-':
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    raise UnsupportedInput(f"Unsupported booking_date: {value!r}")
+
+
+class CompiledEncoder:
+    """One-hot + standard scaling of a fitted ColumnTransformer."""
+    
+    def __init__(self, categorical, numerical, n_features, zero_is_missing):
+        # [(column, offset, {category: index})] and [(column, position, mean, scale)]
+        self.categorical = categorical
+        self.numerical = numerical
+        self.n_features = n_features
+        # Sparse output drops zeros, which XGBoost then treats as missing
+        self.zero_is_missing = zero_is_missing
+    
+    @classmethod
+    def from_fitted(cls, preprocessor):
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+        
+        categorical, numerical = [], []
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, str) or len(columns) == 0:
+                continue
+            if isinstance(transformer, OneHotEncoder):
+                if transformer.drop_idx_ is not None or getattr(transformer, 'infrequent_categories_', None):
+                    raise TypeError(f"Cannot compile transformer '{name}': dropped or infrequent categories")
+                if transformer.handle_unknown != 'ignore':
+                    raise TypeError(f"Cannot compile transformer '{name}': handle_unknown must be 'ignore'")
+                for column, categories in zip(columns, transformer.categories_):
+                    categorical.append((column, offset, {value: index for index, value in enumerate(categories.tolist())}))
+                    offset += len(categories)
+            elif isinstance(transformer, StandardScaler):
+                means = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+                scales = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+                for column, mean, scale in zip(columns, means, scales):
+                    numerical.append((column, offset, float(mean), float(scale)))
+                    offset += 1
+            else:
+                raise TypeError(f"Cannot compile transformer '{name}': {type(transformer).__name__}")
+        
+        return cls(categorical, numerical, offset, bool(getattr(preprocessor, 'sparse_output_', False)))
+    
+    def transform(self, records):
+        """Dense float64 feature matrix for a list of dict records."""
+        X = np.zeros((len(records), self.n_features))
+        for i, record in enumerate(records):
+            for column, offset, index in self.categorical:
+                value = record[column] if column in record else _missing_column(column)
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    value = 'unknown'
+                elif not isinstance(value, str):
+                    raise UnsupportedInput(f"Unsupported {column}: {value!r}")
+                position = index.get(value)
+                if position is not None:
+                    X[i, offset + position] = 1.0
+            
+            if 'booking_date' not in record:
+                _missing_column('booking_date')
+            booking_date = parse_date(record['booking_date'])
+            for column, position, mean, scale in self.numerical:
+                if column in DATE_FEATURES:
+                    value = DATE_FEATURES[column](booking_date) if booking_date is not None else 0
+                else:
+                    value = record.get(column)
+                    value = 0 if value is None or value != value else value
+                X[i, position] = (value - mean) / scale
+        return X
+
+
+def _missing_column(column):
+    raise UnsupportedInput(f"Missing column: {column}")
+
+
+class CompiledLinear:
+    """Binary logistic regression: sigmoid(X @ coef + intercept)."""
+    
+    def __init__(self, coef, intercept):
+        self.coef = coef
+        self.intercept = intercept
+    
+    @classmethod
+    def from_fitted(cls, model):
+        return cls(np.asarray(model.coef_[0], dtype=np.float64), float(model.intercept_[0]))
+    
+    def predict_proba(self, X, encoder):
+        return 1.0 / (1.0 + np.exp(-(X @ self.coef + self.intercept)))
+
+
+class CompiledTrees:
+    """
+    Tree ensemble packed into flat node arrays.
+    
+    Trees are laid out back to back and child pointers are global node
+    indices, so all trees are walked together with a few np.take calls per
+    level. Leaves point at themselves so finished trees idle until the
+    deepest one is done.
+    """
+    
+    def __init__(self, roots, feature, threshold, children, missing, value, depth, kind, base_margin=0.0):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        # Left children followed by right children: children[node + n_nodes * goes_right]
+        self.children = children
+        self.missing = missing
+        self.value = value
+        self.depth = depth
+        # 'forest': mean of leaf probabilities, x <= threshold goes left
+        # 'xgboost': sigmoid(base_margin + sum of leaves), x < threshold goes left
+        self.kind = kind
+        self.base_margin = base_margin
+    
+    @classmethod
+    def _pack(cls, trees, kind, base_margin=0.0):
+        """trees: list of dicts of per-node arrays (feature, threshold, left, right, missing, value, depth)."""
+        sizes = np.array([len(tree['feature']) for tree in trees])
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        
+        def join(key, dtype, offset=False):
+            parts = [np.asarray(tree[key]) + (root if offset else 0) for tree, root in zip(trees, roots)]
+            return np.concatenate(parts).astype(dtype)
+        
+        return cls(
+            roots=roots.astype(np.intp),
+            feature=join('feature', np.intp),
+            threshold=join('threshold', np.float64),
+            children=np.concatenate([join('left', np.intp, True), join('right', np.intp, True)]),
+            missing=join('missing', np.intp, True),
+            value=join('value', np.float64),
+            depth=max(tree['depth'] for tree in trees),
+            kind=kind,
+            base_margin=base_margin
+        )
+    
+    @classmethod
+    def from_forest(cls, model):
+        """RandomForestClassifier / DecisionTreeClassifier (binary)."""
+        estimators = getattr(model, 'estimators_', [model])
+        trees = []
+        for estimator in estimators:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+            value = tree.value[:, 0, :]
+            trees.append({
+                'feature': np.where(leaf, 0, tree.feature),
+                'threshold': tree.threshold,
+                'left': np.where(leaf, nodes, tree.children_left),
+                'right': np.where(leaf, nodes, tree.children_right),
+                'missing': np.where(leaf, nodes, tree.children_left),
+                'value': value[:, 1] / value.sum(axis=1),
+                'depth': tree.max_depth,
+            })
+        return cls._pack(trees, 'forest')
+    
+    @classmethod
+    def from_xgboost(cls, model):
+        """XGBClassifier trained with binary:logistic."""
+        booster = model.get_booster()
+        config = json.loads(booster.save_config())
+        objective = config['learner']['objective']['name']
+        if objective != 'binary:logistic':
+            raise TypeError(f"Cannot compile XGBoost objective {objective}")
+        base_score = float(config['learner']['learner_model_param']['base_score'].strip('[]'))
+        names = booster.feature_names or []
+        
+        trees = []
+        for dump in booster.get_dump(dump_format='json'):
+            nodes = {}
+            stack = [(json.loads(dump), 0)]
+            depth = 0
+            while stack:
+                node, level = stack.pop()
+                nodes[node['nodeid']] = node
+                depth = max(depth, level)
+                stack.extend((child, level + 1) for child in node.get('children', []))
+            
+            size = max(nodes) + 1
+            tree = {key: np.zeros(size) for key in ('feature', 'threshold', 'left', 'right', 'missing', 'value')}
+            tree['depth'] = depth
+            for node_id, node in nodes.items():
+                if 'leaf' in node:
+                    tree['left'][node_id] = tree['right'][node_id] = tree['missing'][node_id] = node_id
+                    tree['value'][node_id] = node['leaf']
+                    continue
+                split = node['split']
+                tree['feature'][node_id] = names.index(split) if split in names else int(split.lstrip('f'))
+                # Thresholds are float32 in XGBoost; the dump prints them in decimal
+                tree['threshold'][node_id] = np.float32(node['split_condition'])
+                tree['left'][node_id] = node['yes']
+                tree['right'][node_id] = node['no']
+                tree['missing'][node_id] = node['missing']
+            trees.append(tree)
+        
+        return cls._pack(trees, 'xgboost', base_margin=math.log(base_score / (1 - base_score)))
+    
+    def predict_proba(self, X, encoder):
+        X = X.astype(np.float32)
+        if self.kind == 'xgboost' and encoder.zero_is_missing:
+            X[X == 0] = np.nan
+        
+        n_rows, n_features = X.shape
+        values_flat = X.ravel()
+        row_offsets = np.arange(n_rows) * n_features
+        n_nodes = len(self.feature)
+        node = np.repeat(self.roots[:, None], n_rows, axis=1)
+        for _ in range(self.depth):
+            values = values_flat.take(self.feature.take(node) + row_offsets)
+            if self.kind == 'xgboost':
+                goes_right = ~(values < self.threshold.take(node))
+                following = self.children.take(node + n_nodes * goes_right)
+                following = np.where(np.isnan(values), self.missing.take(node), following)
+            else:
+                following = self.children.take(node + n_nodes * (values > self.threshold.take(node)))
+            if np.array_equal(following, node):
+                break
+            node = following
+        
+        leaves = self.value.take(node)
+        if self.kind == 'xgboost':
+            margin = self.base_margin + leaves.astype(np.float32).sum(axis=0, dtype=np.float32)
+            return (1.0 / (1.0 + np.exp(-margin))).astype(np.float32).astype(np.float64)
+        return leaves.mean(axis=0)
+
+
+def compile_model(model):
+    """Compiled counterpart of a fitted binary classifier; TypeError if unsupported."""
+    name = type(model).__name__
+    if len(getattr(model, 'classes_', ())) != 2:
+        raise TypeError(f"Cannot compile {name}: only binary classifiers are supported")
+    if name == 'LogisticRegression':
+        return CompiledLinear.from_fitted(model)
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier', 'DecisionTreeClassifier'):
+        return CompiledTrees.from_forest(model)
+    if name == 'XGBClassifier':
+        return CompiledTrees.from_xgboost(model)
+    raise TypeError(f"Cannot compile {name}")
+
+
+class CompiledScorer:
+    """Encoder + cancel / broken route models, NumPy only."""
+    
+    def __init__(self, encoder, cancel_model, broken_route_model):
+        self.encoder = encoder
+        self.cancel_model = cancel_model
+        self.broken_route_model = broken_route_model
+    
+    def transform(self, records):
+        """Feature matrix for dict records; UnsupportedInput if they need the pandas path."""
+        return self.encoder.transform(records)
+    
+    def predict(self, X):
+        """(cancel_probability, broken_route_probability) arrays for a transformed matrix."""
+        return (
+            self.cancel_model.predict_proba(X, self.encoder),
+            self.broken_route_model.predict_proba(X, self.encoder)
+        )
+    
+    def score_records(self, records):
+        """transform + predict."""
+        return self.predict(self.transform(records))
+    
+    def sample_records(self, n_rows=200, seed=42):
+        """Random records over the fitted categories, plus unknown and missing values."""
+        rng = np.random.default_rng(seed)
+        records = []
+        for i in range(n_rows):
+            record = {}
+            for column, _, index in self.encoder.categorical:
+                choices = list(index) + ['UNSEEN', None]
+                record[column] = choices[rng.integers(len(choices))]
+            day = date(2020, 1, 1).toordinal() + int(rng.integers(0, 365 * 6))
+            record['booking_date'] = None if i % 50 == 49 else date.fromordinal(day).isoformat()
+            records.append(record)
+        return records
+    
+    def _supported(self, record):
+        try:
+            self.transform([record])
+            return True
+        except UnsupportedInput:
+            return False
+    
+    def validate(self, model_service, records=None, tolerance=1e-6):
+        """
+        Max absolute difference to the sklearn path; ValueError above tolerance,
+        None if no record is supported by the compiled path (nothing to compare).
+        """
+        import pandas as pd
+        
+        records = records if records is not None else self.sample_records()
+        records = [record for record in records if self._supported(record)]
+        if not records:
+            logging.warning("Compiled scorer supports none of the sample records, skipped validation")
+            return None
+        X = model_service.preprocess(pd.DataFrame(records))
+        expected = (
+            model_service.cancel_model.predict_proba(X)[:, 1],
+            model_service.broken_route_model.predict_proba(X)[:, 1]
+        )
+        error = max(
+            float(np.max(np.abs(compiled - reference)))
+            for compiled, reference in zip(self.score_records(records), expected)
+        )
+        if error > tolerance:
+            raise ValueError(f"Compiled scorer differs from sklearn by {error:.3g} (tolerance {tolerance:g})")
+        return error
+
+
+def compile_scorer(encoder, cancel_model, broken_route_model):
+    """CompiledScorer for a fitted ColumnTransformer and the two classifiers."""
+    return CompiledScorer(
+        CompiledEncoder.from_fitted(encoder),
+        compile_model(cancel_model),
+        compile_model(broken_route_model)
+    )
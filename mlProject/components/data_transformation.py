@@ -10,13 +10,24 @@ import os
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.compose import ColumnTransformer
 from mlProject.entity.config_entity import DataTransformationConfig
-from mlProject.utils.common import save_object
-from mlProject.constants import CATEGORICAL_FEATURES, NUMERICAL_FEATURES, TARGET_CANCEL, TARGET_BROKEN_ROUTE
+from mlProject.utils.common import save_object, save_matrix
+from mlProject.constants import CATEGORICAL_FEATURES, NUMERICAL_FEATURES, TARGET_CANCEL, TARGET_BROKEN_ROUTE, SPARSE_ENCODING
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
 
+def build_preprocessor(cat_features, num_features, sparse_output=SPARSE_ENCODING):
+    """One-hot + scaling pipeline; output stays CSR whenever sparse_output is set."""
+    return ColumnTransformer(
+        transformers=[
+            ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=sparse_output), cat_features),
+            ('num', StandardScaler(), num_features)
+        ],
+        sparse_threshold=1.0 if sparse_output else 0.0
+    )
+
+
 class DataTransformation:
     def __init__(self, config: DataTransformationConfig):
         self.config = config
@@ -58,12 +69,7 @@ class DataTransformation:
             test_df[col] = test_df[col].fillna(train_df[col].median())
         
         # Create preprocessing pipeline
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), cat_features),
-                ('num', StandardScaler(), num_features)
-            ]
-        )
+        preprocessor = build_preprocessor(cat_features, num_features)
         
         # Fit and transform
         X_train = train_df[cat_features + num_features]
@@ -76,8 +82,8 @@ class DataTransformation:
         save_object(preprocessor, self.config.encoder_path)
         
         # Save transformed data
-        np.save(os.path.join(self.config.root_dir, 'X_train.npy'), X_train_transformed)
-        np.save(os.path.join(self.config.root_dir, 'X_test.npy'), X_test_transformed)
+        save_matrix(X_train_transformed, os.path.join(self.config.root_dir, 'X_train'))
+        save_matrix(X_test_transformed, os.path.join(self.config.root_dir, 'X_test'))
         np.save(os.path.join(self.config.root_dir, 'y_train_cancel.npy'), train_df[TARGET_CANCEL].values)
         np.save(os.path.join(self.config.root_dir, 'y_test_cancel.npy'), test_df[TARGET_CANCEL].values)
         np.save(os.path.join(self.config.root_dir, 'y_train_broken.npy'), train_df[TARGET_BROKEN_ROUTE].values)
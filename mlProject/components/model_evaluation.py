@@ -7,7 +7,7 @@ Model Evaluation Component.
 import numpy as np
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
 from mlProject.entity.config_entity import ModelEvaluationConfig
-from mlProject.utils.common import load_object, save_json
+from mlProject.utils.common import load_object, save_json, load_matrix
 import logging
 import os
 
@@ -38,7 +38,7 @@ class ModelEvaluation:
         logging.info("Starting model evaluation...")
         
         # Load test data
-        X_test = np.load(os.path.join(self.config.test_data_path, 'X_test.npy'))
+        X_test = load_matrix(os.path.join(self.config.test_data_path, 'X_test'))
         y_test_cancel = np.load(os.path.join(self.config.test_data_path, 'y_test_cancel.npy'))
         y_test_broken = np.load(os.path.join(self.config.test_data_path, 'y_test_broken.npy'))
         
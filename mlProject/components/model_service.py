@@ -6,21 +6,56 @@ Model Service - Central service for loading models and making predictions.
 """
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from mlProject.utils.common import load_object, load_json
 from mlProject.constants import *
+from mlProject.components.compiled_scorer import UnsupportedInput, compile_scorer
+from mlProject.components.prediction_cache import prediction_cache
+from mlProject.components.score_table import SCORE_LOOKUP, ScoreTable
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import threading
+import time
 import os
 
 logging.basicConfig(level=logging.INFO)
 
 
 class ModelService:
-    def __init__(self):
+    # Batches smaller than this are scored sequentially even in parallel mode
+    PARALLEL_MIN_ROWS = 10000
+    # Batches up to this size go through the NumPy-only compiled scorer
+    COMPILED_MAX_ROWS = 64
+    
+    def __init__(self, parallel_inference=False, use_compiled=True, cache=prediction_cache, use_score_table=SCORE_LOOKUP):
         self.encoder = None
         self.cancel_model = None
         self.broken_route_model = None
+        self.compiled = None
+        self.use_compiled = use_compiled
+        self.score_table = None
+        self.use_score_table = use_score_table
         self.loaded = False
         
+        # Scores memoized on the feature tuple, shared by every instance;
+        # only used once model_version identifies the loaded model files
+        self.cache = cache
+        self.model_version = None
+        
+        # Score both models in threads (sklearn/XGBoost release the GIL)
+        self.parallel_inference = parallel_inference
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='model-service') if parallel_inference else None
+        
+        # Timing of each thread's last scoring call, and running totals across threads
+        self._local = threading.local()
+        self._timings_lock = threading.Lock()
+        self.timing_totals = {'calls': 0, 'rows': 0, 'preprocess_seconds': 0.0, 'inference_seconds': 0.0}
+    
+    @property
+    def last_timings(self):
+        """Timings of the calling thread's last scoring call."""
+        return getattr(self._local, 'timings', {})
+    
     def load_models(self):
         """Load all required models and transformers."""
         try:
@@ -31,12 +66,42 @@ class ModelService:
             self.encoder = load_object(encoder_path)
             self.cancel_model = load_object(cancel_model_path)
             self.broken_route_model = load_object(broken_route_model_path)
+            self.model_version = '-'.join(
+                str(os.stat(path).st_mtime_ns) for path in (encoder_path, cancel_model_path, broken_route_model_path)
+            )
             
             self.loaded = True
             logging.info("All models loaded successfully!")
         except Exception as e:
             logging.error(f"Error loading models: {e}")
             raise
+        
+        if self.use_compiled:
+            self.compiled = self._load_compiled_scorer([encoder_path, cancel_model_path, broken_route_model_path])
+        
+        if self.use_score_table:
+            self.score_table = ScoreTable.load(self.model_version)
+            if self.score_table is None:
+                logging.warning("No score table for these models, predictions use the models")
+    
+    def compile_scorer(self, records=None):
+        """NumPy-only scorer for the loaded models, validated against the sklearn path."""
+        scorer = compile_scorer(self.encoder, self.cancel_model, self.broken_route_model)
+        error = scorer.validate(self, records)
+        if error is not None:
+            logging.info(f"Compiled scorer matches sklearn (max abs error {error:.2g})")
+        return scorer
+    
+    def _load_compiled_scorer(self, source_paths):
+        """Exported scorer if it is newer than the models, else compiled on the spot; None if unsupported."""
+        path = os.path.join(MODEL_TRAINER_DIR, COMPILED_SCORER_FILE)
+        try:
+            if os.path.exists(path) and os.path.getmtime(path) >= max(map(os.path.getmtime, source_paths)):
+                return load_object(path)
+            return self.compile_scorer()
+        except Exception as e:
+            logging.warning(f"Compiled scorer unavailable, small batches use sklearn: {e}")
+            return None
     
     def engineer_features(self, df):
         """Apply same feature engineering as training."""
@@ -52,6 +117,10 @@ class ModelService:
     
     def preprocess(self, df):
         """Preprocess input data."""
+        return self.transform_features(self.feature_frame(df))
+    
+    def feature_frame(self, df):
+        """Engineered, gap-filled model inputs (one column per encoder input)."""
         df = self.engineer_features(df)
         
         # Select features
@@ -67,9 +136,16 @@ class ModelService:
             if col in df.columns:
                 df[col] = df[col].fillna(0)
         
-        # Select and transform
-        X = df[cat_features + num_features]
+        return df[cat_features + num_features]
+    
+    def transform_features(self, X):
+        """
+        Encode a feature_frame; CSR when the encoder was fitted with
+        SPARSE_ENCODING (the models score sparse input directly).
+        """
         X_transformed = self.encoder.transform(X)
+        if sparse.issparse(X_transformed):
+            X_transformed = X_transformed.tocsr()
         
         return X_transformed
     
@@ -82,6 +158,160 @@ class ModelService:
         else:
             return "High"
     
+    def get_risk_labels(self, probabilities):
+        """Vectorized get_risk_label: bucket codes wrapped as a Categorical."""
+        codes = np.digitize(probabilities, RISK_THRESHOLDS)
+        return pd.Categorical.from_codes(codes, categories=RISK_LABELS)
+    
+    def predict_frame(self, df):
+        """
+        Columnar prediction for both targets.
+        
+        The feature matrix is built once and fed to both classifiers. Frames
+        of up to COMPILED_MAX_ROWS rows are scored by the compiled scorer.
+        With a score table loaded, rows it covers are looked up instead and
+        only the rest are scored.
+        
+        Returns:
+            Dict of column -> array: cancel_probability, cancel_risk,
+            broken_route_probability, broken_route_risk (risks are Categoricals)
+        """
+        if not self.loaded:
+            self.load_models()
+        
+        if self.score_table is not None:
+            start = time.perf_counter()
+            cancel_proba, broken_proba, missing = self.score_table.lookup_frame(df)
+            self._record_timings(len(df), 0.0, time.perf_counter() - start)
+            if len(missing):
+                cancel_proba[missing], broken_proba[missing] = self._model_scores(df.iloc[missing])
+        else:
+            cancel_proba, broken_proba = self._model_scores(df)
+        
+        return {
+            'cancel_probability': cancel_proba,
+            'cancel_risk': self.get_risk_labels(cancel_proba),
+            'broken_route_probability': broken_proba,
+            'broken_route_risk': self.get_risk_labels(broken_proba)
+        }
+    
+    def _model_scores(self, df):
+        """Both probabilities from the compiled scorer for small frames, else the sklearn path."""
+        scores = self._compiled_scores(df.to_dict('records')) if len(df) <= self.COMPILED_MAX_ROWS else None
+        if scores is not None:
+            return scores
+        return self._sklearn_scores(df)
+    
+    def _compiled_scores(self, records):
+        """Both probabilities from the compiled scorer; None when the batch needs the sklearn path."""
+        if self.compiled is None or len(records) > self.COMPILED_MAX_ROWS:
+            return None
+        
+        start = time.perf_counter()
+        try:
+            X = self.compiled.transform(records)
+        except UnsupportedInput as e:
+            logging.debug(f"Compiled scorer skipped: {e}")
+            return None
+        preprocessed = time.perf_counter()
+        scores = self.compiled.predict(X)
+        self._record_timings(len(records), preprocessed - start, time.perf_counter() - preprocessed)
+        return scores
+    
+    def _sklearn_scores(self, df):
+        """
+        Both probabilities through the fitted ColumnTransformer and classifiers.
+        
+        Only distinct feature tuples are encoded and scored, and tuples
+        already in the prediction cache are skipped; scores are scattered
+        back to every row.
+        """
+        start = time.perf_counter()
+        features = self.feature_frame(df)
+        codes, first = self._deduplicate(features)
+        unique = features.iloc[first]
+        
+        use_cache = self.cache is not None and self.model_version is not None and 0 < len(unique) <= self.cache.max_entries
+        if use_cache:
+            keys = list(unique.itertuples(index=False, name=None))
+            cancel_proba, broken_proba, todo = self.cache.get_many(self.model_version, keys)
+        else:
+            cancel_proba, broken_proba = np.empty(len(unique)), np.empty(len(unique))
+            todo = np.arange(len(unique))
+        
+        if len(todo):
+            X = self.transform_features(unique.iloc[todo])
+            preprocessed = time.perf_counter()
+            
+            if self.parallel_inference and len(todo) >= self.PARALLEL_MIN_ROWS:
+                cancel_future = self._executor.submit(self.cancel_model.predict_proba, X)
+                broken_future = self._executor.submit(self.broken_route_model.predict_proba, X)
+                cancel_proba[todo] = cancel_future.result()[:, 1]
+                broken_proba[todo] = broken_future.result()[:, 1]
+            else:
+                cancel_proba[todo] = self.cancel_model.predict_proba(X)[:, 1]
+                broken_proba[todo] = self.broken_route_model.predict_proba(X)[:, 1]
+            
+            if use_cache:
+                self.cache.set_many(self.model_version, [keys[i] for i in todo], cancel_proba[todo], broken_proba[todo])
+        else:
+            preprocessed = time.perf_counter()
+        
+        finished = time.perf_counter()
+        self._record_timings(len(df), preprocessed - start, finished - preprocessed, unique_rows=len(unique), scored_rows=len(todo))
+        return cancel_proba[codes], broken_proba[codes]
+    
+    @staticmethod
+    def _deduplicate(features):
+        """
+        (codes, first): each row's position among the distinct rows, and the
+        row index where each distinct row first occurs.
+        """
+        if features.empty:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        
+        # Per-column codes combined into one int64 key in mixed radix
+        key = np.zeros(len(features), dtype=np.int64)
+        combinations = 1
+        for column in features.columns:
+            column_codes, uniques = pd.factorize(features[column], use_na_sentinel=False)
+            combinations *= len(uniques)
+            if combinations >= 2 ** 62:
+                codes = features.groupby(list(features.columns), sort=False, dropna=False).ngroup().to_numpy()
+                break
+            key = key * len(uniques) + column_codes
+        else:
+            codes, _ = pd.factorize(key)
+        
+        # Codes are numbered in order of first appearance
+        first = np.flatnonzero(np.r_[True, codes[1:] > np.maximum.accumulate(codes)[:-1]])
+        return codes, first
+    
+    def _record_timings(self, rows, preprocess_seconds, inference_seconds, **extra):
+        """Keep the preprocessing / inference split for instrumentation."""
+        self._local.timings = {
+            'rows': rows,
+            'preprocess_ms': preprocess_seconds * 1000,
+            'inference_ms': inference_seconds * 1000,
+            **extra
+        }
+        with self._timings_lock:
+            self.timing_totals['calls'] += 1
+            self.timing_totals['rows'] += rows
+            self.timing_totals['preprocess_seconds'] += preprocess_seconds
+            self.timing_totals['inference_seconds'] += inference_seconds
+        logging.debug(
+            f"Scored {rows} rows: preprocess {preprocess_seconds * 1000:.1f} ms, "
+            f"inference {inference_seconds * 1000:.1f} ms"
+        )
+    
+    def _to_records(self, probabilities, labels):
+        """Row-wise {'probability', 'risk_label'} dicts for the dict API."""
+        return [
+            {'probability': p, 'risk_label': label}
+            for p, label in zip(probabilities.tolist(), labels.tolist())
+        ]
+    
     def predict_cancel(self, df):
         """Predict cancellation risk."""
         if not self.loaded:
@@ -90,13 +320,7 @@ class ModelService:
         X = self.preprocess(df)
         proba = self.cancel_model.predict_proba(X)[:, 1]
         
-        results = []
-        for p in proba:
-            results.append({
-                'probability': float(p),
-                'risk_label': self.get_risk_label(p)
-            })
-        return results
+        return self._to_records(proba, self.get_risk_labels(proba))
     
     def predict_broken_route(self, df):
         """Predict broken route risk."""
@@ -106,25 +330,42 @@ class ModelService:
         X = self.preprocess(df)
         proba = self.broken_route_model.predict_proba(X)[:, 1]
         
-        results = []
-        for p in proba:
-            results.append({
-                'probability': float(p),
-                'risk_label': self.get_risk_label(p)
-            })
-        return results
+        return self._to_records(proba, self.get_risk_labels(proba))
+    
+    def predict_records(self, records):
+        """
+        predict_all for a list of dicts.
+        
+        Bookings covered by the score table are looked up and small batches
+        are scored by the compiled scorer without building a DataFrame;
+        anything else falls back to predict_all.
+        """
+        if not self.loaded:
+            self.load_models()
+        
+        scores = self.score_table.lookup_records(records) if self.score_table is not None else None
+        if scores is None:
+            scores = self._compiled_scores(records)
+        if scores is None:
+            return self.predict_all(pd.DataFrame(records))
+        
+        labels = np.asarray(RISK_LABELS)
+        cancel_proba, broken_proba = scores
+        return self._combine_records(
+            self._to_records(cancel_proba, labels[np.digitize(cancel_proba, RISK_THRESHOLDS)]),
+            self._to_records(broken_proba, labels[np.digitize(broken_proba, RISK_THRESHOLDS)])
+        )
     
     def predict_all(self, df):
         """Predict both cancellation and broken route."""
-        cancel_results = self.predict_cancel(df)
-        broken_results = self.predict_broken_route(df)
-        
-        combined = []
-        for i in range(len(cancel_results)):
-            combined.append({
-                'cancel': cancel_results[i],
-                'broken_route': broken_results[i]
-            })
-        return combined
-
-
+        scores = self.predict_frame(df)
+        cancel_results = self._to_records(scores['cancel_probability'], scores['cancel_risk'])
+        broken_results = self._to_records(scores['broken_route_probability'], scores['broken_route_risk'])
+        return self._combine_records(cancel_results, broken_results)
+    
+    def _combine_records(self, cancel_results, broken_results):
+        """Pair the per-target records into the predict_all response rows."""
+        return [
+            {'cancel': cancel, 'broken_route': broken}
+            for cancel, broken in zip(cancel_results, broken_results)
+        ]
@@ -5,11 +5,12 @@
 Model Trainer Component.
 """
 import numpy as np
+import pandas as pd
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
 from xgboost import XGBClassifier
 from mlProject.entity.config_entity import ModelTrainerConfig
-from mlProject.utils.common import evaluate_models, save_object
+from mlProject.utils.common import evaluate_models, save_object, load_object, load_matrix
 import logging
 import os
 
@@ -19,15 +20,15 @@ logging.basicConfig(level=logging.INFO)
 class ModelTrainer:
     def __init__(self, config: ModelTrainerConfig):
         self.config = config
-
+    
     def initiate_model_training(self):
         """Train models for both targets."""
         logging.info("Starting model training...")
         
         # Load transformed data
         data_path = self.config.train_data_path
-        X_train = np.load(os.path.join(data_path, 'X_train.npy'))
-        X_test = np.load(os.path.join(data_path, 'X_test.npy'))
+        X_train = load_matrix(os.path.join(data_path, 'X_train'))
+        X_test = load_matrix(os.path.join(data_path, 'X_test'))
         y_train_cancel = np.load(os.path.join(data_path, 'y_train_cancel.npy'))
         y_test_cancel = np.load(os.path.join(data_path, 'y_test_cancel.npy'))
         y_train_broken = np.load(os.path.join(data_path, 'y_train_broken.npy'))
@@ -56,9 +57,58 @@ class ModelTrainer:
         save_object(best_broken_model, self.config.broken_route_model_path)
         logging.info(f"Best broken route model: {best_broken_name}")
         
+        self.export_compiled_scorer(best_cancel_model, best_broken_model)
+        self.export_score_table()
+        
         logging.info("Model training completed.")
         
         return {
             'cancel': {'name': best_cancel_name, 'results': cancel_results},
             'broken_route': {'name': best_broken_name, 'results': broken_results}
-        }
\ No newline at end of file
+        }
+    
+    def export_compiled_scorer(self, cancel_model, broken_route_model):
+        """
+        Compile the encoder and both models into the NumPy-only scorer
+        ModelService uses for small batches, checked against sklearn on the
+        held-out bookings. Unsupported models are skipped with a warning.
+        """
+        from mlProject.components.model_service import ModelService
+        
+        service = ModelService(use_compiled=False)
+        service.encoder = load_object(self.config.encoder_path)
+        service.cancel_model = cancel_model
+        service.broken_route_model = broken_route_model
+        service.loaded = True
+        
+        records = pd.read_csv(self.config.validation_data_path).to_dict('records')
+        try:
+            scorer = service.compile_scorer(records)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Compiled scorer not exported: {e}")
+            return None
+        
+        save_object(scorer, self.config.compiled_scorer_path)
+        return scorer
+    
+    def export_score_table(self):
+        """
+        Precompute both probabilities for every category combination over
+        the rolling date window (see build_score_table.py to refresh it).
+        Only built with SCORE_LOOKUP=1; a table over the size cap is skipped.
+        """
+        from mlProject.components.model_service import ModelService
+        from mlProject.components.score_table import SCORE_LOOKUP, build_score_table
+        
+        if not SCORE_LOOKUP:
+            logging.info("Score table not built (SCORE_LOOKUP is off)")
+            return None
+        
+        # Loaded from the saved files so the table carries their model version
+        service = ModelService(use_compiled=False, use_score_table=False)
+        service.load_models()
+        try:
+            return build_score_table(service, directory=self.config.root_dir)
+        except ValueError as e:
+            logging.warning(f"Score table not built: {e}")
+            return None
@@ -0,0 +1,85 @@
+# ============================================================================
+# FILE: mlProject/components/prediction_cache.py
+# ============================================================================
+"""
+Prediction cache - scores memoized on the engineered feature tuple.
+
+Bookings repeat the same (pol, pod, lane, container_state, bundle, date parts)
+over and over, so ModelService keeps the probabilities of recently scored
+feature tuples. Entries are keyed on the model version as well, so reloaded
+models never serve stale scores.
+"""
+from collections import OrderedDict
+import threading
+import os
+import numpy as np
+
+# Feature tuples remembered per process (0 disables the cache)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 50000))
+
+
+class PredictionCache:
+    """Per-process LRU of (cancel, broken route) probabilities."""
+    
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get_many(self, version, keys):
+        """
+        Look up feature tuples scored by model `version`.
+        
+        Returns:
+            (cancel, broken_route, missing): probability arrays (NaN where
+            not cached) and the positions of the keys that were not cached
+        """
+        cancel = np.full(len(keys), np.nan)
+        broken_route = np.full(len(keys), np.nan)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get((version, key))
+                if entry is None:
+                    missing.append(i)
+                    continue
+                self._entries.move_to_end((version, key))
+                cancel[i], broken_route[i] = entry
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return cancel, broken_route, np.array(missing, dtype=np.intp)
+    
+    def set_many(self, version, keys, cancel, broken_route):
+        """Store freshly scored tuples, evicting the least recently used."""
+        with self._lock:
+            for key, entry in zip(keys, zip(cancel.tolist(), broken_route.tolist())):
+                self._entries[(version, key)] = entry
+                self._entries.move_to_end((version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Cache counters for sizing."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared by every ModelService in this process
+prediction_cache = PredictionCache()
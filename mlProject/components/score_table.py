@@ -0,0 +1,194 @@
+# ============================================================================
+# FILE: mlProject/components/score_table.py
+# ============================================================================
+"""
+Score table - precomputed probabilities for every booking the models can see.
+
+The model inputs are a handful of low-cardinality categoricals plus parts of
+booking_date, so every (date, pol, pod, lane, container_state, bundle) in a
+rolling date window can be scored ahead of time. The table is a
+memory-mapped float32 array indexed by date offset and category positions,
+with one extra slot per categorical for values the encoder has not seen
+(they all one-hot to zeros) and one extra date slot for missing dates.
+Bookings outside the window fall back to the model.
+"""
+from datetime import date, timedelta
+from itertools import product
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from mlProject.components.compiled_scorer import UnsupportedInput, parse_date
+from mlProject.constants import MODEL_TRAINER_DIR, SCORE_TABLE_FILE, SCORE_TABLE_META_FILE
+
+logging.basicConfig(level=logging.INFO)
+
+# Answer predictions from the table (with SCORE_LOOKUP=1) instead of the models
+SCORE_LOOKUP = os.environ.get('SCORE_LOOKUP', '0').lower() in ('1', 'true', 'yes')
+
+# Rolling window materialized by build_score_table, relative to the build day
+PAST_DAYS = int(os.environ.get('SCORE_TABLE_PAST_DAYS', 90))
+FUTURE_DAYS = int(os.environ.get('SCORE_TABLE_FUTURE_DAYS', 365))
+
+# Largest table build_score_table writes, in (day, combination) cells of 8 bytes
+MAX_CELLS = int(os.environ.get('SCORE_TABLE_MAX_CELLS', 50_000_000))
+
+# Stands in for every category the encoder has not seen
+UNSEEN = '\x00unseen'
+
+
+class ScoreTable:
+    """Lookup of (cancel, broken route) probabilities by booking date and categories."""
+    
+    def __init__(self, scores, start, columns, categories, model_version=None):
+        # scores[day, *category positions, target]; day == days is a missing booking_date
+        self.scores = scores
+        self.start = start
+        self.days = scores.shape[0] - 1
+        self.columns = columns
+        self.categories = categories
+        self.model_version = model_version
+        self._positions = [{value: i for i, value in enumerate(values)} for values in categories]
+    
+    @classmethod
+    def load(cls, model_version=None, directory=MODEL_TRAINER_DIR):
+        """Memory-map the table built for model_version; None if it is missing or stale."""
+        meta_path = os.path.join(directory, SCORE_TABLE_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if model_version is not None and meta['model_version'] != model_version:
+            logging.warning("Score table was built for other model files; rebuild it with build_score_table.py")
+            return None
+        
+        scores = np.load(os.path.join(directory, SCORE_TABLE_FILE), mmap_mode='r')
+        return cls(scores, date.fromisoformat(meta['start']), meta['columns'], meta['categories'], meta['model_version'])
+    
+    def lookup_frame(self, df):
+        """
+        Vectorized lookup for a DataFrame of bookings.
+        
+        Returns:
+            (cancel, broken_route, missing): probability arrays and the row
+            positions that must be scored by the model (NaN in the arrays)
+        """
+        n_rows = len(df)
+        if 'booking_date' not in df.columns or any(column not in df.columns for column in self.columns):
+            return np.full(n_rows, np.nan), np.full(n_rows, np.nan), np.arange(n_rows)
+        
+        # Parsed exactly like ModelService.engineer_features
+        dates = pd.to_datetime(df['booking_date'], errors='coerce')
+        offsets = (dates.dt.normalize() - pd.Timestamp(self.start)).dt.days
+        day = offsets.fillna(self.days).to_numpy(dtype=np.int64)
+        hit = dates.isna().to_numpy() | ((day >= 0) & (day < self.days))
+        
+        index = [np.where(hit, day, 0)]
+        for column, values in zip(self.columns, self.categories):
+            codes = pd.Index(values[:-1]).get_indexer(df[column].fillna('unknown'))
+            index.append(np.where(codes < 0, len(values) - 1, codes))
+        
+        found = self.scores[tuple(index)].astype(np.float64)
+        found[~hit] = np.nan
+        return found[:, 0], found[:, 1], np.flatnonzero(~hit)
+    
+    def lookup_records(self, records):
+        """(cancel, broken_route) arrays for dict records, None if any record is not covered."""
+        index = []
+        for record in records:
+            try:
+                booking_date = parse_date(record['booking_date'])
+            except (KeyError, UnsupportedInput):
+                return None
+            if booking_date is None:
+                day = self.days
+            else:
+                day = (booking_date - self.start).days
+                if not 0 <= day < self.days:
+                    return None
+            
+            key = [day]
+            for column, positions in zip(self.columns, self._positions):
+                if column not in record:
+                    return None
+                value = record[column]
+                if value is None or (isinstance(value, float) and value != value):
+                    value = 'unknown'
+                elif not isinstance(value, str):
+                    return None
+                key.append(positions.get(value, len(positions) - 1))
+            index.append(key)
+        
+        found = self.scores[tuple(np.array(index, dtype=np.intp).T)]
+        return found[:, 0].astype(np.float64), found[:, 1].astype(np.float64)
+
+
+def build_score_table(model_service, start=None, days=None, directory=MODEL_TRAINER_DIR, max_cells=MAX_CELLS):
+    """
+    Score every category combination on every day of the window with the
+    loaded models and write the memory-mapped table. Returns the ScoreTable;
+    ValueError if the table would exceed max_cells.
+    """
+    start = start or date.today() - timedelta(days=PAST_DAYS)
+    days = days or PAST_DAYS + FUTURE_DAYS
+    if not model_service.loaded:
+        model_service.load_models()
+    
+    encoder = model_service.encoder
+    one_hot, columns = next(
+        (transformer, columns) for _, transformer, columns in encoder.transformers_
+        if hasattr(transformer, 'categories_')
+    )
+    categories = [values.tolist() + [UNSEEN] for values in one_hot.categories_]
+    shape = tuple(len(values) for values in categories)
+    cells = (days + 1) * int(np.prod(shape))
+    if cells > max_cells:
+        raise ValueError(
+            f"Score table of {days + 1} days x {int(np.prod(shape))} combinations exceeds "
+            f"{max_cells} cells (SCORE_TABLE_MAX_CELLS)"
+        )
+    
+    # Categorical block of every combination, encoded once
+    grid = pd.DataFrame(list(product(*categories)), columns=columns)
+    grid['booking_date'] = None
+    X_grid = model_service.transform_features(model_service.feature_frame(grid))
+    X_grid = X_grid.toarray() if sparse.issparse(X_grid) else np.asarray(X_grid)
+    numerical = encoder.output_indices_['num']
+    
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, SCORE_TABLE_FILE)
+    scores = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float32, shape=(days + 1,) + shape + (2,))
+    for day in range(days + 1):
+        # Only the date columns change from day to day; the last slot is a missing date
+        booking_date = (start + timedelta(days=day)).isoformat() if day < days else None
+        date_row = model_service.transform_features(model_service.feature_frame(
+            pd.DataFrame([dict(zip(columns, (values[0] for values in categories)), booking_date=booking_date)])
+        ))
+        date_row = date_row.toarray() if sparse.issparse(date_row) else np.asarray(date_row)
+        X = X_grid.copy()
+        X[:, numerical] = date_row[0, numerical]
+        if sparse.issparse(X_grid) or getattr(encoder, 'sparse_output_', False):
+            # Sparse input leaves zeros implicit, which XGBoost treats as missing
+            X = sparse.csr_matrix(X)
+        
+        scores[day, ..., 0] = model_service.cancel_model.predict_proba(X)[:, 1].reshape(shape)
+        scores[day, ..., 1] = model_service.broken_route_model.predict_proba(X)[:, 1].reshape(shape)
+    scores.flush()
+    del scores
+    os.replace(path + '.tmp', path)
+    
+    meta = {
+        'start': start.isoformat(),
+        'days': days,
+        'columns': list(columns),
+        'categories': categories,
+        'model_version': model_service.model_version
+    }
+    with open(os.path.join(directory, SCORE_TABLE_META_FILE), 'w') as f:
+        json.dump(meta, f, indent=4)
+    logging.info(f"Score table: {days} days x {int(np.prod(shape))} combinations from {start} written to {path}")
+    
+    return ScoreTable.load(model_service.model_version, directory)
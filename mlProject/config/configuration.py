@@ -52,7 +52,10 @@ class ConfigurationManager:
             root_dir=Path(MODEL_TRAINER_DIR),
             train_data_path=Path(DATA_TRANSFORMATION_DIR),
             cancel_model_path=Path(os.path.join(MODEL_TRAINER_DIR, CANCEL_MODEL_FILE)),
-            broken_route_model_path=Path(os.path.join(MODEL_TRAINER_DIR, BROKEN_ROUTE_MODEL_FILE))
+            broken_route_model_path=Path(os.path.join(MODEL_TRAINER_DIR, BROKEN_ROUTE_MODEL_FILE)),
+            encoder_path=Path(os.path.join(DATA_TRANSFORMATION_DIR, ENCODER_FILE)),
+            compiled_scorer_path=Path(os.path.join(MODEL_TRAINER_DIR, COMPILED_SCORER_FILE)),
+            validation_data_path=Path(os.path.join(DATA_INGESTION_DIR, "test.csv"))
         )
 
     def get_model_evaluation_config(self) -> ModelEvaluationConfig:
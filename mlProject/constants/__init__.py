@@ -49,6 +49,13 @@ TARGET_BROKEN_ROUTE = "broken_route"
 CATEGORICAL_FEATURES = ["pol", "pod", "lane", "container_state", "bundle"]
 NUMERICAL_FEATURES = ["year", "month", "day", "day_of_week"]
 
+# One-hot encode into sparse CSR matrices (saved as .npz) instead of dense arrays
+SPARSE_ENCODING = True
+
+# Risk buckets: probability < 0.33 is Low, < 0.66 is Medium, otherwise High
+RISK_THRESHOLDS = [0.33, 0.66]
+RISK_LABELS = ["Low", "Medium", "High"]
+
 # Training parameters
 TEST_SIZE = 0.2
 RANDOM_STATE = 42
@@ -57,6 +64,9 @@ RANDOM_STATE = 42
 CANCEL_MODEL_FILE = "cancel_model.pkl"
 BROKEN_ROUTE_MODEL_FILE = "broken_route_model.pkl"
 ENCODER_FILE = "encoder.pkl"
+COMPILED_SCORER_FILE = "compiled_scorer.pkl"
+SCORE_TABLE_FILE = "score_table.npy"
+SCORE_TABLE_META_FILE = "score_table.json"
 SCALER_FILE = "scaler.pkl"
 METRICS_FILE = "metrics.json"
 
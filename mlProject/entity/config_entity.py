@@ -41,6 +41,9 @@ class ModelTrainerConfig:
     train_data_path: Path
     cancel_model_path: Path
     broken_route_model_path: Path
+    encoder_path: Path
+    compiled_scorer_path: Path
+    validation_data_path: Path
 
 
 @dataclass
@@ -16,13 +16,11 @@ class PredictionPipeline:
     def predict(self, data_path):
         """Run predictions on a CSV file."""
         df = pd.read_csv(data_path)
-        predictions = self.model_service.predict_all(df)
+        scores = self.model_service.predict_frame(df)
         
         # Add to dataframe
-        df['cancel_probability'] = [p['cancel']['probability'] for p in predictions]
-        df['cancel_risk'] = [p['cancel']['risk_label'] for p in predictions]
-        df['broken_route_probability'] = [p['broken_route']['probability'] for p in predictions]
-        df['broken_route_risk'] = [p['broken_route']['risk_label'] for p in predictions]
+        for column, values in scores.items():
+            df[column] = values
         
         return df
 
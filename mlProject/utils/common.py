@@ -9,6 +9,7 @@ import json
 import joblib
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
 from sklearn.model_selection import cross_val_score
 import logging
@@ -44,6 +45,31 @@ def load_json(file_path):
         return json.load(f)
 
 
+def save_matrix(matrix, file_path):
+    """
+    Save a feature matrix: sparse matrices as .npz, dense arrays as .npy.
+    file_path is given without extension; a stale file in the other format is removed.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if sparse.issparse(matrix):
+        sparse.save_npz(f"{file_path}.npz", matrix.tocsr())
+        stale = f"{file_path}.npy"
+    else:
+        np.save(f"{file_path}.npy", matrix)
+        stale = f"{file_path}.npz"
+    if os.path.exists(stale):
+        os.remove(stale)
+
+
+def load_matrix(file_path):
+    """Load a feature matrix saved by save_matrix (file_path without extension)."""
+    if os.path.exists(f"{file_path}.npz"):
+        return sparse.load_npz(f"{file_path}.npz")
+    if os.path.exists(f"{file_path}.npy"):
+        return np.load(f"{file_path}.npy")
+    raise FileNotFoundError(f"File not found: {file_path}.npz or {file_path}.npy")
+
+
 def evaluate_models(X_train, y_train, X_test, y_test, models, params=None):
     """
     Train multiple models and evaluate them.
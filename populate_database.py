@@ -98,8 +98,10 @@ def main():
                 print("   Skipping insert. Use cleanup_database.py to remove duplicates first.")
                 return
         else:
-            insert_scored_bookings(df_enriched)
-            print(f"   ✓ Saved {len(df_enriched)} records to bookings_scored table")
+            saved = insert_scored_bookings(df_enriched)
+            print(f"   ✓ Saved {saved} records to bookings_scored table")
+            if saved < len(df_enriched):
+                print(f"   ⚠ Skipped {len(df_enriched) - saved} records whose booking_id was already stored")
     except Exception as e:
         print(f"   ✗ Error saving to database: {e}")
         return
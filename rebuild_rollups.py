@@ -0,0 +1,23 @@
+# ============================================================================
+# FILE: rebuild_rollups.py
+# ============================================================================
+"""
+Recompute the bookings_rollup and filter_options tables from bookings_scored.
+insert_scored_bookings keeps them current; run this after changing
+bookings_scored outside the app (manual SQL, restores).
+"""
+import time
+from database.database.models import init_database, rebuild_rollups
+
+
+def main():
+    """Rebuild the rollup tables."""
+    init_database()
+    
+    start = time.perf_counter()
+    groups = rebuild_rollups()
+    print(f"✓ Rebuilt bookings_rollup ({groups} groups) and filter_options in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,20 +6,243 @@ Advanced analytics service for dashboard visualizations.
 """
 import pandas as pd
 import numpy as np
-from database.database.models import query_scored_bookings
+from database.database.models import (
+    query_scored_bookings, aggregate_scored_bookings, aggregate_rollup, rollup_supports,
+    get_filter_options, SCORED_COLUMNS
+)
+from database.database.columnar import get_columnar_store
+from services.cache import cached
 from datetime import datetime, timedelta
 
 
 class AnalyticsService:
     """Service for computing advanced analytics."""
     
+    # Dashboard widgets served by compute_all (widget name -> method)
+    WIDGETS = {
+        'overview': 'get_overview_stats',
+        'charts': 'get_chart_data',
+        'summary': 'get_dashboard_summary',
+        'bookings_over_time': 'get_bookings_over_time',
+        'by_port': 'get_cancellations_by_port',
+        'by_lane': 'get_cancellations_by_lane',
+        'risk_distribution': 'get_risk_distribution',
+        'flow': 'get_flow_data',
+        'seasonality': 'get_seasonality_data',
+        'network': 'get_network_data',
+        'outliers': 'get_top_risky_bookings',
+        'risk_matrix': 'get_risk_matrix_heatmap',
+        'ridgeline': 'get_ridgeline_data',
+        'stacked_area': 'get_stacked_area_data',
+        'waffle': 'get_waffle_data',
+        'top_lanes': 'get_top_risky_lanes',
+        'top_ports': 'get_top_risky_ports',
+    }
+    
+    # Columns read by each widget computed from the filtered frame
+    FRAME_COLUMNS = {
+        'overview': ['booking_id', 'cancel_probability', 'broken_route_probability', 'lane', 'pol'],
+        'charts': ['lane', 'pol', 'cancel_probability', 'booking_date'],
+        'summary': ['booking_id', 'cancel_risk', 'cancel_probability', 'broken_route_probability'],
+        'flow': ['lane', 'container_state', 'cancel_risk'],
+        'seasonality': ['booking_date', 'cancel_probability'],
+        'network': ['pol', 'pod'],
+        'outliers': [
+            'booking_id', 'booking_date', 'pol', 'pod', 'lane',
+            'cancel_probability', 'cancel_risk', 'broken_route_probability', 'broken_route_risk'
+        ],
+        'risk_matrix': ['pol', 'lane', 'cancel_probability'],
+        'ridgeline': ['booking_date', 'lane'],
+        'stacked_area': ['booking_date', 'lane'],
+        'waffle': ['container_state', 'cancel_risk'],
+    }
+    
+    # Date buckets: pandas period frequency and label format
+    DATE_BUCKETS = {
+        'day': ('D', '%Y-%m-%d'),
+        'week': ('W', '%Y-%m-%d'),
+        'month': ('M', '%Y-%m'),
+        'quarter': ('Q', '%Y-%m'),
+    }
+    
+    # freq codes accepted by get_bookings_over_time
+    FREQ_BUCKETS = {'D': 'day', 'W': 'week', 'M': 'month', 'Q': 'quarter'}
+    
+    # Most dates 'auto' bucketing returns for a series
+    MAX_SERIES_POINTS = 400
+    
+    # Frame widgets answered from bookings_rollup when rollup_supports(filters)
+    ROLLUP_WIDGETS = {'summary', 'seasonality', 'network', 'risk_matrix'}
+    
     def __init__(self):
-        pass
+        # Filtered frame shared by the widgets of one compute_all call
+        self._shared_frame = None
+    
+    def compute_all(self, filters=None, widgets=None):
+        """
+        Compute several dashboard widgets from one filtered query.
+        
+        Widgets aggregated in SQL or already cached never touch the frame; all
+        other widgets share a single scan of bookings_scored.
+        
+        Args:
+            filters: Filter dict as accepted by query_scored_bookings
+            widgets: Widget names (keys of WIDGETS); all widgets if None
+        
+        Returns:
+            Dict of widget name -> widget payload
+        """
+        widgets = list(self.WIDGETS) if not widgets else list(widgets)
+        unknown = [w for w in widgets if w not in self.WIDGETS]
+        if unknown:
+            raise ValueError(f"Unknown widgets: {', '.join(unknown)}")
+        
+        use_rollup = rollup_supports(filters)
+        needed = {
+            column for name in widgets for column in self.FRAME_COLUMNS.get(name, [])
+            if not (use_rollup and name in self.ROLLUP_WIDGETS)
+        }
+        self._shared_frame = {'columns': [column for column in SCORED_COLUMNS if column in needed]}
+        try:
+            return {name: getattr(self, self.WIDGETS[name])(filters) for name in widgets}
+        finally:
+            self._shared_frame = None
+    
+    def _frame(self, filters, widget):
+        """
+        Filtered bookings with parsed dates, loaded once per compute_all call.
+        Only the columns the widget (or, in compute_all, any requested widget)
+        reads are loaded, from the columnar store when one is enabled.
+        """
+        if self._shared_frame is not None and 'df' in self._shared_frame:
+            return self._shared_frame['df']
+        
+        if self._shared_frame is not None:
+            columns = self._shared_frame['columns']
+        else:
+            columns = self.FRAME_COLUMNS[widget]
+        
+        store = get_columnar_store()
+        if store is not None and store.available():
+            df = store.scan(filters, columns)
+        else:
+            df = query_scored_bookings(filters, columns)
+        if 'booking_date' in df.columns:
+            df['_booking_date'] = pd.to_datetime(df['booking_date'], errors='coerce')
+        
+        if self._shared_frame is not None:
+            self._shared_frame['df'] = df
+        return df
+    
+    @cached
+    def get_filter_options(self, filters=None):
+        """Get available filter options (filters are ignored, kept for the cache key)."""
+        return get_filter_options()
     
+    def _booking_dates(self, df):
+        """Parsed booking dates, reusing the column prepared by _frame."""
+        if '_booking_date' in df.columns:
+            return df['_booking_date'].rename('booking_date')
+        return pd.to_datetime(df['booking_date'], errors='coerce')
+    
+    @cached
+    def get_overview_stats(self, filters=None):
+        """Get overview KPIs."""
+        return self._overview_stats(self._frame(filters, 'overview'))
+    
+    def _overview_stats(self, df):
+        if len(df) == 0:
+            return {
+                'total_bookings': 0,
+                'cancel_rate': 0,
+                'broken_rate': 0,
+                'unique_lanes': 0,
+                'unique_ports': 0
+            }
+        
+        # Count distinct booking_ids to avoid duplicates
+        if 'booking_id' in df.columns:
+            total_bookings = int(df['booking_id'].nunique())
+        else:
+            total_bookings = int(len(df))
+        
+        return {
+            'total_bookings': total_bookings,
+            'cancel_rate': float(df['cancel_probability'].mean() * 100) if 'cancel_probability' in df.columns else 0,
+            'broken_rate': float(df['broken_route_probability'].mean() * 100) if 'broken_route_probability' in df.columns else 0,
+            'unique_lanes': int(df['lane'].nunique()) if 'lane' in df.columns else 0,
+            'unique_ports': int(df['pol'].nunique()) if 'pol' in df.columns else 0
+        }
+    
+    @cached
+    def get_chart_data(self, filters=None):
+        """Get aggregated data for the overview charts."""
+        return self._chart_data(self._frame(filters, 'charts'))
+    
+    def _chart_data(self, df):
+        if len(df) == 0:
+            return {
+                'cancel_by_lane': {'labels': [], 'values': []},
+                'cancel_by_port': {'labels': [], 'values': []},
+                'bookings_over_time': {}
+            }
+        
+        # Cancellations by lane
+        cancel_by_lane = df.groupby('lane', observed=True)['cancel_probability'].mean().sort_values(ascending=False).head(10)
+        
+        # Cancellations by port
+        cancel_by_port = df.groupby('pol', observed=True)['cancel_probability'].mean().sort_values(ascending=False).head(10)
+        
+        # Bookings over time (if booking_date exists)
+        bookings_over_time = {}
+        if 'booking_date' in df.columns:
+            booking_date = self._booking_dates(df)
+            bookings_over_time = df.groupby(booking_date.dt.to_period('M').astype(str)).size().to_dict()
+        
+        return {
+            'cancel_by_lane': {
+                'labels': cancel_by_lane.index.tolist(),
+                'values': [float(v) * 100 for v in cancel_by_lane.values]
+            },
+            'cancel_by_port': {
+                'labels': cancel_by_port.index.tolist(),
+                'values': [float(v) * 100 for v in cancel_by_port.values]
+            },
+            'bookings_over_time': bookings_over_time
+        }
+    
+    @cached
     def get_dashboard_summary(self, filters=None):
         """Get summary statistics for dashboard."""
-        df = query_scored_bookings(filters)
+        if rollup_supports(filters):
+            return self._rollup_summary(filters)
+        return self._dashboard_summary(self._frame(filters, 'summary'))
+    
+    def _rollup_summary(self, filters):
+        totals = aggregate_rollup(filters, metrics={
+            'bookings': 'bookings',
+            'booking_ids': 'booking_ids',
+            'cancel_probability': 'cancel_probability',
+            'broken_route_probability': 'broken_route_probability',
+            'high_risk': 'high_risk',
+            'medium_risk': 'medium_risk',
+            'low_risk': 'low_risk',
+        }).iloc[0]
+        if pd.isna(totals['bookings']) or totals['bookings'] == 0:
+            return self._dashboard_summary(pd.DataFrame())
         
+        return {
+            'total_bookings': int(totals['booking_ids']),
+            'cancel_rate': float(totals['cancel_probability']) * 100,
+            'broken_route_rate': float(totals['broken_route_probability']) * 100,
+            'high_risk_count': int(totals['high_risk']),
+            'medium_risk_count': int(totals['medium_risk']),
+            'low_risk_count': int(totals['low_risk']),
+            'avg_cancel_prob': float(totals['cancel_probability']) * 100,
+            'avg_broken_prob': float(totals['broken_route_probability']) * 100
+        }
+    
+    def _dashboard_summary(self, df):
         if len(df) == 0:
             return {
                 'total_bookings': 0,
@@ -54,40 +277,103 @@ class AnalyticsService:
             'avg_broken_prob': df['broken_route_probability'].mean() * 100
         }
     
-    def get_bookings_over_time(self, filters=None, freq='D'):
-        """Get bookings aggregated over time."""
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0 or 'booking_date' not in df.columns:
-            return {'dates': [], 'counts': [], 'cancel_rates': []}
-        
-        df['booking_date'] = pd.to_datetime(df['booking_date'])
-        
-        # Group by date
-        grouped = df.groupby(df['booking_date'].dt.date).agg({
-            'id': 'count',
-            'cancel_probability': 'mean'
-        }).reset_index()
+    @cached
+    def get_bookings_over_time(self, filters=None, freq='D', max_points=MAX_SERIES_POINTS):
+        """
+        Get bookings aggregated over time.
+        freq resamples the daily series to 'D', 'W' (labelled by its Monday),
+        'M' or 'Q'; longer series are then downsampled with LTTB to at most
+        max_points dates (None keeps every bucket). Downsampled counts are
+        the kept buckets only, so they no longer add up to total_bookings.
+        """
+        bucket = self.FREQ_BUCKETS.get(str(freq).upper())
+        if bucket is None:
+            raise ValueError(f"Unknown freq: {freq}")
+        if max_points is not None and max_points < 3:
+            raise ValueError("max_points must be at least 3")
+        
+        # Daily totals in SQL; probability sums keep the resampled rates exact
+        if rollup_supports(filters):
+            daily = aggregate_rollup(
+                filters,
+                group_by=['booking_day'],
+                metrics={
+                    'id': 'bookings',
+                    'probability_sum': 'cancel_probability_sum',
+                    'probability_count': 'cancel_probability_count'
+                },
+                order_by=['booking_day']
+            )
+        else:
+            daily = aggregate_scored_bookings(
+                filters,
+                group_by=['booking_day'],
+                metrics={
+                    'id': ('count', 'id'),
+                    'probability_sum': ('sum', 'cancel_probability'),
+                    'probability_count': ('count', 'cancel_probability')
+                },
+                order_by=['booking_day']
+            )
+        
+        days = pd.to_datetime(daily['booking_day'], errors='coerce')
+        grouped = daily[['id', 'probability_sum', 'probability_count']].astype(float).groupby(
+            self._date_buckets(days, bucket)
+        ).sum()
+        rates = (grouped['probability_sum'] / grouped['probability_count'].replace(0, np.nan)).fillna(0) * 100
+        total = int(grouped['id'].sum())
+        
+        downsampled = max_points is not None and len(grouped) > max_points
+        if downsampled:
+            # Points are picked on the volume series; the rate series follows them
+            x = grouped.index.values.astype('datetime64[s]').astype(float)
+            keep = self._lttb(x, grouped['id'].values, max_points)
+            grouped, rates = grouped.iloc[keep], rates.iloc[keep]
         
         return {
-            'dates': [str(d) for d in grouped['booking_date'].tolist()],
-            'counts': grouped['id'].tolist(),
-            'cancel_rates': [float(r * 100) for r in grouped['cancel_probability'].tolist()]
+            'dates': grouped.index.strftime(self.DATE_BUCKETS[bucket][1]).tolist(),
+            'counts': grouped['id'].astype(int).tolist(),
+            'cancel_rates': [float(r) for r in rates.tolist()],
+            'total_bookings': total,
+            'downsampled': downsampled
         }
     
+    @staticmethod
+    def _lttb(x, y, threshold):
+        """
+        Largest-Triangle-Three-Buckets downsampling: positions of at most
+        threshold (>= 3) points, first and last included, that keep the
+        series' shape.
+        """
+        n = len(x)
+        if threshold >= n:
+            return np.arange(n)
+        
+        # Interior points split into threshold - 2 buckets of (nearly) equal size
+        edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+        keep = np.empty(threshold, dtype=int)
+        keep[0], keep[-1] = 0, n - 1
+        selected = 0
+        for i in range(threshold - 2):
+            start, stop = edges[i], edges[i + 1]
+            # Third vertex: mean of the next bucket (the last point for the final bucket)
+            if i + 2 < len(edges):
+                next_x = x[stop:edges[i + 2]].mean()
+                next_y = y[stop:edges[i + 2]].mean()
+            else:
+                next_x, next_y = x[-1], y[-1]
+            areas = np.abs(
+                (x[selected] - next_x) * (y[start:stop] - y[selected])
+                - (x[selected] - x[start:stop]) * (next_y - y[selected])
+            )
+            selected = start + int(np.argmax(areas))
+            keep[i + 1] = selected
+        return keep
+    
+    @cached
     def get_cancellations_by_port(self, filters=None, top_n=10):
         """Get cancellation rates by port."""
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0 or 'pol' not in df.columns:
-            return {'ports': [], 'cancel_rates': [], 'counts': []}
-        
-        grouped = df.groupby('pol').agg({
-            'cancel_probability': 'mean',
-            'id': 'count'
-        }).reset_index()
-        
-        grouped = grouped.sort_values('cancel_probability', ascending=False).head(top_n)
+        grouped = self._cancel_rate_by(filters, 'pol', top_n)
         
         return {
             'ports': grouped['pol'].tolist(),
@@ -95,19 +381,10 @@ class AnalyticsService:
             'counts': grouped['id'].tolist()
         }
     
+    @cached
     def get_cancellations_by_lane(self, filters=None, top_n=10):
         """Get cancellation rates by lane."""
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0 or 'lane' not in df.columns:
-            return {'lanes': [], 'cancel_rates': [], 'counts': []}
-        
-        grouped = df.groupby('lane').agg({
-            'cancel_probability': 'mean',
-            'id': 'count'
-        }).reset_index()
-        
-        grouped = grouped.sort_values('cancel_probability', ascending=False).head(top_n)
+        grouped = self._cancel_rate_by(filters, 'lane', top_n)
         
         return {
             'lanes': grouped['lane'].tolist(),
@@ -115,29 +392,52 @@ class AnalyticsService:
             'counts': grouped['id'].tolist()
         }
     
+    def _cancel_rate_by(self, filters, column, top_n):
+        """Mean cancel probability and booking count per group, riskiest first."""
+        if rollup_supports(filters):
+            return aggregate_rollup(
+                filters,
+                group_by=[column],
+                metrics={'cancel_probability': 'cancel_probability', 'id': 'bookings'},
+                order_by=['-cancel_probability', column],
+                limit=top_n
+            )
+        return aggregate_scored_bookings(
+            filters,
+            group_by=[column],
+            metrics={'cancel_probability': ('avg', 'cancel_probability'), 'id': ('count', 'id')},
+            order_by=['-cancel_probability', column],
+            limit=top_n
+        )
+    
+    @cached
     def get_risk_distribution(self, filters=None):
         """Get risk distribution."""
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0 or 'cancel_risk' not in df.columns:
-            return {'labels': [], 'values': []}
-        
-        risk_counts = df['cancel_risk'].value_counts().to_dict()
+        risk_counts = aggregate_scored_bookings(
+            filters,
+            group_by=['cancel_risk'],
+            metrics={'count': ('count', '*')},
+            order_by=['-count']
+        )
         
         return {
-            'labels': list(risk_counts.keys()),
-            'values': list(risk_counts.values())
+            'labels': risk_counts['cancel_risk'].tolist(),
+            'values': risk_counts['count'].tolist()
         }
     
+    @cached
     def get_flow_data(self, filters=None):
         """Get flow data for Sankey diagram."""
-        df = query_scored_bookings(filters)
-        
+        return self._flow_data(self._frame(filters, 'flow'))
+    
+    def _flow_data(self, df):
         if len(df) == 0:
             return {'nodes': [], 'links': []}
         
-        # Create flow: Lane -> Container State -> Risk
-        flows = df.groupby(['lane', 'container_state', 'cancel_risk']).size().reset_index(name='value')
+        # Create flow: Lane -> Container State -> Risk (dimension columns are
+        # categoricals, so only observed combinations are kept)
+        flows = df.groupby(['lane', 'container_state', 'cancel_risk'], observed=True).size().reset_index(name='value')
+        flows[['lane', 'container_state', 'cancel_risk']] = flows[['lane', 'container_state', 'cancel_risk']].astype(str)
         
         # Create nodes (unique lanes, states, risks)
         lanes = sorted([str(l) for l in df['lane'].dropna().unique()])
@@ -145,47 +445,55 @@ class AnalyticsService:
         risks = ['Low', 'Medium', 'High']
         
         nodes = lanes + states + risks
-        node_dict = {node: idx for idx, node in enumerate(nodes)}
-        
-        # Create links: Lane -> State -> Risk
-        links = []
-        for _, row in flows.iterrows():
-            lane = str(row['lane'])
-            state = str(row['container_state']) if pd.notna(row['container_state']) else None
-            risk = str(row['cancel_risk']) if pd.notna(row['cancel_risk']) else None
-            
-            if lane in node_dict:
-                # Link Lane -> State
-                if state and state in node_dict:
-                    links.append({
-                        'source': node_dict[lane],
-                        'target': node_dict[state],
-                        'value': int(row['value'])
-                    })
-                # Link State -> Risk
-                if state and state in node_dict and risk and risk in node_dict:
-                    links.append({
-                        'source': node_dict[state],
-                        'target': node_dict[risk],
-                        'value': int(row['value'])
-                    })
+        
+        # Links per node pair, with each level's node indices looked up in one pass
+        lane_state = flows.groupby(['lane', 'container_state'], sort=False)['value'].sum().reset_index()
+        state_risk = flows[flows['cancel_risk'].isin(risks)].groupby(
+            ['container_state', 'cancel_risk'], sort=False
+        )['value'].sum().reset_index()
+        
+        links = pd.concat([
+            pd.DataFrame({
+                'source': pd.Index(lanes).get_indexer(lane_state['lane']),
+                'target': len(lanes) + pd.Index(states).get_indexer(lane_state['container_state']),
+                'value': lane_state['value'],
+            }),
+            pd.DataFrame({
+                'source': len(lanes) + pd.Index(states).get_indexer(state_risk['container_state']),
+                'target': len(lanes) + len(states) + pd.Index(risks).get_indexer(state_risk['cancel_risk']),
+                'value': state_risk['value'],
+            }),
+        ], ignore_index=True).astype(int)
         
         return {
             'nodes': [{'name': n} for n in nodes],
-            'links': links
+            'links': links.to_dict(orient='records')
         }
     
+    @cached
     def get_seasonality_data(self, filters=None):
         """Get seasonality data for calendar heatmap."""
-        df = query_scored_bookings(filters)
-        
+        if rollup_supports(filters):
+            daily = aggregate_rollup(
+                filters,
+                group_by=['booking_day'],
+                metrics={'cancel_probability': 'cancel_probability'},
+                order_by=['booking_day']
+            )
+            return {
+                'dates': daily['booking_day'].tolist(),
+                'values': [float(v * 100) for v in daily['cancel_probability'].tolist()]
+            }
+        return self._seasonality_data(self._frame(filters, 'seasonality'))
+    
+    def _seasonality_data(self, df):
         if len(df) == 0 or 'booking_date' not in df.columns:
             return {'dates': [], 'values': []}
         
-        df['booking_date'] = pd.to_datetime(df['booking_date'])
+        booking_date = self._booking_dates(df)
         
         # Group by date
-        daily = df.groupby(df['booking_date'].dt.date).agg({
+        daily = df.groupby(booking_date.dt.date).agg({
             'cancel_probability': 'mean'
         }).reset_index()
         
@@ -194,93 +502,140 @@ class AnalyticsService:
             'values': [float(v * 100) for v in daily['cancel_probability'].tolist()]
         }
     
-    def get_network_data(self, filters=None):
-        """Get network data for chord diagram (POL <-> POD)."""
-        df = query_scored_bookings(filters)
+    @cached
+    def get_network_data(self, filters=None, top_n=10):
+        """Get network data for chord diagram (POL <-> POD) over the top_n busiest POLs and PODs."""
+        if rollup_supports(filters):
+            return self._rollup_network(filters, top_n)
+        return self._network_data(self._frame(filters, 'network'), top_n)
+    
+    def _rollup_network(self, filters, top_n=10):
+        top_pols = self._rollup_top(filters, 'pol', top_n)
+        top_pods = self._rollup_top(filters, 'pod', top_n)
+        if not top_pols and not top_pods:
+            return {'matrix': [], 'labels': []}
+        
+        ports = list(dict.fromkeys(top_pols + top_pods))
+        counts = aggregate_rollup(
+            filters, group_by=['pol', 'pod'], metrics={'count': 'bookings'}
+        ).set_index(['pol', 'pod'])['count']
         
+        return {
+            'matrix': self._matrix(counts, ports, ports),
+            'labels': ports
+        }
+    
+    def _network_data(self, df, top_n=10):
         if len(df) == 0 or 'pol' not in df.columns or 'pod' not in df.columns:
             return {'matrix': [], 'labels': []}
         
         # Get top ports
-        top_pols = df['pol'].value_counts().head(10).index.tolist()
-        top_pods = df['pod'].value_counts().head(10).index.tolist()
-        ports = list(set(top_pols + top_pods))
-        
-        # Create matrix
-        matrix = []
-        for pol in ports:
-            row = []
-            for pod in ports:
-                count = len(df[(df['pol'] == pol) & (df['pod'] == pod)])
-                row.append(count)
-            matrix.append(row)
+        top_pols = df['pol'].value_counts().head(top_n).index.tolist()
+        top_pods = df['pod'].value_counts().head(top_n).index.tolist()
+        ports = list(dict.fromkeys(top_pols + top_pods))
+        
+        # One grouped count over the bookings between those ports
+        counts = df[df['pol'].isin(ports) & df['pod'].isin(ports)].groupby(['pol', 'pod'], observed=True).size()
         
         return {
-            'matrix': matrix,
+            'matrix': self._matrix(counts, ports, ports),
             'labels': ports
         }
     
+    @staticmethod
+    def _matrix(cells, rows, columns, fill=0):
+        """
+        Series keyed by (row, column) as a rows x columns list of lists;
+        pairs missing from cells are fill.
+        """
+        if not rows or not columns:
+            return [[] for _ in rows]
+        grid = pd.MultiIndex.from_product([rows, columns])
+        values = cells.reindex(grid, fill_value=fill).to_numpy()
+        return values.reshape(len(rows), len(columns)).tolist()
+    
+    def _rollup_top(self, filters, column, top_n):
+        """Busiest values of a rollup dimension (ties by name)."""
+        return aggregate_rollup(
+            filters, group_by=[column], metrics={'count': 'bookings'}, order_by=['-count', column], limit=top_n
+        )[column].tolist()
+    
+    @cached
     def get_top_risky_bookings(self, filters=None, top_n=10):
         """Get top risky bookings."""
-        df = query_scored_bookings(filters)
-        
+        return self._top_risky_bookings(self._frame(filters, 'outliers'), top_n)
+    
+    def _top_risky_bookings(self, df, top_n=10):
         if len(df) == 0:
             return []
         
-        df_sorted = df.sort_values('cancel_probability', ascending=False).head(top_n)
-        
-        return df_sorted[[
+        df_sorted = df.sort_values('cancel_probability', ascending=False).head(top_n)[[
             'booking_id', 'booking_date', 'pol', 'pod', 'lane',
             'cancel_probability', 'cancel_risk', 'broken_route_probability', 'broken_route_risk'
-        ]].to_dict(orient='records')
+        ]]
+        
+        # Missing values (NaN in the categorical columns) serialize as null
+        return df_sorted.astype(object).where(df_sorted.notna(), None).to_dict(orient='records')
+    
+    @cached
+    def get_risk_matrix_heatmap(self, filters=None, top_n=10):
+        """Get risk matrix heatmap data (Port x Lane) over the top_n busiest ports and lanes."""
+        if rollup_supports(filters):
+            return self._rollup_risk_matrix(filters, top_n)
+        return self._risk_matrix_heatmap(self._frame(filters, 'risk_matrix'), top_n)
     
-    def get_risk_matrix_heatmap(self, filters=None):
-        """Get risk matrix heatmap data (Port x Lane)."""
-        df = query_scored_bookings(filters)
+    def _rollup_risk_matrix(self, filters, top_n=10):
+        top_ports = self._rollup_top(filters, 'pol', top_n)
+        top_lanes = self._rollup_top(filters, 'lane', top_n)
+        if not top_ports and not top_lanes:
+            return {'ports': [], 'lanes': [], 'matrix': []}
         
+        cells = aggregate_rollup(
+            filters, group_by=['pol', 'lane'], metrics={'cancel_probability': 'cancel_probability'}
+        ).set_index(['pol', 'lane'])['cancel_probability']
+        
+        return {
+            'ports': top_ports,
+            'lanes': top_lanes,
+            'matrix': self._matrix(cells.astype(float) * 100, top_ports, top_lanes)
+        }
+    
+    def _risk_matrix_heatmap(self, df, top_n=10):
         if len(df) == 0 or 'pol' not in df.columns or 'lane' not in df.columns:
             return {'ports': [], 'lanes': [], 'matrix': []}
         
         # Get top ports and lanes
-        top_ports = df['pol'].value_counts().head(10).index.tolist()
-        top_lanes = df['lane'].value_counts().head(10).index.tolist()
-        
-        # Create matrix
-        matrix = []
-        for port in top_ports:
-            row = []
-            for lane in top_lanes:
-                subset = df[(df['pol'] == port) & (df['lane'] == lane)]
-                if len(subset) > 0:
-                    avg_prob = subset['cancel_probability'].mean() * 100
-                else:
-                    avg_prob = 0
-                row.append(float(avg_prob))
-            matrix.append(row)
+        top_ports = df['pol'].value_counts().head(top_n).index.tolist()
+        top_lanes = df['lane'].value_counts().head(top_n).index.tolist()
+        
+        # Mean per (port, lane) pair in one grouped pass; pairs without bookings are 0
+        subset = df[df['pol'].isin(top_ports) & df['lane'].isin(top_lanes)]
+        cells = subset.groupby(['pol', 'lane'], observed=True)['cancel_probability'].mean()
         
         return {
             'ports': top_ports,
             'lanes': top_lanes,
-            'matrix': matrix
+            'matrix': self._matrix(cells.astype(float) * 100, top_ports, top_lanes)
         }
     
+    @cached
     def get_ridgeline_data(self, filters=None):
         """Get ridgeline plot data (volume over time per lane)."""
-        df = query_scored_bookings(filters)
-        
+        return self._ridgeline_data(self._frame(filters, 'ridgeline'))
+    
+    def _ridgeline_data(self, df):
         if len(df) == 0 or 'booking_date' not in df.columns or 'lane' not in df.columns:
             return {}
         
-        df['booking_date'] = pd.to_datetime(df['booking_date'])
-        df['month'] = df['booking_date'].dt.to_period('M').astype(str)
+        month = self._booking_dates(df).dt.to_period('M').astype(str)
         
         # Get top lanes
         top_lanes = df['lane'].value_counts().head(5).index.tolist()
         
         result = {}
         for lane in top_lanes:
-            lane_df = df[df['lane'] == lane]
-            monthly = lane_df.groupby('month').size()
+            lane_mask = df['lane'] == lane
+            monthly = month[lane_mask].groupby(month[lane_mask]).size()
             result[lane] = {
                 'months': monthly.index.tolist(),
                 'counts': monthly.values.tolist()
@@ -288,44 +643,58 @@ class AnalyticsService:
         
         return result
     
-    def get_stacked_area_data(self, filters=None):
-        """Get stacked area chart data (bookings over time by lane)."""
-        df = query_scored_bookings(filters)
-        
+    @cached
+    def get_stacked_area_data(self, filters=None, bucket='auto'):
+        """
+        Get stacked area chart data (bookings over time by lane).
+        bucket is 'day', 'week' (labelled by its Monday), 'month', or 'auto'
+        for the finest of those giving at most MAX_SERIES_POINTS dates.
+        """
+        return self._stacked_area_data(self._frame(filters, 'stacked_area'), bucket)
+    
+    def _stacked_area_data(self, df, bucket='auto'):
         if len(df) == 0 or 'booking_date' not in df.columns or 'lane' not in df.columns:
             return {'dates': [], 'lanes': [], 'data': []}
         
-        df['booking_date'] = pd.to_datetime(df['booking_date'])
-        df['date'] = df['booking_date'].dt.date
+        dates = self._booking_dates(df)
+        if bucket == 'auto':
+            bucket = self._auto_bucket(dates)
+        buckets = self._date_buckets(dates, bucket)
         
         # Get top lanes
         top_lanes = df['lane'].value_counts().head(5).index.tolist()
         
-        # Group by date and lane
-        grouped = df.groupby(['date', 'lane']).size().reset_index(name='count')
-        
-        # Get all unique dates
-        all_dates = sorted(df['date'].unique())
-        
-        # Build data structure
-        data = []
-        for lane in top_lanes:
-            lane_data = []
-            for date in all_dates:
-                count = grouped[(grouped['date'] == date) & (grouped['lane'] == lane)]['count'].values
-                lane_data.append(int(count[0]) if len(count) > 0 else 0)
-            data.append(lane_data)
+        # Bookings per (date bucket, lane) as a dates x lanes grid
+        counts = df['lane'].groupby([buckets, df['lane']], observed=True).size().unstack(fill_value=0)
+        all_dates = buckets.dropna().drop_duplicates().sort_values()
+        grid = counts.reindex(index=all_dates, columns=top_lanes, fill_value=0)
         
         return {
-            'dates': [str(d) for d in all_dates],
+            'dates': all_dates.dt.strftime(self.DATE_BUCKETS[bucket][1]).tolist(),
             'lanes': top_lanes,
-            'data': data
+            'data': grid.T.astype(int).values.tolist()
         }
     
+    def _auto_bucket(self, dates):
+        """Finest bucket that keeps the date range within MAX_SERIES_POINTS."""
+        span_days = (dates.max() - dates.min()).days + 1 if dates.notna().any() else 0
+        for bucket, days in (('day', 1), ('week', 7)):
+            if span_days / days <= self.MAX_SERIES_POINTS:
+                return bucket
+        return 'month'
+    
+    def _date_buckets(self, dates, bucket):
+        """Start of each date's bucket (NaT for missing dates)."""
+        if bucket not in self.DATE_BUCKETS:
+            raise ValueError(f"Unknown date bucket: {bucket}")
+        return dates.dt.to_period(self.DATE_BUCKETS[bucket][0]).dt.start_time
+    
+    @cached
     def get_waffle_data(self, filters=None):
         """Get waffle chart data (empty vs loaded vs cancelled vs idle)."""
-        df = query_scored_bookings(filters)
-        
+        return self._waffle_data(self._frame(filters, 'waffle'))
+    
+    def _waffle_data(self, df):
         if len(df) == 0:
             return {'labels': [], 'values': []}
         
@@ -342,34 +711,12 @@ class AnalyticsService:
             'values': list(categories.values())
         }
     
+    @cached
     def get_top_risky_lanes(self, filters=None, top_n=5):
         """Get top risky lanes."""
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0 or 'lane' not in df.columns:
-            return []
-        
-        grouped = df.groupby('lane').agg({
-            'cancel_probability': 'mean',
-            'id': 'count'
-        }).reset_index()
-        
-        grouped = grouped.sort_values('cancel_probability', ascending=False).head(top_n)
-        
-        return grouped.to_dict(orient='records')
+        return self._cancel_rate_by(filters, 'lane', top_n).to_dict(orient='records')
     
+    @cached
     def get_top_risky_ports(self, filters=None, top_n=5):
         """Get top risky ports."""
-        df = query_scored_bookings(filters)
-        
-        if len(df) == 0 or 'pol' not in df.columns:
-            return []
-        
-        grouped = df.groupby('pol').agg({
-            'cancel_probability': 'mean',
-            'id': 'count'
-        }).reset_index()
-        
-        grouped = grouped.sort_values('cancel_probability', ascending=False).head(top_n)
-        
-        return grouped.to_dict(orient='records')
\ No newline at end of file
+        return self._cancel_rate_by(filters, 'pol', top_n).to_dict(orient='records')
@@ -0,0 +1,190 @@
+# ============================================================================
+# FILE: services/batching.py
+# ============================================================================
+"""
+Micro-batching for /api/predict.
+Concurrent single-booking requests are queued and scored together by one
+worker thread, so the fixed per-call cost of ModelService is paid once per
+batch instead of once per request. Each request waits at most max_wait_ms
+for others to join; a batch is flushed early once max_rows are queued.
+"""
+from collections import Counter
+from concurrent.futures import Future
+import logging
+import os
+import queue
+import threading
+import time
+
+from mlProject.components.compiled_scorer import UnsupportedInput, parse_date
+from mlProject.constants import CATEGORICAL_FEATURES
+
+# Coalescing is opt-in; with PREDICT_BATCHING=0 requests are scored directly
+ENABLED = os.environ.get('PREDICT_BATCHING', '0').lower() in ('1', 'true', 'yes')
+
+# Longest a request waits for its batch to fill before it is scored
+MAX_WAIT_MS = float(os.environ.get('PREDICT_BATCH_MAX_WAIT_MS', 5))
+
+# Largest batch; the default keeps batches on ModelService's compiled scorer
+MAX_ROWS = int(os.environ.get('PREDICT_BATCH_MAX_ROWS', 64))
+
+# Longest a request waits for its batch to be scored before giving up
+TIMEOUT_S = float(os.environ.get('PREDICT_BATCH_TIMEOUT_S', 30))
+
+
+class PredictionBatcher:
+    """
+    Coalesces predict() calls from request threads into ModelService.predict_records batches.
+    Batch sizes, queue wait and scoring time are counted per process.
+    """
+    
+    def __init__(self, model_service, enabled=ENABLED, max_wait_ms=MAX_WAIT_MS, max_rows=MAX_ROWS, timeout_s=TIMEOUT_S):
+        self.model_service = model_service
+        self.enabled = enabled
+        self.max_wait_ms = max_wait_ms
+        self.max_rows = max_rows
+        self.timeout_s = timeout_s
+        
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        
+        self.batch_sizes = Counter()
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.score_seconds = 0.0
+    
+    def predict(self, record):
+        """
+        Prediction for one booking dict, shaped like a predict_all row.
+        Raises ValueError for anything but a dict and TimeoutError when the
+        batch is not scored within timeout_s.
+        """
+        if not isinstance(record, dict):
+            raise ValueError("A booking must be a JSON object")
+        if not self.enabled:
+            return self.model_service.predict_records([record])[0]
+        
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((record, future, time.perf_counter()))
+        return future.result(timeout=self.timeout_s)
+    
+    def _ensure_worker(self):
+        """
+        Start the batching thread (again after a fork, which only copies the
+        caller's thread, or if it died).
+        """
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                self._worker.start()
+            elif not self._worker.is_alive():
+                # Requests already queued are picked up by the new thread
+                logging.error("Prediction batcher thread died, restarting it")
+                self._worker = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait_ms / 1000
+            
+            # Fill until the oldest request's deadline, then take whatever is already queued
+            while len(batch) < self.max_rows:
+                try:
+                    timeout = deadline - time.perf_counter()
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                self._score(batch)
+            except Exception as e:
+                # Never leave a request waiting on a batch that failed outside scoring
+                logging.error(f"Prediction batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+    
+    def _score(self, batch):
+        """Score a batch and resolve each request's future."""
+        records = [record for record, _, _ in batch]
+        started = time.perf_counter()
+        
+        # A frame fills columns missing from one record and pd.to_datetime
+        # infers one date format per frame, so incomplete bookings and other
+        # date formats are scored on their own: results never depend on
+        # what a booking was batched with
+        results = [None] * len(records)
+        batched = [i for i, record in enumerate(records) if _batchable(record)]
+        for i, result in zip(batched, self._score_many([records[i] for i in batched])):
+            results[i] = result
+        for i in set(range(len(records))) - set(batched):
+            results[i] = self._score_one(records[i])
+        finished = time.perf_counter()
+        
+        waits = [started - queued_at for _, _, queued_at in batch]
+        with self._lock:
+            self.batch_sizes[len(batch)] += 1
+            self.wait_seconds += sum(waits)
+            self.max_wait_seconds = max(self.max_wait_seconds, max(waits))
+            self.score_seconds += finished - started
+        logging.debug(f"Scored batch of {len(batch)} in {(finished - started) * 1000:.1f} ms")
+        
+        for (_, future, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    def _score_many(self, records):
+        if len(records) <= 1:
+            return [self._score_one(record) for record in records]
+        try:
+            return self.model_service.predict_records(records)
+        except Exception:
+            # One malformed booking must not fail the requests batched with it
+            return [self._score_one(record) for record in records]
+    
+    def _score_one(self, record):
+        try:
+            return self.model_service.predict_records([record])[0]
+        except Exception as e:
+            return e
+    
+    def stats(self):
+        """Batch size distribution and latency counters for tuning max_wait_ms / max_rows."""
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            rows = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                'enabled': self.enabled,
+                'max_wait_ms': self.max_wait_ms,
+                'max_rows': self.max_rows,
+                'timeout_s': self.timeout_s,
+                'batches': batches,
+                'rows': rows,
+                'mean_batch_size': rows / batches if batches else 0.0,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'mean_queue_wait_ms': self.wait_seconds / rows * 1000 if rows else 0.0,
+                'max_queue_wait_ms': self.max_wait_seconds * 1000,
+                'mean_batch_score_ms': self.score_seconds / batches * 1000 if batches else 0.0,
+                'queued': self._queue.qsize()
+            }
+
+
+def _batchable(record):
+    """Whether the booking scores the same whatever else is in the frame."""
+    if any(column not in record for column in CATEGORICAL_FEATURES + ['booking_date']):
+        return False
+    try:
+        parse_date(record['booking_date'])
+        return True
+    except UnsupportedInput:
+        return False
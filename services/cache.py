@@ -0,0 +1,312 @@
+# ============================================================================
+# FILE: services/cache.py
+# ============================================================================
+"""
+Result cache for dashboard analytics.
+Entries are keyed on (method, normalized filters, params) and tagged with the
+bookings_scored table version, so any write to the table invalidates them.
+The store is pluggable: per-process memory, a SQLite file shared by all
+gunicorn workers, or a Redis-compatible server.
+"""
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import inspect
+import pickle
+import sqlite3
+import threading
+import time
+import os
+
+from database.database.models import get_table_version
+from mlProject.constants import ARTIFACTS_DIR
+
+CACHE_DATABASE_PATH = os.path.join(ARTIFACTS_DIR, 'analytics_cache.db')
+
+
+def normalize_filters(filters=None):
+    """Turn a filter dict into a hashable, order-independent key."""
+    if not filters:
+        return ()
+    
+    normalized = {}
+    for key, value in filters.items():
+        if value is None or value == '':
+            continue
+        if key in ('month', 'year'):
+            value = int(value)
+        normalized[key] = str(value)
+    
+    return tuple(sorted(normalized.items()))
+
+
+class MemoryCacheBackend:
+    """Per-process LRU store."""
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def set(self, key, entry, ttl):
+        """Store entry; returns the number of entries evicted."""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk LRU store shared by every worker process on the host.
+    Lives in its own file so cache traffic never locks logistics.db.
+    """
+    
+    def __init__(self, path=CACHE_DATABASE_PATH, max_entries=256):
+        self.path = path
+        self.max_entries = max_entries
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                last_access REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries(last_access)')
+        conn.commit()
+        conn.close()
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT value FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+        conn.close()
+        return pickle.loads(row[0]) if row is not None else None
+    
+    def set(self, key, entry, ttl):
+        """Store entry; returns the number of entries evicted."""
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, last_access) VALUES (?, ?, ?)',
+            (key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+        )
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        evicted = 0
+        if count > self.max_entries:
+            evicted = conn.execute(
+                'DELETE FROM cache_entries WHERE key IN '
+                '(SELECT key FROM cache_entries ORDER BY last_access LIMIT ?)',
+                (count - self.max_entries,)
+            ).rowcount
+        conn.commit()
+        conn.close()
+        return evicted
+    
+    def delete(self, key):
+        conn = self._connect()
+        conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        conn.commit()
+        conn.close()
+    
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM cache_entries')
+        conn.commit()
+        conn.close()
+    
+    def size(self):
+        conn = self._connect()
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        conn.close()
+        return count
+
+
+class RedisCacheBackend:
+    """
+    Store backed by a Redis-compatible client (redis.Redis, fakeredis, ...).
+    Expiry uses Redis TTLs; LRU eviction is left to the server's maxmemory-policy.
+    """
+    
+    def __init__(self, client, prefix='analytics:'):
+        self.client = client
+        self.prefix = prefix
+    
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis cache backend requires the 'redis' package")
+        return cls(redis.Redis.from_url(url), **kwargs)
+    
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+    
+    def set(self, key, entry, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=int(ttl))
+        return 0
+    
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+    
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+    
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*'))
+
+
+class ResultCache:
+    """
+    Version-aware result cache with TTL expiry over a pluggable backend.
+    Hit/miss/eviction counters are kept per process.
+    """
+    
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+    
+    def get(self, key, version):
+        """Return (hit, value) for key if it is fresh and matches version."""
+        key = make_key(key)
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count(misses=1)
+            return False, None
+        
+        entry_version, expires_at, value = entry
+        if entry_version != version or expires_at < time.time():
+            self.backend.delete(key)
+            self._count(misses=1, invalidations=1)
+            return False, None
+        
+        self._count(hits=1)
+        return True, value
+    
+    def set(self, key, version, value):
+        """Store value for key, evicting least recently used entries."""
+        evicted = self.backend.set(make_key(key), (version, time.time() + self.ttl, value), self.ttl)
+        if evicted:
+            self._count(evictions=evicted)
+    
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        self.backend.clear()
+    
+    def stats(self):
+        """Cache counters for sizing."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'entries': self.backend.size(),
+                'max_entries': getattr(self.backend, 'max_entries', None),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def make_key(key):
+    """Stable string form of a cache key, usable by any backend."""
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def create_backend(name=None, max_entries=None):
+    """Build the backend selected by ANALYTICS_CACHE_BACKEND (memory, sqlite or redis)."""
+    name = (name or os.environ.get('ANALYTICS_CACHE_BACKEND', 'memory')).lower()
+    max_entries = max_entries or int(os.environ.get('ANALYTICS_CACHE_SIZE', 256))
+    
+    if name == 'memory':
+        return MemoryCacheBackend(max_entries=max_entries)
+    if name == 'sqlite':
+        return SQLiteCacheBackend(max_entries=max_entries)
+    if name == 'redis':
+        return RedisCacheBackend.from_url(os.environ.get('ANALYTICS_CACHE_URL', 'redis://localhost:6379/0'))
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+# Shared by every AnalyticsService instance in this process (and, with the
+# sqlite or redis backend, by every worker)
+analytics_cache = ResultCache(
+    backend=create_backend(),
+    ttl=int(os.environ.get('ANALYTICS_CACHE_TTL', 300))
+)
+
+
+def cached(method):
+    """
+    Cache a function or method taking (filters=None, **params).
+    
+    Cached payloads are shared between callers and must be treated as read-only.
+    """
+    signature = inspect.signature(method)
+    
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        arguments.pop('self', None)
+        filters = arguments.pop('filters', None)
+        
+        key = (method.__qualname__, normalize_filters(filters), tuple(sorted(arguments.items())))
+        version = get_table_version()
+        
+        hit, value = analytics_cache.get(key, version)
+        if hit:
+            return value
+        
+        value = method(*args, **kwargs)
+        analytics_cache.set(key, version, value)
+        return value
+    
+    return wrapper
@@ -7,6 +7,7 @@ Accepts CSV, Excel, JSON and standardizes column names.
 """
 import pandas as pd
 import os
+import uuid
 from typing import Union
 import logging
 
@@ -38,6 +39,9 @@ class DataIngestionService:
         'created_date': 'booking_date',
     }
     
+    # Rows per chunk when streaming large files
+    CHUNK_SIZE = 50000
+    
     def __init__(self):
         self.supported_formats = ['.csv', '.xlsx', '.xls', '.json']
     
@@ -68,8 +72,11 @@ class DataIngestionService:
         logging.info(f"Read {len(df)} records from {file_type} file")
         return df
     
-    def standardize_columns(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Standardize column names."""
+    def standardize_columns(self, df: pd.DataFrame, upload_id: str = None) -> pd.DataFrame:
+        """
+        Standardize column names. Generated booking_ids are prefixed with
+        upload_id (a new one per call if not given).
+        """
         df_std = df.copy()
         
         # Convert column names to lowercase for matching
@@ -96,7 +103,9 @@ class DataIngestionService:
             if 'booking_no' in df_std.columns:
                 df_std['booking_id'] = df_std['booking_no']
             else:
-                df_std['booking_id'] = df_std.index.astype(str)
+                # Row positions repeat across uploads, booking_id is unique in the database
+                upload_id = upload_id or new_upload_id()
+                df_std['booking_id'] = upload_id + '-' + df_std.index.astype(str)
         
         logging.info(f"Standardized columns: {list(df_std.columns)}")
         return df_std
@@ -114,3 +123,36 @@ class DataIngestionService:
             raise ValueError("Empty dataset")
         
         return df
+    
+    def iter_chunks(self, file_path_or_obj, chunksize=None):
+        """
+        Ingest a file as a stream of standardized DataFrames.
+        
+        CSV files are read incrementally so memory stays bounded by chunksize;
+        Excel and JSON cannot be parsed incrementally and are split after reading.
+        """
+        chunksize = chunksize or self.CHUNK_SIZE
+        file_type = self.detect_file_type(file_path_or_obj)
+        
+        if file_type == '.csv':
+            chunks = pd.read_csv(file_path_or_obj, chunksize=chunksize)
+        else:
+            df = self.read_file(file_path_or_obj)
+            chunks = (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+        
+        # One prefix for the whole file, so generated ids follow the row number
+        upload_id = new_upload_id()
+        total = 0
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+            total += len(chunk)
+            yield self.standardize_columns(chunk, upload_id)
+        
+        if total == 0:
+            raise ValueError("Empty dataset")
+
+
+def new_upload_id():
+    """Prefix for the booking_ids generated for one upload."""
+    return uuid.uuid4().hex[:12]
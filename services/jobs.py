@@ -0,0 +1,168 @@
+# ============================================================================
+# FILE: services/jobs.py
+# ============================================================================
+"""
+Asynchronous bulk scoring jobs.
+Uploads are spooled to artifacts/jobs/<id>/ and scored by a local process
+pool (no external broker). Job state lives in the bulk_jobs table, so a job
+queued or interrupted by a worker restart is picked up again on startup.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+import logging
+import time
+import uuid
+import os
+import pandas as pd
+
+from mlProject.constants import ARTIFACTS_DIR
+from database.database.models import (
+    create_bulk_job, claim_bulk_job, update_bulk_job, get_bulk_job,
+    requeue_stale_bulk_jobs, insert_scored_bookings
+)
+
+logging.basicConfig(level=logging.INFO)
+
+JOBS_DIR = os.path.join(ARTIFACTS_DIR, 'jobs')
+
+# A running job that has not reported progress for this long is re-queued
+STALE_JOB_SECONDS = 300
+
+# Predictor loaded once per pool process
+_predictor = None
+
+
+def _get_predictor():
+    global _predictor
+    if _predictor is None:
+        from core.predictor import UnifiedPredictor
+        _predictor = UnifiedPredictor()
+        _predictor.load_models()
+    return _predictor
+
+
+def run_bulk_job(job_id):
+    """Ingest, score and store one job inside a pool process."""
+    if not claim_bulk_job(job_id, os.getpid()):
+        return
+    
+    job = get_bulk_job(job_id)
+    try:
+        from services.ingestion import DataIngestionService
+        ingestion_service = DataIngestionService()
+        predictor = _get_predictor()
+        
+        rows = 0
+        saved = 0
+        with open(job['output_path'], 'w', newline='') as output:
+            for i, chunk in enumerate(ingestion_service.iter_chunks(job['input_path'])):
+                df_enriched = predictor.predict_bookings(chunk)
+                saved += insert_scored_bookings(df_enriched)
+                df_enriched.to_csv(output, index=False, header=(i == 0))
+                rows += len(df_enriched)
+                update_bulk_job(job_id, rows_processed=rows)
+        
+        update_bulk_job(job_id, status='completed', finished_at=time.time())
+        os.remove(job['input_path'])
+        logging.info(f"Bulk job {job_id}: saved {saved} of {rows} scored bookings to database")
+    except Exception as e:
+        logging.error(f"Bulk job {job_id} failed: {e}")
+        update_bulk_job(job_id, status='failed', error=str(e), finished_at=time.time())
+
+
+class JobManager:
+    """Queues bulk scoring jobs onto a local process pool."""
+    
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or int(os.environ.get('BULK_JOB_WORKERS', 2))
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already ran XGBoost/OpenMP can hang
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+    
+    def submit(self, file):
+        """Spool an uploaded file to disk and queue it; returns the job id."""
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(JOBS_DIR, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        
+        ext = os.path.splitext(file.filename)[1].lower()
+        input_path = os.path.join(job_dir, 'input' + ext)
+        output_path = os.path.join(job_dir, 'predictions.csv')
+        file.save(input_path)
+        
+        create_bulk_job(job_id, file.filename, input_path, output_path)
+        self._pool().submit(run_bulk_job, job_id)
+        logging.info(f"Queued bulk job {job_id} ({file.filename})")
+        return job_id
+    
+    def recover(self):
+        """Re-submit queued and stale running jobs; returns how many were queued."""
+        # Pool processes re-import the app module; only the parent recovers jobs
+        if multiprocessing.parent_process() is not None:
+            return 0
+        
+        job_ids = requeue_stale_bulk_jobs(STALE_JOB_SECONDS)
+        for job_id in job_ids:
+            self._pool().submit(run_bulk_job, job_id)
+        if job_ids:
+            logging.info(f"Re-queued {len(job_ids)} bulk jobs")
+        return len(job_ids)
+    
+    def status(self, job_id, preview_rows=10):
+        """Progress report for a job, or None if it does not exist."""
+        job = get_bulk_job(job_id)
+        if job is None:
+            return None
+        
+        now = time.time()
+        if job['status'] == 'running' and now - job['updated_at'] > STALE_JOB_SECONDS:
+            self.recover()
+            job = get_bulk_job(job_id)
+        
+        elapsed = None
+        if job['started_at']:
+            elapsed = (job['finished_at'] or now) - job['started_at']
+        
+        status = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'filename': job['filename'],
+            'rows_processed': job['rows_processed'],
+            'elapsed_seconds': elapsed,
+            'rows_per_second': job['rows_processed'] / elapsed if elapsed else None,
+            'error': job['error']
+        }
+        
+        if job['status'] == 'completed' and preview_rows:
+            preview = pd.read_csv(job['output_path'], nrows=preview_rows)
+            status['preview'] = preview.astype(object).where(preview.notna(), None).to_dict(orient='records')
+        
+        return status
+    
+    def output_path(self, job_id):
+        """Path of a completed job's enriched CSV, or None."""
+        job = get_bulk_job(job_id)
+        if job is None or job['status'] != 'completed':
+            return None
+        return job['output_path']
+
+
+_manager = None
+
+
+def get_job_manager():
+    """Process-wide JobManager."""
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
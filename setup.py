@@ -16,6 +16,7 @@ setup(
     install_requires=[
         'pandas>=2.0.0',
         'numpy>=1.24.0',
+        'scipy>=1.10.0',
         'scikit-learn>=1.3.0',
         'xgboost>=2.0.0',
         'Flask>=3.0.0',
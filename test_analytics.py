@@ -0,0 +1,276 @@
+# ============================================================================
+# FILE: test_analytics.py
+# ============================================================================
+"""
+Behavior tests for the dashboard analytics: the shared-scan bundle and the
+widget aggregations, checked against their standalone or row-by-row forms.
+"""
+import json
+from flask import Flask
+import numpy as np
+import pandas as pd
+import fixtures
+from database.database import models
+from services import analytics as analytics_module
+from services.analytics import AnalyticsService
+from services.cache import analytics_cache
+from test_database import ENGINES, temp_database
+
+
+def _same(a, b):
+    """Payload equality that treats NaN as equal to NaN."""
+    return json.dumps(a, sort_keys=True, default=str) == json.dumps(b, sort_keys=True, default=str)
+
+
+def _api_client():
+    """Test client for the /api blueprint alone."""
+    from backend.routes_api import api_bp
+    
+    app = Flask(__name__)
+    app.register_blueprint(api_bp, url_prefix='/api')
+    return app.test_client()
+
+
+def test_dashboard_bundle_scans_once():
+    """compute_all reads the filtered bookings once and returns what each widget returns alone."""
+    client = _api_client()
+    
+    scans = []
+    query_scored_bookings = analytics_module.query_scored_bookings
+    
+    def counted(*args, **kwargs):
+        scans.append(args)
+        return query_scored_bookings(*args, **kwargs)
+    
+    analytics_module.query_scored_bookings = counted
+    try:
+        for engine in ENGINES:
+            with temp_database(engine):
+                models.insert_scored_bookings(fixtures.scored_bookings(600))
+                for filters in (None, {'lane': 'LANE_1'}, {'year': 2024, 'month': 5}):
+                    analytics_cache.clear()
+                    scans.clear()
+                    bundle = AnalyticsService().compute_all(filters)
+                    assert len(scans) == 1, f"{len(scans)} scans for {filters}"
+                    assert list(bundle) == list(AnalyticsService.WIDGETS)
+                    
+                    for name, method in AnalyticsService.WIDGETS.items():
+                        analytics_cache.clear()
+                        assert _same(bundle[name], getattr(AnalyticsService(), method)(filters)), name
+                
+                # Widgets answered from the rollup never load the frame
+                analytics_cache.clear()
+                scans.clear()
+                AnalyticsService().compute_all({'lane': 'LANE_1'}, list(AnalyticsService.ROLLUP_WIDGETS))
+                assert scans == []
+                
+                analytics_cache.clear()
+                response = client.get('/api/dashboard-bundle?widgets=summary,flow&lane=LANE_1')
+                assert response.status_code == 200 and sorted(response.get_json()) == ['flow', 'summary']
+                assert _same(response.get_json()['flow'], AnalyticsService().get_flow_data({'lane': 'LANE_1'}))
+                response = client.get('/api/dashboard-bundle?widgets=summary,nope')
+                assert response.status_code == 400 and 'nope' in response.get_json()['error']
+    finally:
+        analytics_module.query_scored_bookings = query_scored_bookings
+        analytics_cache.clear()
+
+
+def test_bookings_over_time_buckets():
+    """Resampled series conserve the bookings, on Monday weeks, from the rollup and the row store alike."""
+    for engine in ENGINES:
+        with temp_database(engine):
+            df = fixtures.scored_bookings(3000)
+            models.insert_scored_bookings(df)
+            analytics = AnalyticsService()
+            analytics_cache.clear()
+            
+            for freq in ('D', 'W', 'M', 'Q'):
+                series = analytics.get_bookings_over_time(freq=freq, max_points=None)
+                assert sum(series['counts']) == series['total_bookings'] == 3000, freq
+                assert not series['downsampled'] and series['dates'] == sorted(series['dates'])
+            weeks = pd.to_datetime(analytics.get_bookings_over_time(freq='W', max_points=None)['dates'])
+            assert (weeks.dayofweek == 0).all()
+            months = analytics.get_bookings_over_time(freq='M', max_points=None)
+            assert months['counts'] == df.groupby(df['booking_date'].dt.strftime('%Y-%m')).size().tolist()
+            
+            # 730 days are downsampled to max_points, flagged, with the true total alongside
+            daily = analytics.get_bookings_over_time()
+            assert daily['downsampled'] and len(daily['dates']) == analytics.MAX_SERIES_POINTS
+            assert daily['total_bookings'] == 3000 > sum(daily['counts'])
+            assert daily['dates'][0] == '2024-01-01' and daily['dates'][-1] == df['booking_date'].max().strftime('%Y-%m-%d')
+            
+            # The row store path (used for filters the rollup cannot apply) gives the same series
+            rollup_supports = analytics_module.rollup_supports
+            
+            def series(filters, freq, use_rollup):
+                analytics_module.rollup_supports = rollup_supports if use_rollup else lambda filters=None: False
+                analytics_cache.clear()
+                return analytics.get_bookings_over_time(filters, freq, max_points=50)
+            
+            try:
+                for freq, filters in (('D', None), ('W', {'lane': 'LANE_1'}), ('M', {'year': 2024}), ('Q', {'month': 2})):
+                    from_rollup, from_rows = series(filters, freq, True), series(filters, freq, False)
+                    assert from_rows['dates'] == from_rollup['dates'] and from_rows['counts'] == from_rollup['counts']
+                    assert np.allclose(from_rows['cancel_rates'], from_rollup['cancel_rates'], rtol=0, atol=1e-9)
+            finally:
+                analytics_module.rollup_supports = rollup_supports
+                analytics_cache.clear()
+            
+            # Malformed max_points are refused, not replaced by the default
+            client = _api_client()
+            assert client.get('/api/bookings-over-time?freq=W').status_code == 200
+            for query in ('max_points=abc', 'max_points=2', 'freq=X'):
+                assert client.get(f'/api/bookings-over-time?{query}').status_code == 400, query
+
+
+def test_lttb():
+    """LTTB keeps exactly threshold points, ends included, in order, and picks out spikes."""
+    rng = np.random.default_rng(0)
+    x = np.arange(1000, dtype=float)
+    y = rng.random(1000)
+    y[500] = 50
+    for threshold in (3, 10, 400, 999):
+        keep = AnalyticsService._lttb(x, y, threshold)
+        assert len(keep) == threshold and keep[0] == 0 and keep[-1] == 999
+        assert (np.diff(keep) > 0).all()
+    assert 500 in AnalyticsService._lttb(x, y, 10)
+    assert AnalyticsService._lttb(x, y, 1000).tolist() == list(range(1000))
+
+
+def test_top_n_validation():
+    """Every ?top_n route refuses malformed and non-positive values with a 400 naming the parameter."""
+    client = _api_client()
+    routes = [
+        'cancellations-by-port', 'cancellations-by-lane', 'network-data', 'top-outliers',
+        'risk-matrix', 'top-risky-lanes', 'top-risky-ports'
+    ]
+    with temp_database():
+        models.insert_scored_bookings(fixtures.scored_bookings(300))
+        analytics_cache.clear()
+        for route in routes:
+            assert client.get(f'/api/{route}?top_n=3').status_code == 200, route
+            for value in ('abc', '-1', '0', '2.5'):
+                response = client.get(f'/api/{route}?top_n={value}')
+                assert response.status_code == 400, (route, value)
+                assert response.get_json()['error'].startswith(f'Invalid top_n: {value}')
+        
+        lanes = client.get('/api/top-risky-lanes?top_n=3').get_json()
+        assert len(lanes) == 3
+        assert 'between 1 and' in client.get('/api/risk-matrix?top_n=1000').get_json()['error']
+    analytics_cache.clear()
+
+
+def _skewed_bookings(n_values=30, seed=0):
+    """scored_bookings whose ports and lanes all have different booking counts, so top_n has no ties."""
+    rng = np.random.default_rng(seed)
+    df = fixtures.scored_bookings(n_values * (n_values + 1) // 2, seed=seed)
+    for column, prefix in (('pol', 'PORT'), ('pod', 'PORT'), ('lane', 'LANE')):
+        df[column] = rng.permutation(np.repeat([f'{prefix}_{i}' for i in range(n_values)], np.arange(1, n_values + 1)))
+    return df
+
+
+def _cells(payload, rows, columns):
+    """Matrix widget payload as {(row label, column label): value}."""
+    return {
+        (row, column): value
+        for row, values in zip(payload[rows], payload['matrix'])
+        for column, value in zip(payload[columns], values)
+    }
+
+
+def test_matrix_widgets_match_per_cell_loops():
+    """Network and risk matrix pivots, from the frame and from the rollup, equal the per-cell loops."""
+    widgets = (
+        ('get_network_data', '_network_data', fixtures.legacy_network_data, 'labels', 'labels'),
+        ('get_risk_matrix_heatmap', '_risk_matrix_heatmap', fixtures.legacy_risk_matrix, 'ports', 'lanes'),
+    )
+    for engine in ENGINES:
+        with temp_database(engine):
+            models.insert_scored_bookings(_skewed_bookings())
+            analytics = AnalyticsService()
+            analytics_cache.clear()
+            
+            for get, pivot, legacy, rows, columns in widgets:
+                df = models.query_scored_bookings()
+                for top_n in (1, 5, 30, 100):
+                    expected = legacy(df, top_n)
+                    for result in (getattr(analytics, pivot)(df, top_n), getattr(analytics, get)(None, top_n)):
+                        assert {k: v for k, v in result.items() if k != 'matrix'} == \
+                            {k: v for k, v in expected.items() if k != 'matrix'}, (get, top_n)
+                        assert np.allclose(result['matrix'], expected['matrix']), (get, top_n)
+                
+                # Filtered subsets can tie; with every value shown the cells must still agree
+                for filters in ({'lane': 'LANE_20'}, {'year': 2025}, {'pol': 'PORT_29', 'month': 7}):
+                    expected = _cells(legacy(models.query_scored_bookings(filters), 100), rows, columns)
+                    result = _cells(getattr(analytics, get)(filters, 100), rows, columns)
+                    assert result.keys() == expected.keys(), (get, filters)
+                    assert np.allclose([result[key] for key in expected], list(expected.values())), (get, filters)
+            
+            assert analytics._network_data(models.query_scored_bookings({'lane': 'NONE'})) == {'matrix': [], 'labels': []}
+            assert analytics.get_network_data({'lane': 'NONE'}) == {'matrix': [], 'labels': []}
+    analytics_cache.clear()
+
+
+def _spread_bookings(n_rows, days, seed=1):
+    """scored_bookings spread over `days` days, some without a booking date."""
+    df = fixtures.scored_bookings(n_rows, seed=seed)
+    df['booking_date'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(
+        np.random.default_rng(seed).integers(0, days, n_rows), unit='D'
+    )
+    df.loc[df.index % 17 == 0, 'booking_date'] = pd.NaT
+    return df
+
+
+def test_stacked_area_and_flow():
+    """Bucketed series conserve each lane's bookings, auto stays within MAX_SERIES_POINTS, flow links add up."""
+    analytics = AnalyticsService()
+    
+    # The pivots match the loops they replaced
+    df = _spread_bookings(2000, 120).dropna(subset=['booking_date'])
+    assert analytics._stacked_area_data(df, 'day') == fixtures.legacy_stacked_area(df)
+    assert fixtures.link_totals(analytics._flow_data(df)) == fixtures.link_totals(fixtures.legacy_flow(df))
+    
+    for days, auto in ((300, 'day'), (2000, 'week'), (5000, 'month')):
+        df = _spread_bookings(3000, days)
+        dated = df.dropna(subset=['booking_date'])
+        for bucket in ('day', 'week', 'month', 'auto'):
+            result = analytics._stacked_area_data(df, bucket)
+            assert result['lanes'] == df['lane'].value_counts().head(5).index.tolist()
+            for lane, series in zip(result['lanes'], result['data']):
+                assert sum(series) == (dated['lane'] == lane).sum(), (days, bucket, lane)
+                assert len(series) == len(result['dates'])
+            if bucket == 'week':
+                assert (pd.to_datetime(result['dates']).dayofweek == 0).all()
+        assert analytics._stacked_area_data(df, 'auto') == analytics._stacked_area_data(df, auto)
+        assert len(analytics._stacked_area_data(df, 'auto')['dates']) <= analytics.MAX_SERIES_POINTS
+    
+    flow = analytics._flow_data(df)
+    names = [node['name'] for node in flow['nodes']]
+    lanes = set(df['lane'])
+    lane_links = [link['value'] for link in flow['links'] if names[link['source']] in lanes]
+    risk_links = [link['value'] for link in flow['links'] if names[link['target']] in ('Low', 'Medium', 'High')]
+    assert sum(lane_links) == sum(risk_links) == len(df)
+    
+    try:
+        analytics._stacked_area_data(df, 'year')
+        assert False, "unknown bucket was accepted"
+    except ValueError:
+        pass
+    with temp_database():
+        models.insert_scored_bookings(df)
+        analytics_cache.clear()
+        client = _api_client()
+        assert client.get('/api/stacked-area-data?bucket=week').status_code == 200
+        assert client.get('/api/stacked-area-data?bucket=year').status_code == 400
+        assert fixtures.link_totals(client.get('/api/flow-data').get_json()) == fixtures.link_totals(flow)
+    analytics_cache.clear()
+
+
+if __name__ == '__main__':
+    test_dashboard_bundle_scans_once()
+    test_bookings_over_time_buckets()
+    test_lttb()
+    test_top_n_validation()
+    test_matrix_widgets_match_per_cell_loops()
+    test_stacked_area_and_flow()
+    print("✓ Analytics behavior tests passed")
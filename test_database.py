@@ -0,0 +1,636 @@
+# ============================================================================
+# FILE: test_database.py
+# ============================================================================
+"""
+Behavior tests for the bookings database: writes, the derived tables kept
+in sync with bookings_scored, and schema migrations of existing databases.
+Engine-independent tests also run against PostgreSQL when DATABASE_URL is
+set (each in a scratch schema that is dropped afterwards).
+"""
+from contextlib import contextmanager
+from itertools import product
+import sqlite3
+import tempfile
+import uuid
+import os
+import pandas as pd
+import fixtures
+from database.database import models
+from database.database.storage import configure_storage
+from services.ingestion import DataIngestionService
+from cleanup_database import cleanup_duplicates
+
+# Storage engines the tests run against
+DATABASE_URL = os.environ.get('DATABASE_URL')
+ENGINES = ['sqlite'] + (['postgresql'] if DATABASE_URL else [])
+
+
+@contextmanager
+def temp_database(engine='sqlite', setup=None):
+    """
+    Initialized scratch database: a SQLite file in a temp dir (setup(path)
+    runs before init_database) or a PostgreSQL schema on DATABASE_URL.
+    """
+    if engine != 'sqlite':
+        with _scratch_schema() as url:
+            storage = configure_storage(engine, url=url)
+            try:
+                models.init_database()
+                yield storage
+            finally:
+                storage.pool.close()
+                configure_storage()
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'test.db')
+        if setup is not None:
+            setup(path)
+        storage = configure_storage('sqlite', path=path)
+        try:
+            models.init_database()
+            yield storage
+        finally:
+            storage.pool.close()
+            configure_storage()
+
+
+@contextmanager
+def _scratch_schema():
+    """DATABASE_URL with a fresh schema as search_path; the schema is dropped on exit."""
+    import psycopg2
+    
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin = psycopg2.connect(DATABASE_URL)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    try:
+        separator = '&' if '?' in DATABASE_URL else '?'
+        yield f"{DATABASE_URL}{separator}options=-csearch_path%3D{schema}"
+    finally:
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+
+def _count(storage, query='SELECT COUNT(*) FROM bookings_scored'):
+    with storage.connection() as conn:
+        return storage.execute(conn, query).fetchone()[0]
+
+
+def test_uploads_without_booking_ids_do_not_collide():
+    """Generated booking_ids are unique per upload, so a second upload is stored too."""
+    upload = fixtures.scored_bookings(50).drop(columns=['booking_id'])
+    ingestion = DataIngestionService()
+    
+    for engine in ENGINES:
+        with temp_database(engine) as storage:
+            assert models.insert_scored_bookings(ingestion.standardize_columns(upload)) == 50
+            assert models.insert_scored_bookings(ingestion.standardize_columns(upload)) == 50
+            assert models.insert_scored_bookings(upload) == 50
+            assert _count(storage) == 150
+            
+            # Rows with a stored booking_id are skipped and counted
+            df = fixtures.scored_bookings(10)
+            assert models.insert_scored_bookings(df) == 10
+            assert models.insert_scored_bookings(df) == 0
+            assert _count(storage) == 160
+
+
+def test_init_database_keeps_duplicate_bookings():
+    """Duplicates in an existing database are left to cleanup_database.py, not deleted at startup."""
+    def legacy_duplicates(path):
+        with sqlite3.connect(path) as conn:
+            conn.execute('''CREATE TABLE bookings_scored (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, booking_id TEXT, booking_date DATE,
+                pol TEXT, pod TEXT, lane TEXT, bundle TEXT, container_state TEXT,
+                cancel_probability REAL, cancel_risk TEXT, broken_route_probability REAL,
+                broken_route_risk TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''')
+            conn.executemany(
+                'INSERT INTO bookings_scored (booking_id, booking_date, lane, cancel_probability) VALUES (?, ?, ?, ?)',
+                [('0', '2024-01-01', 'A', 0.1), ('0', '2024-01-02', 'A', 0.2), ('1', '2024-01-03', 'B', 0.3), ('1', '2024-01-04', 'B', 0.4)]
+            )
+    
+    with temp_database(setup=legacy_duplicates) as storage:
+        models.init_database()
+        assert _count(storage) == 4
+        with storage.connection() as conn:
+            assert not storage.index_exists(conn, 'idx_booking_id_unique')
+        try:
+            models.insert_scored_bookings(fixtures.scored_bookings(5))
+            assert False, "insert_scored_bookings wrote without the unique booking_id index"
+        except RuntimeError:
+            pass
+        
+        # The explicit step removes the duplicates and enables uploads
+        assert cleanup_duplicates() == 2
+        with storage.connection() as conn:
+            assert storage.index_exists(conn, 'idx_booking_id_unique')
+        assert models.insert_scored_bookings(fixtures.scored_bookings(5)) == 5
+        assert _count(storage) == 7
+
+
+def _bookings_with_gaps(n_rows, seed=42):
+    """scored_bookings with NULL dates and dimensions, which key rollup groups too."""
+    df = fixtures.scored_bookings(n_rows, seed=seed)
+    df.loc[df.index % 7 == 0, 'lane'] = None
+    df.loc[df.index % 11 == 0, 'pol'] = None
+    df.loc[df.index % 13 == 0, 'booking_date'] = None
+    return df
+
+
+def _assert_rollup_matches(storage):
+    """bookings_rollup holds exactly one row per bookings_scored group, with its aggregates."""
+    keys = ', '.join(models.ROLLUP_KEYS)
+    columns = ', '.join(models.ROLLUP_COLUMNS)
+    risk_keys = {level.lower(): models._dimension_key_sql('risk', f"'{level}'") for level in ('High', 'Medium', 'Low')}
+    aggregates = ', '.join(f"{expression.format(**risk_keys)} AS {column}" for column, expression in models.ROLLUP_COLUMNS.items())
+    expected = storage.read_frame(f"SELECT {keys}, {aggregates} FROM bookings_scored GROUP BY {keys}")
+    rollup = storage.read_frame(f"SELECT {keys}, {columns} FROM bookings_rollup")
+    
+    assert len(rollup) == len(expected), f"{len(rollup)} rollup rows for {len(expected)} groups"
+    assert (rollup['bookings'] > 0).all()
+    order = list(models.ROLLUP_KEYS)
+    expected = expected.sort_values(order, na_position='first').reset_index(drop=True)
+    rollup = rollup.sort_values(order, na_position='first').reset_index(drop=True)
+    pd.testing.assert_frame_equal(rollup, expected, check_dtype=False, check_exact=False, atol=1e-9)
+
+
+def test_rollup_matches_row_store():
+    """Repeated inserts and replaces keep one rollup row per group, NULL keys included."""
+    for engine in ENGINES:
+        with temp_database(engine) as storage:
+            df = _bookings_with_gaps(400)
+            models.insert_scored_bookings(df)
+            _assert_rollup_matches(storage)
+            
+            for seed in range(3):
+                # Same bookings rescored (and some moved to other lanes), plus new ones
+                replaced = _bookings_with_gaps(400, seed=seed + 1)
+                replaced['booking_id'] = df['booking_id']
+                models.insert_scored_bookings(replaced, replace_duplicates=True)
+                extra = _bookings_with_gaps(50, seed=seed + 10)
+                extra['booking_id'] = [f'NEW{seed}-{i}' for i in range(50)]
+                models.insert_scored_bookings(extra)
+                models.insert_scored_bookings(extra)
+                _assert_rollup_matches(storage)
+
+
+def test_aggregate_matches_pandas():
+    """aggregate_scored_bookings equals a pandas groupby of the same filtered rows, NULL keys skipped."""
+    metrics = {
+        'n': ('count', 'id'),
+        'ids': ('count_distinct', 'booking_id'),
+        'avg_cancel': ('avg', 'cancel_probability'),
+        'sum_broken': ('sum', 'broken_route_probability'),
+        'max_cancel': ('max', 'cancel_probability'),
+    }
+    for engine in ENGINES:
+        with temp_database(engine):
+            df = _bookings_with_gaps(600)
+            models.insert_scored_bookings(df)
+            lane = df['lane'].dropna().iloc[0]
+            
+            for filters in (None, {'month': 3}, {'year': 2024, 'lane': lane}, {'start_date': '2024-02-01', 'end_date': '2024-08-31'}):
+                rows = models.query_scored_bookings(filters)
+                rows['booking_day'] = pd.to_datetime(rows['booking_date']).dt.strftime('%Y-%m-%d')
+                for group_by in (['lane'], ['pol', 'cancel_risk'], ['booking_day'], []):
+                    result = models.aggregate_scored_bookings(filters, group_by, metrics, order_by=['-n'] + group_by)
+                    if group_by:
+                        grouped = rows.dropna(subset=group_by).astype({key: str for key in group_by}).groupby(group_by)
+                    else:
+                        grouped = rows.groupby(lambda _: 0)
+                    expected = pd.DataFrame({
+                        'n': grouped['id'].count(),
+                        'ids': grouped['booking_id'].nunique(),
+                        'avg_cancel': grouped['cancel_probability'].mean(),
+                        'sum_broken': grouped['broken_route_probability'].sum(),
+                        'max_cancel': grouped['cancel_probability'].max(),
+                    }).reset_index(drop=not group_by)
+                    assert (result['n'].diff().dropna() <= 0).all(), "order_by -n ignored"
+                    
+                    result = result.astype({key: str for key in group_by}).sort_values(group_by or ['n'], ignore_index=True)
+                    expected = expected.sort_values(group_by or ['n'], ignore_index=True)
+                    pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False, check_exact=False, atol=1e-9)
+                    
+                    if group_by:
+                        ordered = models.aggregate_scored_bookings(filters, group_by, metrics, order_by=['-n'] + group_by)
+                        limited = models.aggregate_scored_bookings(filters, group_by, metrics, order_by=['-n'] + group_by, limit=3)
+                        pd.testing.assert_frame_equal(limited, ordered.head(3))
+            
+            for bad in ({'group_by': ['created_at']}, {'metrics': {'n': ('median', 'id')}}, {'order_by': ['pol']}):
+                try:
+                    models.aggregate_scored_bookings(group_by=bad.get('group_by', ['lane']), metrics=bad.get('metrics'), order_by=bad.get('order_by'))
+                    assert False, f"{bad} was accepted"
+                except ValueError:
+                    pass
+
+
+class _FakeRedis:
+    """The slice of the redis.Redis API RedisCacheBackend uses, for when fakeredis is not installed."""
+    
+    def __init__(self):
+        self.values = {}
+    
+    def get(self, key):
+        return self.values.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+    
+    def delete(self, key):
+        self.values.pop(key, None)
+    
+    def scan_iter(self, match='*'):
+        from fnmatch import fnmatchcase
+        return [key for key in list(self.values) if fnmatchcase(key, match)]
+
+
+def _redis_client():
+    try:
+        import fakeredis
+    except ImportError:
+        return _FakeRedis()
+    return fakeredis.FakeRedis()
+
+
+def test_analytics_cache_invalidated_on_write():
+    """Cached widgets are served until a write bumps the table version, in memory and shared stores."""
+    from services.analytics import AnalyticsService
+    from services.cache import MemoryCacheBackend, RedisCacheBackend, SQLiteCacheBackend, analytics_cache
+    
+    filters = {'month': 3}
+    backend = analytics_cache.backend
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [
+            MemoryCacheBackend,
+            lambda: SQLiteCacheBackend(os.path.join(tmp, 'cache.db')),
+            lambda: RedisCacheBackend(_redis_client()),
+        ]
+        for engine, create_backend in product(ENGINES, backends):
+            analytics_cache.backend = create_backend()
+            try:
+                with temp_database(engine) as storage:
+                    analytics = AnalyticsService()
+                    df = fixtures.scored_bookings(300)
+                    models.insert_scored_bookings(df)
+                    version = models.get_table_version()
+                    
+                    summary = analytics.get_dashboard_summary()
+                    lanes = analytics.get_top_risky_lanes(filters)
+                    hits = analytics_cache.hits
+                    assert AnalyticsService().get_dashboard_summary() == summary
+                    assert analytics.get_top_risky_lanes(filters) == lanes
+                    assert analytics_cache.hits == hits + 2
+                    
+                    # Nothing written, nothing invalidated
+                    assert models.insert_scored_bookings(df) == 0
+                    assert models.get_table_version() == version
+                    assert analytics.get_dashboard_summary() == summary
+                    assert analytics_cache.hits == hits + 3
+                    
+                    # New and rescored bookings are visible on the next read
+                    extra = fixtures.scored_bookings(50, seed=7)
+                    extra['booking_id'] = [f'NEW-{i}' for i in range(50)]
+                    models.insert_scored_bookings(extra)
+                    rescored = fixtures.scored_bookings(300, seed=8)
+                    rescored['booking_id'] = df['booking_id']
+                    models.insert_scored_bookings(rescored, replace_duplicates=True)
+                    assert models.get_table_version() == version + 2
+                    
+                    invalidations = analytics_cache.invalidations
+                    summary = analytics.get_dashboard_summary()
+                    lanes = analytics.get_top_risky_lanes(filters)
+                    assert analytics_cache.invalidations == invalidations + 2
+                    assert summary['total_bookings'] == _count(storage) == 350
+                    analytics_cache.clear()
+                    assert analytics.get_dashboard_summary() == summary
+                    assert analytics.get_top_risky_lanes(filters) == lanes
+            finally:
+                analytics_cache.clear()
+                analytics_cache.backend = backend
+
+
+def _upload_csv(n_rows, seed=42, id_prefix=''):
+    """CSV bytes of unscored bookings, as a user would upload them."""
+    df = fixtures.scored_bookings(n_rows, seed=seed)
+    df['booking_id'] = id_prefix + df['booking_id'].astype(str)
+    return df[['booking_id', 'booking_date', 'pol', 'pod', 'lane', 'container_state', 'bundle']].to_csv(index=False).encode()
+
+
+def test_bulk_predict_stream():
+    """?stream=1 returns every uploaded row once, scored, as one CSV, and stores the bookings."""
+    import io
+    from backend import create_app
+    
+    chunk_size = DataIngestionService.CHUNK_SIZE
+    DataIngestionService.CHUNK_SIZE = 100
+    try:
+        with temp_database() as storage:
+            client = create_app().test_client()
+            
+            def upload(data, filename='bookings.csv'):
+                return client.post('/api/bulk-predict?stream=1', data={'file': (io.BytesIO(data), filename)},
+                                   content_type='multipart/form-data')
+            
+            response = upload(_upload_csv(250))
+            assert response.status_code == 200 and response.mimetype == 'text/csv'
+            assert response.headers['Content-Disposition'] == 'attachment; filename="bookings_predictions.csv"'
+            scored = pd.read_csv(io.BytesIO(response.data))
+            uploaded = pd.read_csv(io.BytesIO(_upload_csv(250)))
+            
+            # Three chunks, one header, input order kept
+            assert scored['booking_id'].tolist() == uploaded['booking_id'].tolist()
+            for column in ('cancel_probability', 'broken_route_probability'):
+                assert scored[column].between(0, 1).all()
+            assert set(scored['cancel_risk']) <= {'High', 'Medium', 'Low'}
+            assert _count(storage) == 250
+            
+            # Bookings already stored are scored again but not duplicated
+            assert len(pd.read_csv(io.BytesIO(upload(_upload_csv(250)).data))) == 250
+            assert _count(storage) == 250
+            
+            # Unreadable uploads still get a JSON error before streaming starts
+            response = upload(b'booking_id,lane\n')
+            assert response.status_code == 500 and response.get_json()['error'] == 'Empty dataset'
+    finally:
+        DataIngestionService.CHUNK_SIZE = chunk_size
+
+
+def test_bulk_job():
+    """A queued job scores its upload once, also after a worker died mid-job, and failures are reported."""
+    import io
+    from backend import create_app
+    from services.jobs import JobManager, run_bulk_job
+    
+    with temp_database() as storage, tempfile.TemporaryDirectory() as tmp:
+        client = create_app().test_client()
+        
+        def queue(job_id, data):
+            input_path = os.path.join(tmp, f'{job_id}.csv')
+            with open(input_path, 'wb') as f:
+                f.write(data)
+            models.create_bulk_job(job_id, 'bookings.csv', input_path, os.path.join(tmp, f'{job_id}_predictions.csv'))
+        
+        queue('job1', _upload_csv(120))
+        assert client.get('/api/jobs/job1/download').status_code == 409
+        run_bulk_job('job1')
+        status = client.get('/api/jobs/job1').get_json()
+        assert status['status'] == 'completed' and status['rows_processed'] == 120
+        assert len(status['preview']) == 10 and status['error'] is None
+        
+        response = client.get('/api/jobs/job1/download')
+        assert response.status_code == 200 and response.mimetype == 'text/csv'
+        scored = pd.read_csv(io.BytesIO(response.data))
+        assert scored['booking_id'].tolist() == pd.read_csv(io.BytesIO(_upload_csv(120)))['booking_id'].tolist()
+        assert scored['cancel_probability'].between(0, 1).all()
+        assert _count(storage) == 120
+        
+        # Finished jobs are not claimed again
+        run_bulk_job('job1')
+        assert models.get_bulk_job('job1')['status'] == 'completed'
+        
+        # A job whose worker stopped reporting is re-queued and rerun from the start
+        queue('job2', _upload_csv(80, seed=3, id_prefix='J2-'))
+        assert models.claim_bulk_job('job2', worker_pid=0)
+        assert models.requeue_stale_bulk_jobs(stale_seconds=-1) == ['job2']
+        run_bulk_job('job2')
+        assert JobManager().status('job2')['rows_processed'] == 80
+        assert len(pd.read_csv(JobManager().output_path('job2'))) == 80
+        assert _count(storage) == 200
+        
+        queue('job3', b'booking_id,lane\n')
+        run_bulk_job('job3')
+        status = JobManager().status('job3')
+        assert status['status'] == 'failed' and status['error'] == 'Empty dataset'
+        assert JobManager().output_path('job3') is None
+        assert client.get('/api/jobs/missing').status_code == 404
+
+
+def _assert_mirror_matches(store, filters=None):
+    """ParquetStore.scan returns what query_scored_bookings returns for the same filters."""
+    from database.database.columnar import COLUMN_TYPES
+    
+    # Filtered row store reads follow the index used, not id order
+    expected = models.query_scored_bookings(filters, list(COLUMN_TYPES)).sort_values('id', ignore_index=True)
+    mirrored = store.scan(filters, list(COLUMN_TYPES))
+    assert len(mirrored) == len(expected), f"{len(mirrored)} mirrored rows for {len(expected)} stored ({filters})"
+    pd.testing.assert_frame_equal(
+        mirrored.astype(object).where(mirrored.notna(), None),
+        expected.astype(object).where(expected.notna(), None),
+        check_exact=False, atol=1e-9
+    )
+
+
+def test_columnar_store_mirrors_row_store():
+    """The Parquet mirror tracks inserts, replaces and rebuilds of bookings_scored."""
+    from database.database import columnar
+    
+    environ = os.environ.get('COLUMNAR_STORE')
+    os.environ['COLUMNAR_STORE'] = 'parquet'
+    try:
+        for engine in ENGINES:
+            with temp_database(engine), tempfile.TemporaryDirectory() as tmp:
+                store = columnar._store = columnar.ParquetStore(root=os.path.join(tmp, 'bookings_scored'), max_parts=2)
+                df = _bookings_with_gaps(300)
+                models.insert_scored_bookings(df)
+                lane = df['lane'].dropna().iloc[0]
+                all_filters = [
+                    None, {'month': 3}, {'year': 2024, 'lane': lane},
+                    {'start_date': '2024-02-10', 'end_date': '2024-06-20'}
+                ]
+                for filters in all_filters:
+                    _assert_mirror_matches(store, filters)
+                
+                for seed in range(3):
+                    # Rescored bookings may move to another month partition
+                    replaced = _bookings_with_gaps(300, seed=seed + 1)
+                    replaced['booking_id'] = df['booking_id']
+                    models.insert_scored_bookings(replaced, replace_duplicates=True)
+                    extra = _bookings_with_gaps(40, seed=seed + 10)
+                    extra['booking_id'] = [f'NEW{seed}-{i}' for i in range(40)]
+                    models.insert_scored_bookings(extra)
+                for filters in all_filters:
+                    _assert_mirror_matches(store, filters)
+                assert all(len(store._part_files(partition)) <= 2 for partition in store._partitions())
+                
+                # A stale mirror is skipped by readers until it is rebuilt from the row store
+                store.invalidate('test')
+                assert not store.available()
+                store.clear()
+                assert columnar.rebuild_columnar_store() == _count(models.get_storage()) == 420
+                assert store.available()
+                for filters in all_filters:
+                    _assert_mirror_matches(store, filters)
+    finally:
+        columnar._store = None
+        if environ is None:
+            os.environ.pop('COLUMNAR_STORE')
+        else:
+            os.environ['COLUMNAR_STORE'] = environ
+
+
+def _assert_filter_options_match():
+    """get_filter_options lists exactly the distinct stored values, with their booking counts."""
+    df = models.query_scored_bookings(columns=['lane', 'pol', 'pod', 'booking_date'])
+    df['year'] = pd.to_datetime(df['booking_date']).dt.year.astype('Int64').astype(str).replace('<NA>', None)
+    
+    options = models.get_filter_options()
+    for dimension, key in (('lane', 'lanes'), ('pol', 'pols'), ('pod', 'pods'), ('year', 'years')):
+        counts = df[dimension].astype(object).dropna().value_counts()
+        expected = {str(value): int(count) for value, count in counts.items()}
+        assert options['counts'][key] == expected, f"{key}: {options['counts'][key]} != {expected}"
+        assert sorted(options[key], reverse=(dimension == 'year')) == options[key]
+
+
+def test_filter_options_stay_in_sync():
+    """Inserts, replaces that empty a lane, clears and rebuilds keep filter_options exact."""
+    for engine in ENGINES:
+        with temp_database(engine):
+            df = _bookings_with_gaps(300)
+            models.insert_scored_bookings(df)
+            _assert_filter_options_match()
+            
+            # Move every booking off one lane; the lane must drop out of the options
+            lane = df['lane'].dropna().iloc[0]
+            moved = df.copy()
+            moved.loc[moved['lane'] == lane, 'lane'] = 'MOVED_LANE'
+            moved['booking_date'] = moved['booking_date'].where(moved.index % 5 != 0, '2031-06-01')
+            models.insert_scored_bookings(moved, replace_duplicates=True)
+            _assert_filter_options_match()
+            options = models.get_filter_options()
+            assert lane not in options['lanes'] and 'MOVED_LANE' in options['lanes']
+            assert options['years'][0] == '2031'
+            
+            extra = _bookings_with_gaps(60, seed=5)
+            extra['booking_id'] = [f'NEW-{i}' for i in range(60)]
+            models.insert_scored_bookings(extra)
+            models.insert_scored_bookings(extra)
+            _assert_filter_options_match()
+            incremental = models.get_filter_options()
+            models.rebuild_rollups()
+            assert models.get_filter_options() == incremental
+            
+            models.clear_database()
+            assert models.get_filter_options()['lanes'] == []
+
+
+def test_init_database_encodes_legacy_text_columns():
+    """A database with TEXT dimension columns is migrated in place, keeping every row, id and value."""
+    columns = ['id'] + fixtures.LEGACY_INSERT_COLUMNS
+    legacy = {}
+    
+    def legacy_database(path):
+        fixtures.legacy_scored_table(path)
+        with sqlite3.connect(path) as conn:
+            fixtures.legacy_insert(_bookings_with_gaps(400), conn)
+            extra = _bookings_with_gaps(100, seed=3)
+            extra['booking_id'] = [f'LEGACY-{i}' for i in range(100)]
+            fixtures.legacy_insert(extra, conn)
+            conn.execute("DELETE FROM bookings_scored WHERE id % 9 = 0")
+            conn.commit()
+            legacy['rows'] = pd.read_sql(f"SELECT {', '.join(columns)} FROM bookings_scored ORDER BY id", conn)
+    
+    with temp_database(setup=legacy_database) as storage:
+        expected = legacy['rows']
+        with storage.connection() as conn:
+            assert not storage.column_exists(conn, 'bookings_scored', 'lane')
+            assert storage.column_exists(conn, 'bookings_scored', 'lane_id')
+        
+        def stored(filters=None):
+            df = models.query_scored_bookings(filters, columns).sort_values('id', ignore_index=True)
+            return df.astype(object).where(df.notna(), None)
+        
+        def legacy_rows(mask=None):
+            df = expected if mask is None else expected[mask].reset_index(drop=True)
+            return df.astype(object).where(df.notna(), None)
+        
+        pd.testing.assert_frame_equal(stored(), legacy_rows(), check_exact=False, atol=1e-12)
+        lane = expected['lane'].dropna().iloc[0]
+        pd.testing.assert_frame_equal(stored({'lane': lane}), legacy_rows(expected['lane'] == lane), check_exact=False, atol=1e-12)
+        pd.testing.assert_frame_equal(stored({'month': 3}), legacy_rows(expected['booking_date'].str[5:7] == '03'), check_exact=False, atol=1e-12)
+        
+        # pol and pod share the port dictionary
+        ports = storage.read_frame("SELECT value FROM dimension_values WHERE dimension = 'port'")['value']
+        assert set(ports) == set(expected['pol'].dropna()) | set(expected['pod'].dropna())
+        _assert_rollup_matches(storage)
+        _assert_filter_options_match()
+        
+        # Running it again changes nothing
+        models.init_database()
+        pd.testing.assert_frame_equal(stored(), legacy_rows(), check_exact=False, atol=1e-12)
+        
+        # Only bookings deleted before the migration are stored again, after the migrated ids
+        deleted = (~_bookings_with_gaps(400)['booking_id'].isin(expected['booking_id'])).sum()
+        assert models.insert_scored_bookings(_bookings_with_gaps(400)) == deleted > 0
+        assert _count(storage, f"SELECT COUNT(*) FROM bookings_scored WHERE id <= {expected['id'].max()}") == len(expected)
+        assert _count(storage) == len(expected) + deleted
+        _assert_rollup_matches(storage)
+
+
+class _FakeConnection:
+    """DB-API connection stand-in whose rollback can be made to fail."""
+    
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+    
+    def rollback(self):
+        if self.broken:
+            raise sqlite3.OperationalError('disk I/O error')
+    
+    def close(self):
+        self.closed = True
+
+
+def test_connection_pool_failures():
+    """Broken connections free their slot, and waits for a full pool time out."""
+    import threading
+    from database.database.connection import ConnectionPool
+    
+    pool = ConnectionPool(_FakeConnection, 'fake', pool_size=1, timeout_s=0.2)
+    with pool.connection() as conn:
+        conn.broken = True
+    assert conn.closed and pool.stats()['open_connections'] == 0
+    with pool.connection() as replacement:
+        assert replacement is not conn
+        
+        # The only connection is borrowed
+        try:
+            with pool.connection():
+                assert False, "checkout from a full pool succeeded"
+        except TimeoutError:
+            pass
+    
+    # A caller waiting on a full pool gets a new connection when the borrowed one breaks
+    pool.timeout_s = 5
+    borrowed = pool._checkout()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool._checkout()))
+    waiter.start()
+    borrowed.broken = True
+    pool._checkin(borrowed, pool._generation)
+    waiter.join(timeout=5)
+    assert got and got[0] is not borrowed
+    pool._checkin(got[0], pool._generation)
+    
+    # close() closes idle connections now and borrowed ones when returned
+    with pool.connection() as conn:
+        pool.close()
+        assert not conn.closed
+    assert conn.closed and pool.stats()['open_connections'] == 0
+
+
+if __name__ == '__main__':
+    test_uploads_without_booking_ids_do_not_collide()
+    test_init_database_keeps_duplicate_bookings()
+    test_rollup_matches_row_store()
+    test_aggregate_matches_pandas()
+    test_columnar_store_mirrors_row_store()
+    test_filter_options_stay_in_sync()
+    test_init_database_encodes_legacy_text_columns()
+    test_analytics_cache_invalidated_on_write()
+    test_bulk_predict_stream()
+    test_bulk_job()
+    test_connection_pool_failures()
+    print("✓ Database behavior tests passed")
@@ -5,6 +5,7 @@
 Test script for predictions without running the web app.
 """
 from mlProject.components.model_service import ModelService
+import numpy as np
 import pandas as pd
 
 
@@ -114,16 +115,367 @@ def test_bulk_prediction():
                      'broken_prob', 'broken_risk']].to_string(index=False))
 
 
+def test_compiled_scorer():
+    """The NumPy-only scorer used for small batches agrees with sklearn."""
+    service = ModelService(use_compiled=False)
+    service.load_models()
+    scorer = service.compile_scorer()
+    assert scorer.validate(service, scorer.sample_records(500)) < 1e-6
+    # Nothing to compare when no record is supported by the compiled path
+    assert scorer.validate(service, [{'lane': 'TRANSPACIFIC'}]) is None
+    
+    booking = {
+        'lane': 'TRANSPACIFIC',
+        'pol': 'SHANGHAI',
+        'pod': 'LOS_ANGELES',
+        'container_state': 'FCL',
+        'bundle': 'STANDARD',
+        'booking_date': '2024-01-15'
+    }
+    expected = service.predict_all(pd.DataFrame([booking]))
+    service.compiled = scorer
+    results = service.predict_records([booking])
+    
+    assert results[0]['cancel']['risk_label'] == expected[0]['cancel']['risk_label']
+    assert abs(results[0]['cancel']['probability'] - expected[0]['cancel']['probability']) < 1e-6
+    assert abs(results[0]['broken_route']['probability'] - expected[0]['broken_route']['probability']) < 1e-6
+    
+    # Dates pandas would parse differently fall back to the sklearn path
+    assert service.predict_records([dict(booking, booking_date='01/15/2024')])[0]['cancel']['probability'] >= 0
+
+
+def test_prediction_batcher():
+    """Concurrent single predictions are coalesced and match direct scoring."""
+    from concurrent.futures import ThreadPoolExecutor
+    from services.batching import PredictionBatcher
+    
+    service = ModelService()
+    service.load_models()
+    batcher = PredictionBatcher(service, enabled=True, max_wait_ms=50, max_rows=8)
+    
+    bookings = [
+        {'lane': lane, 'pol': 'SHANGHAI', 'pod': 'LOS_ANGELES', 'container_state': 'FCL',
+         'bundle': 'STANDARD', 'booking_date': f'2024-01-{day:02d}'}
+        for lane in ('TRANSPACIFIC', 'INTRA_ASIA') for day in range(1, 17)
+    ]
+    with ThreadPoolExecutor(max_workers=len(bookings)) as pool:
+        results = list(pool.map(batcher.predict, bookings))
+    
+    for result, expected in zip(results, service.predict_records(bookings)):
+        for target in ('cancel', 'broken_route'):
+            assert result[target]['risk_label'] == expected[target]['risk_label']
+            assert abs(result[target]['probability'] - expected[target]['probability']) < 1e-9
+    
+    stats = batcher.stats()
+    assert stats['rows'] == len(bookings)
+    assert stats['batches'] < len(bookings)
+    assert max(int(size) for size in stats['batch_sizes']) <= 8
+
+
+def test_prediction_batcher_failures():
+    """Bad bookings and failed batches raise instead of hanging later requests."""
+    import threading
+    from services.batching import PredictionBatcher
+    
+    service = ModelService()
+    service.load_models()
+    batcher = PredictionBatcher(service, enabled=True, max_wait_ms=1, timeout_s=10)
+    booking = {'lane': 'TRANSPACIFIC', 'pol': 'SHANGHAI', 'pod': 'LOS_ANGELES', 'container_state': 'FCL',
+               'bundle': 'STANDARD', 'booking_date': '2024-01-15'}
+    
+    for record in (None, 3, ['TRANSPACIFIC']):
+        try:
+            batcher.predict(record)
+            assert False, f"{record!r} was accepted"
+        except ValueError:
+            pass
+    
+    # A batch failing outside scoring fails its requests, the worker keeps going
+    score = batcher._score
+    batcher._score = lambda batch: 1 / 0
+    try:
+        batcher.predict(booking)
+        assert False, "failed batch returned a result"
+    except ZeroDivisionError:
+        pass
+    batcher._score = score
+    assert batcher.predict(booking) == service.predict_records([booking])[0]
+    
+    # A dead worker thread is replaced
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    batcher._worker = dead
+    assert batcher.predict(booking) == service.predict_records([booking])[0]
+    assert batcher._worker.is_alive()
+
+
+def test_deduplicated_scoring():
+    """Repeated feature tuples are scored once and served from the cache afterwards."""
+    from mlProject.components.prediction_cache import PredictionCache
+    
+    service = ModelService(use_compiled=False, cache=PredictionCache(max_entries=100))
+    service.load_models()
+    
+    bookings = pd.DataFrame({
+        'lane': ['TRANSPACIFIC', 'INTRA_ASIA', None] * 100,
+        'pol': 'SHANGHAI',
+        'pod': 'LOS_ANGELES',
+        'container_state': 'FCL',
+        'bundle': 'STANDARD',
+        'booking_date': ['2024-01-15', '2024-01-15', '2024-02-20', None, '2024-03-01', '2024-03-01'] * 50
+    })
+    X = service.preprocess(bookings)
+    expected = service.cancel_model.predict_proba(X)[:, 1]
+    
+    scores = service.predict_frame(bookings)
+    assert service.last_timings['unique_rows'] == 6
+    assert service.last_timings['scored_rows'] == 6
+    assert np.allclose(scores['cancel_probability'], expected, rtol=0, atol=1e-12)
+    
+    scores = service.predict_frame(bookings)
+    assert service.last_timings['scored_rows'] == 0
+    assert np.allclose(scores['cancel_probability'], expected, rtol=0, atol=1e-12)
+    assert service.cache.stats()['hits'] == 6
+
+
+def test_score_table():
+    """Table lookups match the models; bookings outside the window fall back to them."""
+    from datetime import date
+    import tempfile
+    from mlProject.components.score_table import build_score_table
+    
+    service = ModelService(use_compiled=False, cache=None, use_score_table=False)
+    service.load_models()
+    
+    bookings = pd.DataFrame({
+        'lane': ['TRANSPACIFIC', 'INTRA_ASIA', None, 'ARCTIC'] * 3,
+        'pol': 'SHANGHAI',
+        'pod': ['LOS_ANGELES', 'ATLANTIS', 'TOKYO'] * 4,
+        'container_state': 'FCL',
+        'bundle': [None, 'STANDARD'] * 6,
+        'booking_date': ['2024-01-15', '2024-01-16', None, '2024-03-01'] * 3
+    })
+    expected = service.predict_frame(bookings)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        service.score_table = build_score_table(service, start=date(2024, 1, 15), days=2, directory=directory)
+        
+        cancel, broken, missing = service.score_table.lookup_frame(bookings)
+        assert missing.tolist() == [3, 7, 11]
+        scores = service.predict_frame(bookings)
+        records = bookings.iloc[:3].to_dict('records')
+        assert service.score_table.lookup_records(records) is not None
+        assert service.score_table.lookup_records(bookings.to_dict('records')) is None
+        by_record = service.predict_records(records)
+        service.score_table = None
+        
+        # Tables over the size cap are refused before anything is scored
+        try:
+            build_score_table(service, start=date(2024, 1, 15), days=2, directory=directory, max_cells=10)
+            assert False, "build_score_table ignored max_cells"
+        except ValueError:
+            pass
+    
+    for column in ('cancel_probability', 'broken_route_probability'):
+        assert np.allclose(scores[column], expected[column], rtol=0, atol=1e-6)
+    assert np.allclose([r['cancel']['probability'] for r in by_record], expected['cancel_probability'][:3], rtol=0, atol=1e-6)
+
+
+def test_sparse_encoding():
+    """Sparse and dense matrices round-trip on disk and score identically."""
+    import os
+    import tempfile
+    from scipy import sparse
+    from sklearn.linear_model import LogisticRegression
+    from fixtures import synthetic_bookings
+    from mlProject.constants import CATEGORICAL_FEATURES, NUMERICAL_FEATURES
+    from mlProject.components.data_transformation import build_preprocessor
+    from mlProject.utils.common import save_matrix, load_matrix
+    
+    service = ModelService(use_compiled=False, cache=None, use_score_table=False)
+    bookings = synthetic_bookings(500, cardinality=20)
+    X_raw = service.feature_frame(bookings)
+    encoders = {}
+    for sparse_output in (True, False):
+        encoders[sparse_output] = build_preprocessor(CATEGORICAL_FEATURES, NUMERICAL_FEATURES, sparse_output=sparse_output).fit(X_raw)
+    X_sparse = encoders[True].transform(X_raw)
+    X_dense = encoders[False].transform(X_raw)
+    assert sparse.issparse(X_sparse) and not sparse.issparse(X_dense)
+    assert np.array_equal(X_sparse.toarray(), X_dense)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'nested', 'X_train')
+        save_matrix(X_sparse, path)
+        loaded = load_matrix(path)
+        assert sparse.issparse(loaded) and loaded.format == 'csr'
+        assert (loaded != X_sparse).nnz == 0
+        
+        # Re-saving in the other format removes the stale file
+        save_matrix(X_dense, path)
+        assert not os.path.exists(f"{path}.npz")
+        assert np.array_equal(load_matrix(path), X_dense)
+        save_matrix(X_sparse, path)
+        assert not os.path.exists(f"{path}.npy")
+        assert sparse.issparse(load_matrix(path))
+        
+        try:
+            load_matrix(os.path.join(directory, 'missing'))
+            assert False, "load_matrix found a matrix that was never saved"
+        except FileNotFoundError:
+            pass
+    
+    rng = np.random.default_rng(0)
+    service.cancel_model = LogisticRegression(max_iter=200).fit(X_sparse, rng.integers(0, 2, len(bookings)))
+    service.broken_route_model = LogisticRegression(max_iter=200).fit(X_sparse, rng.integers(0, 2, len(bookings)))
+    service.loaded = True
+    
+    scores = {}
+    for sparse_output, encoder in encoders.items():
+        service.encoder = encoder
+        scores[sparse_output] = service.predict_frame(bookings)
+    for column in ('cancel_probability', 'broken_route_probability'):
+        assert np.allclose(scores[True][column], scores[False][column], rtol=0, atol=1e-12)
+    assert scores[True]['cancel_risk'].tolist() == scores[False]['cancel_risk'].tolist()
+
+
+def test_parallel_inference():
+    """Threaded scoring matches the serial path; concurrent calls keep their own timings."""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    serial = ModelService(use_compiled=False, cache=None, use_score_table=False)
+    parallel = ModelService(parallel_inference=True, use_compiled=False, cache=None, use_score_table=False)
+    parallel.PARALLEL_MIN_ROWS = 2
+    assert parallel._executor is not None and serial._executor is None
+    
+    bookings = pd.DataFrame({
+        'lane': ['TRANSPACIFIC', 'INTRA_ASIA', None] * 20,
+        'pol': 'SHANGHAI',
+        'pod': ['LOS_ANGELES', 'TOKYO'] * 30,
+        'container_state': 'FCL',
+        'bundle': 'STANDARD',
+        'booking_date': pd.date_range('2024-01-01', periods=60).astype(str)
+    })
+    expected = serial.predict_frame(bookings)
+    scores = parallel.predict_frame(bookings)
+    for column in ('cancel_probability', 'broken_route_probability'):
+        assert np.array_equal(scores[column], expected[column])
+    
+    # Each thread sees the timings of its own call, and no total update is lost
+    sizes = list(range(1, 41))
+    calls_before, rows_before = parallel.timing_totals['calls'], parallel.timing_totals['rows']
+    
+    # Pause after each record so the threads' calls interleave
+    record_timings = parallel._record_timings
+    parallel._record_timings = lambda *args, **kwargs: (record_timings(*args, **kwargs), time.sleep(0.005))
+    
+    def score(size):
+        parallel.predict_frame(bookings.iloc[:size])
+        return parallel.last_timings
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        timings = list(pool.map(score, sizes))
+    assert [t['rows'] for t in timings] == sizes
+    assert [t['unique_rows'] for t in timings] == sizes
+    assert parallel.timing_totals['calls'] - calls_before == len(sizes)
+    assert parallel.timing_totals['rows'] - rows_before == sum(sizes)
+
+
+def test_predict_batch_endpoint():
+    """/api/predict/batch scores every body shape the same, in input order, in every format."""
+    import io
+    import json
+    from flask import Flask
+    from backend import routes_api
+    
+    app = Flask(__name__)
+    app.register_blueprint(routes_api.api_bp, url_prefix='/api')
+    client = app.test_client()
+    
+    bookings = pd.DataFrame({
+        'lane': ['TRANSPACIFIC', 'INTRA_ASIA', None, 'ARCTIC', 'TRANSATLANTIC'],
+        'pol': ['SHANGHAI', 'SINGAPORE', 'SHANGHAI', None, 'ROTTERDAM'],
+        'pod': ['LOS_ANGELES', 'TOKYO', 'ATLANTIS', 'TOKYO', 'NEW_YORK'],
+        'container_state': 'FCL',
+        'bundle': ['STANDARD', None, 'STANDARD', 'PREMIUM', 'STANDARD'],
+        'booking_date': ['2024-01-15', '2024-02-16', None, '2024-03-01', 'not a date']
+    })
+    records = bookings.astype(object).where(bookings.notna(), None).to_dict('records')
+    expected = pd.DataFrame(routes_api.model_service.predict_frame(bookings))
+    
+    def assert_scores(scores):
+        assert sorted(scores) == sorted(expected.columns)
+        for column in ('cancel_probability', 'broken_route_probability'):
+            assert np.allclose(scores[column], expected[column], rtol=0, atol=1e-9)
+        for column in ('cancel_risk', 'broken_route_risk'):
+            assert list(scores[column]) == expected[column].astype(str).tolist()
+    
+    columnar = {column: [record[column] for record in records] for column in bookings.columns}
+    for body in (records, {'records': records}, columnar):
+        response = client.post('/api/predict/batch', json=body)
+        assert response.status_code == 200
+        assert_scores(response.get_json())
+    
+    response = client.post('/api/predict/batch?format=ndjson', json=records)
+    assert response.mimetype == 'application/x-ndjson'
+    assert_scores(pd.DataFrame([json.loads(line) for line in response.data.decode().splitlines()]))
+    
+    pa = routes_api._import_pyarrow()
+    if pa is not None:
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(bookings, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        response = client.post('/api/predict/batch', data=sink.getvalue().to_pybytes(),
+                               content_type=routes_api.ARROW_MIMETYPE, headers={'Accept': routes_api.ARROW_MIMETYPE})
+        assert response.mimetype == routes_api.ARROW_MIMETYPE
+        assert_scores(pa.ipc.open_stream(io.BytesIO(response.data)).read_all().to_pandas())
+    
+    # Malformed and oversized bodies are refused before scoring
+    for body in ([], {}, {'records': []}, 'lane', [1, 2], {'lane': ['A', 'B'], 'pol': ['C']}):
+        response = client.post('/api/predict/batch', json=body)
+        assert response.status_code == 400, body
+    assert 'same length' in client.post('/api/predict/batch', json={'lane': ['A'], 'pol': []}).get_json()['error']
+    assert client.post('/api/predict/batch?format=xml', json=records).status_code == 400
+    
+    limit = routes_api.PREDICT_BATCH_MAX_BOOKINGS
+    routes_api.PREDICT_BATCH_MAX_BOOKINGS = 3
+    try:
+        assert client.post('/api/predict/batch', json=records).status_code == 413
+        assert client.post('/api/predict/batch', json={'lane': ['A'] * 4}).status_code == 413
+    finally:
+        routes_api.PREDICT_BATCH_MAX_BOOKINGS = limit
+    
+    # Without pyarrow, Arrow is refused up front instead of failing after scoring
+    import_pyarrow = routes_api._import_pyarrow
+    routes_api._import_pyarrow = lambda: None
+    try:
+        assert client.post('/api/predict/batch?format=arrow', json=records).status_code == 406
+        assert client.post('/api/predict/batch', data=b'', content_type=routes_api.ARROW_MIMETYPE).status_code == 415
+        assert client.post('/api/predict/batch?format=ndjson', json=records).status_code == 200
+    finally:
+        routes_api._import_pyarrow = import_pyarrow
+
+
 def main():
     """Run all tests."""
     try:
         test_single_prediction()
         test_bulk_prediction()
+        test_compiled_scorer()
+        test_prediction_batcher()
+        test_prediction_batcher_failures()
+        test_deduplicated_scoring()
+        test_score_table()
+        test_sparse_encoding()
+        test_parallel_inference()
+        test_predict_batch_endpoint()
         
         print("\n" + "="*60)
         print("✓ All tests completed successfully!")
         print("="*60)
-        
+    
     except FileNotFoundError:
         print("\n❌ Error: Models not found!")
         print("Please train the models first by running:")
@@ -0,0 +1,114 @@
+# ============================================================================
+# FILE: test_query_plan.py
+# ============================================================================
+"""
+Query plan regression test: no dashboard filter combination may make
+SQLite scan the whole bookings_scored (or bookings_rollup) table, nor
+PostgreSQL when DATABASE_URL is set (see test_database.ENGINES).
+"""
+from itertools import combinations
+import fixtures
+from database.database import models
+from test_database import ENGINES, temp_database
+
+# One value per dashboard filter (see _get_filters_from_request)
+FILTER_VALUES = {
+    'start_date': '2024-03-01',
+    'end_date': '2024-09-30',
+    'lane': 'LANE_1',
+    'pol': 'PORT_1',
+    'pod': 'PORT_2',
+    'month': 6,
+    'year': 2024,
+}
+
+# Aggregations issued by the SQL-backed dashboard widgets
+WIDGET_AGGREGATES = {
+    'bookings_over_time': {
+        'group_by': ['booking_day'],
+        'metrics': {'id': ('count', 'id'), 'cancel_probability': ('avg', 'cancel_probability')},
+    },
+    'by_lane': {
+        'group_by': ['lane'],
+        'metrics': {'cancel_probability': ('avg', 'cancel_probability'), 'id': ('count', 'id')},
+    },
+    'by_port': {
+        'group_by': ['pol'],
+        'metrics': {'cancel_probability': ('avg', 'cancel_probability'), 'id': ('count', 'id')},
+    },
+    'risk_distribution': {
+        'group_by': ['cancel_risk'],
+        'metrics': {'count': ('count', '*')},
+    },
+}
+
+
+def _filter_combinations():
+    """Every non-empty combination of dashboard filters."""
+    for size in range(1, len(FILTER_VALUES) + 1):
+        for keys in combinations(FILTER_VALUES, size):
+            yield {key: FILTER_VALUES[key] for key in keys}
+
+
+def _full_scans(storage, conn, query, params):
+    """Plan steps that read every row of bookings_scored or bookings_rollup."""
+    if storage.name == 'sqlite':
+        plan = storage.execute(conn, 'EXPLAIN QUERY PLAN ' + query, params).fetchall()
+        return [row[3] for row in plan if row[3].startswith(('SCAN bookings_scored', 'SCAN bookings_rollup'))]
+    
+    # PostgreSQL picks sequential scans for small tables; with them disabled
+    # only the ones no index can replace are left
+    plan = storage.execute(conn, 'EXPLAIN ' + query, params).fetchall()
+    return [row[0].strip() for row in plan if 'Seq Scan on bookings_scored' in row[0] or 'Seq Scan on bookings_rollup' in row[0]]
+
+
+def _assert_no_full_scans(build_query):
+    failures = []
+    for engine in ENGINES:
+        with temp_database(engine) as storage:
+            models.insert_scored_bookings(fixtures.scored_bookings(2000))
+            with storage.connection() as conn:
+                storage.execute(conn, 'ANALYZE')
+                if storage.name != 'sqlite':
+                    storage.execute(conn, 'SET LOCAL enable_seqscan = off')
+                for filters in _filter_combinations():
+                    for label, (query, params) in build_query(filters):
+                        scans = _full_scans(storage, conn, query, params)
+                        if scans:
+                            failures.append(f"{engine} {label} {filters}: {scans}")
+    
+    assert not failures, "Full table scans:\n" + "\n".join(failures)
+
+
+def test_filtered_queries_use_indexes():
+    """query_scored_bookings never scans the table when a filter is set."""
+    _assert_no_full_scans(lambda filters: [('query_scored_bookings', models.scored_bookings_query(filters))])
+
+
+def test_widget_aggregates_use_indexes():
+    """The SQL widget aggregations never scan the table when a filter is set."""
+    def build_query(filters):
+        for name, aggregate in WIDGET_AGGREGATES.items():
+            yield name, models.scored_bookings_aggregate_query(filters, **aggregate)
+    
+    _assert_no_full_scans(build_query)
+
+
+def test_rollup_aggregates_use_indexes():
+    """The same aggregations over bookings_rollup never scan it when a filter is set."""
+    rollup_metrics = {'id': 'bookings', 'cancel_probability': 'cancel_probability'}
+    
+    def build_query(filters):
+        for name, aggregate in WIDGET_AGGREGATES.items():
+            if name != 'risk_distribution':
+                yield name, models.rollup_aggregate_query(filters, aggregate['group_by'], rollup_metrics)
+        yield 'summary', models.rollup_aggregate_query(filters)
+    
+    _assert_no_full_scans(build_query)
+
+
+if __name__ == '__main__':
+    test_filtered_queries_use_indexes()
+    test_widget_aggregates_use_indexes()
+    test_rollup_aggregates_use_indexes()
+    print("✓ No dashboard filter combination scans bookings_scored or bookings_rollup")